@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+"""Benchmark what the per-page logs cost the event loop, before and after queued logging.
+
+"before" is the old setup: logging.basicConfig writing straight to the stream, and one INFO
+line per page whose window description is built eagerly. "queued" keeps those lines but sends
+them through main.py's QueueHandler and listener thread. "after" adds the sampled per-page
+lines and the lazy description. Only the time spent in the logging thread is measured. Run
+from the repository root:
+
+    python -m benchmarks.bench_logging --pages 20000 --write-delay-us 50
+
+--write-delay-us makes every write sleep that long, like a busy terminal or a full pipe.
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from typing import TextIO, cast
+
+from spotify.async_db import AsyncDB
+from spotify.auth import Auth
+from spotify.client import Client
+from spotify.logs import Lazy, queued_logging
+
+
+class SlowStream:
+    """File wrapper whose writes take at least delay seconds."""
+
+    def __init__(self, stream: TextIO, delay: float) -> None:
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def before(client: Client, url: str) -> None:
+    client.logger.info(
+        "Fetching liked tracks batch: url=%s human_readable=%s timeout=%ss",
+        url,
+        client.describe_paging_window(url),
+        client.TIMEOUT,
+    )
+
+
+def after(client: Client, url: str) -> None:
+    client.page_log.log(
+        "liked_tracks",
+        logging.INFO,
+        "Fetching liked tracks batch: url=%s human_readable=%s timeout=%ss",
+        url,
+        Lazy(client.describe_paging_window, url),
+        client.TIMEOUT,
+    )
+
+
+def time_pages(pages: int, log_page: Callable[[Client, str], None]) -> list[float]:
+    """Microseconds the calling thread spends logging each page."""
+    client = Client(cast(Auth, None), cast(AsyncDB, None))
+    samples = []
+    for page in range(pages):
+        url = client.liked_tracks_url(page * client.ME_BATCH_SIZE)
+        start = time.perf_counter()
+        log_page(client, url)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    cuts = statistics.quantiles(samples, n=100)
+    print(
+        f"{label:<8} total={sum(samples) / 1000:9.2f}ms  mean={statistics.fmean(samples):7.2f}us  "
+        f"p99={cuts[98]:8.2f}us  max={max(samples):8.2f}us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20_000)
+    parser.add_argument("--write-delay-us", type=float, default=0.0)
+    args = parser.parse_args()
+    delay = args.write_delay_us / 1e6
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+
+    with tempfile.TemporaryFile("w+") as sink:
+        handler = logging.StreamHandler(cast(TextIO, SlowStream(sink, delay)))
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        try:
+            report("before", time_pages(args.pages, before))
+        finally:
+            root.removeHandler(handler)
+
+        # The queue alone, still one eager line per page, then the full change.
+        for label, log_page in (("queued", before), ("after", after)):
+            with queued_logging(stream=cast(TextIO, SlowStream(sink, delay))):
+                samples = time_pages(args.pages, log_page)
+            report(label, samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#! /usr/bin/env python
+"""Benchmark the MongoDB connection settings against a live server.
+
+Needs the same environment as the app (MONGO_INITDB_* and optionally MONGO_SETTINGS, which
+every scenario starts from). The synthetic library lives in the tracks_bench/meta_bench
+collections and is dropped afterwards. Run from the repository root:
+
+    python -m benchmarks.bench_mongo --tracks 20000
+
+Compression and read preference only pay off across a network or on a replica set; on a
+local standalone server expect them to cost a little CPU and change nothing else.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from spotify.async_db import AsyncDB
+from spotify.schema import Artist, ItemV2, MongoSettings, Track
+
+BENCH_USER = "bench"
+# Spotify lists ~180 markets per track; they make up most of a cached document.
+MARKETS = [f"M{i:03d}" for i in range(180)]
+UNREACHABLE_HOST = "127.0.0.1:1"
+
+
+def build_tracks(count: int) -> list[ItemV2]:
+    return [
+        Track.model_construct(
+            uri=f"spotify:track:{i}",
+            id=str(i),
+            name=f"Track {i}",
+            href=f"https://api.spotify.com/v1/tracks/{i}",
+            duration_ms=180_000 + i % 60_000,
+            popularity=i % 101,
+            explicit=False,
+            available_markets=MARKETS,
+            artists=[
+                Artist.model_construct(
+                    artist_id=f"artist{i % 500}",
+                    name=f"Artist {i % 500}",
+                    type="artist",
+                    uri=f"spotify:artist:{i % 500}",
+                    href=f"https://api.spotify.com/v1/artists/{i % 500}",
+                )
+            ],
+        )
+        for i in range(count)
+    ]
+
+
+async def time_ms(repeats: int, func: Callable[[], Awaitable[object]]) -> list[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    print(f"{label:<36} median={statistics.median(samples):9.2f}ms  min={min(samples):9.2f}ms")
+
+
+async def with_db(
+    settings: MongoSettings, func: Callable[[AsyncDB], Awaitable[list[float]]]
+) -> list[float]:
+    mongo_client = AsyncDB.create_client(settings)
+    try:
+        my_mongo = AsyncDB(BENCH_USER, mongo_client)
+        my_mongo.mongo_settings = settings
+        return await func(my_mongo)
+    finally:
+        await mongo_client.close()
+
+
+async def bench_pool(base: MongoSettings, repeats: int, requests: int) -> None:
+    """maxPoolSize caps how many of a burst of concurrent reads run at once."""
+    for size in (1, 10, 100):
+        settings = base.model_copy(update={"max_pool_size": size, "min_pool_size": None})
+
+        async def burst(my_mongo: AsyncDB) -> list[float]:
+            coll = my_mongo.get_tracks_coll()
+            return await time_ms(
+                repeats,
+                lambda: asyncio.gather(
+                    *(coll.find_one({"uri": f"spotify:track:{i}"}) for i in range(requests))
+                ),
+            )
+
+        report(f"max_pool_size={size} ({requests} reads)", await with_db(settings, burst))
+
+
+async def bench_min_pool(base: MongoSettings, requests: int) -> None:
+    """minPoolSize opens connections in the background, sparing the first burst the handshakes."""
+    for size in (0, 10):
+        settings = base.model_copy(update={"min_pool_size": size, "max_pool_size": None})
+
+        async def first_burst(my_mongo: AsyncDB) -> list[float]:
+            coll = my_mongo.get_tracks_coll()
+            await my_mongo.mongo_client.server_info()
+            # Give the background pool filler time to open the minimum
+            await asyncio.sleep(1)
+            return await time_ms(
+                1, lambda: asyncio.gather(*(coll.find_one({}) for _ in range(requests)))
+            )
+
+        report(f"min_pool_size={size} (first burst)", await with_db(settings, first_burst))
+
+
+async def bench_compressors(base: MongoSettings, repeats: int) -> None:
+    """Wire compression trades CPU for bytes on full scans such as exports."""
+    for compressors in ([], ["zlib"], ["snappy"], ["zstd"]):
+        settings = base.model_copy(update={"compressors": compressors})
+
+        async def scan(my_mongo: AsyncDB) -> list[float]:
+            return await time_ms(repeats, lambda: my_mongo.get_export_coll().find({}).to_list())
+
+        report(
+            f"compressors={','.join(compressors) or 'none'} (scan)", await with_db(settings, scan)
+        )
+
+
+async def bench_write_concern(base: MongoSettings, tracks: list[ItemV2], repeats: int) -> None:
+    """Stronger sync write concerns wait for more servers or the journal per batch."""
+    for write_concern, journal in ((1, None), (1, True), ("majority", None)):
+        settings = base.model_copy(
+            update={"sync_write_concern": write_concern, "sync_journal": journal}
+        )
+
+        async def sync(my_mongo: AsyncDB) -> list[float]:
+            return await time_ms(repeats, lambda: my_mongo.sync_tracks(tracks))
+
+        report(f"sync_write_concern={write_concern} j={journal}", await with_db(settings, sync))
+
+
+async def bench_read_preference(base: MongoSettings, repeats: int) -> None:
+    """Exports can be served by a secondary, off the primary that selections use."""
+    for mode in ("primary", "secondaryPreferred", "nearest"):
+        settings = base.model_copy(update={"read_preference": mode})
+
+        async def scan(my_mongo: AsyncDB) -> list[float]:
+            return await time_ms(repeats, lambda: my_mongo.get_export_coll().find({}).to_list())
+
+        report(f"read_preference={mode} (scan)", await with_db(settings, scan))
+
+
+async def bench_timeouts(base: MongoSettings) -> None:
+    """serverSelectionTimeoutMS bounds how long a run hangs when MongoDB is down."""
+    for timeout_ms in (200, 2000):
+        settings = base.model_copy(
+            update={
+                "uri": None,
+                "hosts": [UNREACHABLE_HOST],
+                "replica_set": None,
+                "server_selection_timeout_ms": timeout_ms,
+                "connect_timeout_ms": timeout_ms,
+            }
+        )
+
+        async def fail(my_mongo: AsyncDB) -> list[float]:
+            start = time.perf_counter()
+            try:
+                await my_mongo.mongo_client.server_info()
+            except ServerSelectionTimeoutError:
+                pass
+            return [(time.perf_counter() - start) * 1000]
+
+        report(f"server_selection_timeout_ms={timeout_ms} (down)", await with_db(settings, fail))
+
+
+async def run(args: argparse.Namespace) -> None:
+    base = AsyncDB.load_mongo_settings()
+    tracks = build_tracks(args.tracks)
+    mongo_client = AsyncDB.create_client(base)
+    my_mongo = AsyncDB(BENCH_USER, mongo_client)
+    try:
+        await my_mongo.sync_tracks(tracks)
+        await bench_pool(base, args.repeats, args.requests)
+        await bench_min_pool(base, args.requests)
+        await bench_compressors(base, args.repeats)
+        await bench_write_concern(base, tracks, args.repeats)
+        await bench_read_preference(base, args.repeats)
+        await bench_timeouts(base)
+    finally:
+        await my_mongo.get_tracks_coll().drop()
+        await my_mongo.get_meta_coll().drop()
+        await mongo_client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
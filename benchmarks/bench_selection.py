@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+"""Benchmark the in-process selection engines on synthetic libraries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_selection --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections.abc import Callable
+from functools import partial
+
+import numpy as np
+
+from spotify.db import BaseDB
+from spotify.picking import diversify, select_by_duration
+from spotify.schema import SelectionWeights
+from spotify.selection import TrackSnapshot, WeightedSelector
+
+NEVER_PLAYED_RATIO = 0.3
+ONE_YEAR_SECONDS = 365 * 86_400
+
+
+def build_snapshot(size: int, seed: int) -> TrackSnapshot:
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    played_at = now - rng.random(size) * ONE_YEAR_SECONDS
+    played_at[rng.random(size) < NEVER_PLAYED_RATIO] = -np.inf
+    return TrackSnapshot(
+        uris=[f"spotify:track:{i}" for i in range(size)],
+        played_at=played_at,
+        popularity=rng.integers(0, 101, size).astype(np.float32),
+        artist_codes=rng.integers(0, max(size // 10, 1), size),
+        artist_ids=[],
+    )
+
+
+def build_window(items: int, seed: int) -> list[tuple[str, str]]:
+    """LRP candidate window with a Zipf-like artist skew, as generate_diverse_tracks reads."""
+    rng = random.Random(seed)
+    window_size = max(items * BaseDB.RATIO_WINDOW, BaseDB.MAX_SIZE_WINDOW)
+    artists = [f"artist{i}" for i in range(window_size // 4)]
+    weights = [1 / (rank + 1) for rank in range(len(artists))]
+    picks = rng.choices(artists, weights=weights, k=window_size)
+    return [(f"spotify:track:{i}", artist) for i, artist in enumerate(picks)]
+
+
+def build_duration_window(size: int, target_ms: int, seed: int) -> list[tuple[str, int]]:
+    """LRP window AsyncDB.generate_duration_tracks would read from a library of the given size."""
+    rng = random.Random(seed)
+    estimated_items = -(-target_ms // BaseDB.TYPICAL_TRACK_MS)
+    window_size = min(size, max(estimated_items * BaseDB.RATIO_WINDOW, BaseDB.MAX_SIZE_WINDOW))
+    return [
+        (f"spotify:track:{i}", max(int(rng.gauss(215_000, 60_000)), 30_000))
+        for i in range(window_size)
+    ]
+
+
+def time_ms(repeats: int, func: Callable[[], object]) -> list[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, size: int, samples: list[float]) -> None:
+    print(
+        f"{label:<12} {size:>10,d} tracks  "
+        f"median={statistics.median(samples):8.2f}ms  min={min(samples):8.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        snapshot = build_snapshot(size, args.seed)
+        selector = WeightedSelector(snapshot, SelectionWeights(), seed=args.seed)
+        # Warm-up so first-call allocations do not skew the median
+        selector.select(args.items)
+        report("weighted", size, time_ms(args.repeats, partial(selector.select, args.items)))
+
+    # The diverse mode reads the same LRP window from Mongo as the plain window mode, so the
+    # only extra latency is the in-memory cap/spacing pass measured here against a plain cut.
+    window = build_window(args.items, args.seed)
+    rng = random.Random(args.seed)
+    plain = partial(rng.sample, window, args.items)
+    diverse = partial(
+        diversify, window, args.items, BaseDB.MAX_TRACKS_PER_ARTIST, BaseDB.ARTIST_SPACING, rng
+    )
+    report("plain", len(window), time_ms(args.repeats, plain))
+    report("diverse", len(window), time_ms(args.repeats, diverse))
+
+    # Duration targets: the window grows with the target but is capped by the library size.
+    for size in args.sizes:
+        for hours in (1, 3, 5):
+            target_ms = hours * 60 * 60 * 1000
+            candidates = build_duration_window(size, target_ms, args.seed)
+            durations = dict(candidates)
+            select = partial(
+                select_by_duration,
+                candidates,
+                target_ms,
+                BaseDB.DURATION_TOLERANCE_MS,
+                BaseDB.MAX_PLAYLIST_ITEMS,
+                rng,
+            )
+            samples = time_ms(args.repeats, select)
+            error_s = (sum(durations[uri] for uri in select()) - target_ms) / 1000
+            report(f"duration {hours}h", size, samples)
+            print(f"{'':<12} {'':>10} window={len(candidates)} last error={error_s:+.0f}s")
+
+
+if __name__ == "__main__":
+    main()
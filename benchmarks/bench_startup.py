@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+"""Benchmark how long main.py takes to start on paths that never touch Spotify or MongoDB.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --repeats 10 --max-ms 400
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Each case is a fresh interpreter, so nothing is cached between samples.
+CASES = {
+    "help": [str(ROOT / "main.py"), "--help"],
+    "bad flag": [str(ROOT / "main.py"), "--export-batch-size", "0"],
+    "import spotify": ["-c", "import spotify"],
+    # What main.run imports before --export, --import or --stats touch MongoDB.
+    "export/import": [
+        "-c",
+        "import spotify.client, spotify.export, spotify.memory, spotify.runner",
+    ],
+}
+# Modules a case must never load; only the weighted selection engine needs numpy.
+DEFERRED = {"export/import": ("numpy",)}
+# -X importtime lines: "import time: <self us> | <cumulative us> | <module>"
+IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s(\s*)(\S+)")
+HEAVY_MODULES = ("numpy", "pydantic", "pymongo", "httpx")
+
+
+def run_case(argv: list[str]) -> tuple[float, dict[str, int], set[str]]:
+    """Wall time in ms, cumulative import time in us per top-level import, and every module."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        check=False,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    imports: dict[str, int] = {}
+    modules: set[str] = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        modules.add(match.group(3))
+        if not match.group(2):
+            imports[match.group(3)] = int(match.group(1))
+    return wall_ms, imports, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--top", type=int, default=5, help="Slowest top-level imports to list")
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Exit with an error when a case's median wall time is above this",
+    )
+    args = parser.parse_args()
+
+    slow: list[str] = []
+    failures: list[str] = []
+    for label, argv in CASES.items():
+        runs = [run_case(argv) for _ in range(args.repeats)]
+        median_ms = statistics.median(wall_ms for wall_ms, _, _ in runs)
+        _, imports, modules = runs[-1]
+        print(
+            f"{label:<16} median={median_ms:8.2f}ms  min={min(ms for ms, _, _ in runs):8.2f}ms  "
+            f"imports={sum(imports.values()) / 1000:8.2f}ms"
+        )
+        for module, cumulative in sorted(imports.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"{'':<16} {module:<32} {cumulative / 1000:8.2f}ms")
+        heavy = {module.split(".")[0] for module in modules} & set(HEAVY_MODULES)
+        if heavy:
+            print(f"{'':<16} loaded eagerly: {', '.join(sorted(heavy))}")
+        unexpected = heavy & set(DEFERRED.get(label, ()))
+        if unexpected:
+            failures.append(f"{label} loaded {', '.join(sorted(unexpected))}")
+        if args.max_ms is not None and median_ms > args.max_ms:
+            slow.append(f"{label} ({median_ms:.0f}ms)")
+
+    if slow:
+        failures.append(f"startup above {args.max_ms:.0f}ms: {', '.join(slow)}")
+    if failures:
+        sys.exit("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
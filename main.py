@@ -3,42 +3,234 @@ import argparse
 import asyncio
 import logging
 import sys
+import time
+from datetime import UTC, datetime
+from functools import partial
+from os import environ
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
 
-from spotify import DB, Auth, Client
+from spotify.helpers import parse_duration, parse_size
+from spotify.logs import queued_logging
+from spotify.options import EXPORT_BATCH_SIZE
+from spotify.phases import PhaseGraph
 
+# pydantic, pymongo, httpx and numpy take most of a second to import. They load once a run
+# starts, so --help and argument errors return right away; benchmarks/bench_startup.py
+# tracks it.
+if TYPE_CHECKING:
+    from spotify import AsyncDB
+    from spotify.memory import MemoryMonitor
+    from spotify.schema import PlaylistTarget, UsersConfig
 
-async def run(args: argparse.Namespace, logger: logging.Logger) -> None:
-    my_mongo = DB()
-    if not my_mongo.check_connection():
+
+def load_playlist_targets(args: argparse.Namespace) -> list[PlaylistTarget]:
+    """Read the playlists config, or fall back to SPOTIFY_PLAYLIST_ID and the CLI flags."""
+    from spotify.schema import PlaylistsConfig, PlaylistTarget  # noqa: PLC0415
+
+    config_path = args.playlists or environ.get("SPOTIFY_PLAYLISTS_CONFIG")
+    if config_path:
+        return PlaylistsConfig.model_validate_json(Path(config_path).read_bytes()).playlists
+    return [
+        PlaylistTarget(
+            name="default",
+            playlist_id=environ["SPOTIFY_PLAYLIST_ID"],
+            selection=args.selection,
+            duration=args.duration,
+            queue=True,
+        )
+    ]
+
+
+async def check_mongo(my_mongo: AsyncDB) -> None:
+    if not await my_mongo.check_connection():
         raise ConnectionError("MongoDB is not available")
 
+
+async def show_stats(my_mongo: AsyncDB) -> None:
+    from spotify.history import STATS_RUNS, stats_report  # noqa: PLC0415
+
+    await check_mongo(my_mongo)
+    runs = await my_mongo.load_runs(STATS_RUNS)
+    await my_mongo.close()
+    print("\n".join(stats_report(runs)))
+
+
+async def show_user_stats(users_config: UsersConfig) -> None:
+    """--stats for every account of a --users config, one report after the other."""
+    from spotify import AsyncDB  # noqa: PLC0415
+    from spotify.history import STATS_RUNS, stats_report  # noqa: PLC0415
+
+    mongo_client = AsyncDB.create_client()
+    try:
+        for user in users_config.users:
+            my_mongo = AsyncDB(user.user_id, mongo_client)
+            await check_mongo(my_mongo)
+            runs = await my_mongo.load_runs(STATS_RUNS)
+            print("\n".join([f"user {user.user_id}", *stats_report(runs), ""]))
+    finally:
+        await mongo_client.close()
+
+
+async def run_users(args: argparse.Namespace, config_path: Path) -> None:
+    """Refresh every account of a --users config, or report their --stats."""
+    from spotify.scheduler import Scheduler  # noqa: PLC0415
+    from spotify.schema import UsersConfig  # noqa: PLC0415
+
+    users_config = UsersConfig.model_validate_json(config_path.read_bytes())
+    if args.stats:
+        await show_user_stats(users_config)
+        return
+    scheduler = Scheduler(users_config, args.update_cache, args.precompute, args.seed)
+    reports = await scheduler.run()
+    failed = [report["user_id"] for report in reports if report["error"] is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(reports)} users failed: {', '.join(failed)}")
+
+
+async def run(
+    args: argparse.Namespace, logger: logging.Logger, monitor: MemoryMonitor | None = None
+) -> None:
+    from spotify import AsyncDB, Auth, Client  # noqa: PLC0415
+    from spotify.memory import fit_batch_size  # noqa: PLC0415
+    from spotify.runner import (  # noqa: PLC0415
+        PlaylistRefresh,
+        record_run,
+        run_summary,
+        sync_library,
+    )
+
+    users_config_path = args.users or environ.get("SPOTIFY_USERS_CONFIG")
+    if users_config_path:
+        await run_users(args, Path(users_config_path))
+        return
+
+    my_mongo = AsyncDB()
+    if args.stats:
+        await show_stats(my_mongo)
+        return
+    if args.import_path:
+        # A restore talks to MongoDB only; no Spotify login or API traffic.
+        await check_mongo(my_mongo)
+        await my_mongo.import_tracks(args.import_path, args.export_batch_size)
+        await my_mongo.close()
+        return
+
     sp_auth = Auth()
-    await sp_auth.load_or_authenticate_tokens()
-    sp_client = Client(sp_auth, my_mongo)
+    sp_client = Client(sp_auth, my_mongo, memory_budget=args.memory_budget)
 
-    if args.update_cache or my_mongo.count_track({}) == 0:
-        logger.info("Populating local cache of liked tracks")
-        await sp_client.get_all_liked_tracks()
+    # MongoDB and the Spotify login are independent; everything after waits only for what it
+    # reads, e.g. the playlists are cleared while MongoDB selects the new tracks.
+    graph = PhaseGraph(monitor)
+    graph.add("mongo", partial(check_mongo, my_mongo))
+    graph.add("tokens", sp_auth.load_or_authenticate_tokens)
+    # Warm-up: the token load (and refresh, the only accounts.spotify.com round trip) runs
+    # while MongoDB is checked and the api.spotify.com connections open.
+    graph.add("connections", sp_client.warm_up)
+    graph.add(
+        "sync",
+        partial(sync_library, my_mongo, sp_client, args.update_cache),
+        after=("mongo", "tokens", "connections"),
+    )
+    if args.export:
+        graph.add(
+            "export",
+            partial(
+                my_mongo.export_tracks,
+                args.export_format,
+                args.export_compression,
+                args.export_batch_size
+                if args.memory_budget is None
+                else fit_batch_size(args.export_batch_size, args.memory_budget),
+                args.incremental,
+                args.export_full,
+            ),
+            after=("sync",),
+        )
     else:
-        logger.info("Skipping cache update; using existing liked tracks from DB")
+        refresh = PlaylistRefresh(
+            my_mongo, sp_client, load_playlist_targets(args), args.seed, args.precompute
+        )
+        refresh.add_phases(
+            graph,
+            db_ready=("mongo",),
+            spotify_ready=("tokens", "connections"),
+            library_ready=("sync",),
+        )
 
-    if args.export:
-        my_mongo.export_to_json()
-        my_mongo.close()
+    started_at = datetime.now(UTC)
+    started = time.perf_counter()
+    error: Exception | None = None
+    try:
+        async with sp_client:
+            await graph.run()
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Without MongoDB there is nowhere to record the run.
+        if "mongo" in graph.timings:
+            mode = "export" if args.export else "refresh"
+            await record_run(
+                my_mongo, run_summary(mode, started_at, graph.timings, sp_client, error)
+            )
+        await my_mongo.close()
+    if sp_client.first_request_at is not None:
+        logger.info(
+            "First Spotify API request sent %.2fs after startup",
+            sp_client.first_request_at - started,
+        )
+
+
+async def instrumented_run(args: argparse.Namespace, logger: logging.Logger) -> None:
+    """Run under --profile, --trace and/or --memory."""
+    monitor = None
+    if args.memory:
+        from spotify.memory import MemoryMonitor  # noqa: PLC0415
+
+        monitor = MemoryMonitor()
+    main_run = run(args, logger, monitor)
+    if monitor is not None:
+        main_run = monitor.run(main_run)
+    if args.profile is not None:
+        from spotify.profiling import RunProfiler  # noqa: PLC0415
+
+        main_run = RunProfiler(args.profile).run(main_run)
+    if args.trace is None:
+        await main_run
         return
+    from spotify.tracing import Tracer, span  # noqa: PLC0415
+
+    with Tracer(args.trace), span("run"):
+        await main_run
+
 
-    await sp_client.delete_all_playlist_tracks()
-    latest_uris = my_mongo.generate_random_playlist(100)
-    await sp_client.populate_playlist_with_uris(latest_uris)
-    await sp_client.update_queue(latest_uris)
-    my_mongo.close()
+def validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Reject flag combinations argparse cannot express."""
+    if args.incremental and not args.export:
+        parser.error("--incremental only applies to --export")
+    if args.export_full and not args.export:
+        parser.error("--export-full only applies to --export")
+    if args.export_full and args.export_format in ("arrow", "parquet"):
+        parser.error("--export-full writes json or ndjson only")
+    if args.import_path and (args.export or args.update_cache):
+        parser.error("--import cannot be combined with --export or --update-cache")
+    if args.import_path and (args.users or environ.get("SPOTIFY_USERS_CONFIG")):
+        parser.error("--import works on a single account; it cannot be combined with --users")
+    if args.export_batch_size < 1:
+        parser.error("--export-batch-size must be at least 1")
+    if args.memory_budget is not None and args.memory_budget < 1:
+        parser.error("--memory-budget must be above 0")
+    if args.stats and (args.export or args.import_path or args.update_cache):
+        parser.error("--stats cannot be combined with --export, --import or --update-cache")
+    if args.export and (args.users or environ.get("SPOTIFY_USERS_CONFIG")):
+        parser.error("--export works on a single account; it cannot be combined with --users")
 
 
 def main() -> None:
     load_dotenv()
-    logging.basicConfig(level=logging.INFO)
     logging.getLogger("urllib3").setLevel(logging.INFO)
     logging.getLogger("pymongo").setLevel(logging.INFO)
     logging.getLogger("httpcore").setLevel(logging.INFO)
@@ -54,8 +246,30 @@ def main() -> None:
         "  ./main.py\n\n"
         "  # Update local cache from Spotify before generating\n"
         "  ./main.py --update-cache\n\n"
+        "  # Generate about three hours of music\n"
+        "  ./main.py --duration 3h\n\n"
+        "  # Refresh every playlist listed in a config file\n"
+        "  ./main.py --playlists playlists.json\n\n"
+        "  # Refresh the playlists of several accounts\n"
+        "  ./main.py --users users.json\n\n"
         "  # Export liked tracks to a JSON file\n"
-        "  ./main.py --export\n\n",
+        "  ./main.py --export\n\n"
+        "  # Export liked tracks as gzip-compressed NDJSON\n"
+        "  ./main.py --export --export-format ndjson --export-compression gzip\n\n"
+        "  # Export only what changed since the last export\n"
+        "  ./main.py --export --incremental --export-format ndjson\n\n"
+        "  # Back up whole track documents, then restore them into an empty cache\n"
+        "  ./main.py --export --export-full --export-format ndjson --export-compression gzip\n"
+        "  ./main.py --import export-2026-01-31.ndjson.gz\n\n"
+        "  # Find out whether a slow run waits on the network or burns CPU\n"
+        "  ./main.py --update-cache --profile\n\n"
+        "  # Sync a large library within 512 MiB and see which phase holds the memory\n"
+        "  ./main.py --update-cache --memory-budget 512M --memory\n\n"
+        "  # Percentiles and regressions over the recorded runs\n"
+        "  ./main.py --stats\n\n"
+        "  # Trace a run, then print it as a waterfall\n"
+        "  ./main.py --trace run.json\n"
+        "  python -m spotify.tracing run.json\n\n",
     )
     parser.add_argument(
         "--update-cache",
@@ -67,19 +281,150 @@ def main() -> None:
         "--export",
         action="store_true",
         default=False,
-        help="Export liked tracks to a JSON file and exit",
+        help="Export liked tracks to a file and exit",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=["json", "ndjson", "arrow", "parquet"],
+        default="json",
+        help="Export as one JSON array, newline-delimited JSON, or a columnar Arrow IPC or "
+        "Parquet file for analysis tools (arrow/parquet need the 'arrow' extra; defaults to json)",
+    )
+    parser.add_argument(
+        "--export-compression",
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Compress the export file while it is written; Arrow files take zstd only "
+        "(defaults to none)",
+    )
+    parser.add_argument(
+        "--export-batch-size",
+        type=int,
+        default=EXPORT_BATCH_SIZE,
+        help="Documents read and written per batch during --export or --import "
+        f"(defaults to {EXPORT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="With --export, only write tracks changed since the previous export plus deletion "
+        "tombstones (the first export is always full)",
+    )
+    parser.add_argument(
+        "--export-full",
+        action="store_true",
+        default=False,
+        help="With --export, write whole track documents, played_at history included, as "
+        "Extended JSON so --import can restore them (json/ndjson only)",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_path",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="Restore an empty track cache from a JSON or NDJSON --export-full file, or apply "
+        "an incremental one on top of it, and exit without calling Spotify",
+    )
+    parser.add_argument(
+        "--selection",
+        choices=["lrp", "window", "weighted", "diverse", "rotation"],
+        default="lrp",
+        help="Track selection mode: 'lrp' takes the least-recently-played tracks straight from "
+        "the index, 'window' samples from a least-recently-played window, 'weighted' draws "
+        "with time-since-played/popularity weights, 'diverse' caps and spaces tracks per "
+        "artist, 'rotation' plays every track once per shuffled cycle (defaults to lrp)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for the weighted/diverse selection RNG, for reproducible runs",
+    )
+    parser.add_argument(
+        "--duration",
+        type=parse_duration,
+        default=None,
+        help="Target playlist length instead of an item count, e.g. '3h', '90m' or '2h30m' "
+        "(picked from the least-recently-played window)",
+    )
+    parser.add_argument(
+        "--precompute",
+        action="store_true",
+        default=False,
+        help="Use the selection stored by the previous run if still valid, and store the next "
+        "run's selection at the end of this one (defaults to False)",
+    )
+    parser.add_argument(
+        "--playlists",
+        default=None,
+        help="JSON file listing several playlists to refresh in one run, each with its own "
+        "size and selection (defaults to SPOTIFY_PLAYLISTS_CONFIG; without either, the single "
+        "SPOTIFY_PLAYLIST_ID playlist uses --selection and --duration)",
+    )
+    parser.add_argument(
+        "--users",
+        default=None,
+        help="JSON file listing several Spotify accounts, each with its own playlists, to "
+        "refresh concurrently from one process (defaults to SPOTIFY_USERS_CONFIG)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        default=False,
+        help="Report percentiles of the recorded runs' phase durations, requests, 429s and "
+        "peak memory, flag runs slower than the rolling baseline, and exit",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=Path,
+        const=Path(f"profile-{datetime.now(UTC):%Y%m%dT%H%M%S}.prof"),
+        default=None,
+        metavar="FILE",
+        help="Run under cProfile, write the stats to FILE (defaults to a timestamped "
+        "profile-*.prof) and log wall-clock and CPU time per phase",
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        type=Path,
+        const=Path(f"trace-{datetime.now(UTC):%Y%m%dT%H%M%S}.json"),
+        default=None,
+        metavar="FILE",
+        help="Record a span for every Spotify request, token operation and MongoDB call, and "
+        "write them as OTLP/JSON to FILE (defaults to a timestamped trace-*.json)",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        default=False,
+        help="Trace allocations with tracemalloc and log each phase's peak, its RSS and the "
+        "top allocation sites (slows the run down)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help="Memory the run may use, e.g. '512M' or '2G' (a bare number is MiB): libraries "
+        "projected to need more are synced page by page, and export batches are capped to fit",
     )
     args = parser.parse_args()
-    try:
-        asyncio.run(run(args, logger))
-    except KeyboardInterrupt:
-        sys.exit(1)
-    except Exception as e:
-        logger.error("An error occurred: %s", e)
-        sys.exit(1)
-    else:
-        logger.info("Completed successfully")
-        sys.exit(0)
+    validate_args(parser, args)
+    # The listener thread writes the log, so the event loop never waits on stderr.
+    with queued_logging():
+        try:
+            asyncio.run(instrumented_run(args, logger))
+        except KeyboardInterrupt:
+            sys.exit(1)
+        except Exception as e:
+            logger.error("An error occurred: %s", e)
+            sys.exit(1)
+        else:
+            logger.info("Completed successfully")
+            sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,36 @@
-from spotify.auth import Auth
-from spotify.client import Client
-from spotify.db import DB
-from spotify.schema import PlaylistItems
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from spotify.async_db import AsyncDB
+    from spotify.auth import Auth
+    from spotify.client import Client
+    from spotify.schema import PlaylistItems
 
 __all__ = [
+    "AsyncDB",
     "Auth",
     "Client",
-    "DB",
     "PlaylistItems",
 ]
+
+# Importing the package stays cheap: httpx, pymongo, numpy and the pydantic models load on
+# first access of the name that needs them.
+_EXPORTS = {
+    "AsyncDB": "spotify.async_db",
+    "Auth": "spotify.auth",
+    "Client": "spotify.client",
+    "PlaylistItems": "spotify.schema",
+}
+
+
+def __getattr__(name: str) -> object:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
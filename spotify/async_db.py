@@ -0,0 +1,924 @@
+import asyncio
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Sequence
+from datetime import UTC, date, datetime
+from pathlib import Path
+from typing import Any
+
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import AutoReconnect
+
+from spotify.db import (
+    LRP_SORT,
+    RANDOM_KEY_FIELDS,
+    BaseDB,
+    MongoFilter,
+    RotationState,
+    RunJournal,
+    exclude_filter,
+)
+from spotify.export import (
+    COLUMNAR_FORMATS,
+    COLUMNAR_PROJECTION,
+    ColumnarWriter,
+    ExportWriter,
+    export_path,
+    is_incremental_export,
+    open_export,
+    read_export,
+)
+from spotify.history import RunSummary
+from spotify.options import ExportCompression, ExportFormat, SelectionMode
+from spotify.schema import ItemV2, MongoSettings, RunStep
+from spotify.tracing import current_span, traced_methods
+
+
+async def batched_cursor[T](cursor: AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """itertools.batched for async cursors; the last batch may be shorter."""
+    batch: list[T] = []
+    async for item in cursor:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def read_export_batches(
+    path: Path, batch_size: int
+) -> AsyncIterator[tuple[dict[str, Any], ...]]:
+    """read_export with reading and decoding each batch in a worker thread."""
+    batches = read_export(path, batch_size)
+    try:
+        while batch := await asyncio.to_thread(next, batches, None):
+            yield batch
+    finally:
+        await asyncio.to_thread(batches.close)
+
+
+@traced_methods("mongo")
+class AsyncDB(BaseDB):
+    """Track store on PyMongo's native asyncio API.
+
+    Every MongoDB round trip is awaited, so a slow bulk write or aggregation yields to the
+    event loop and in-flight Spotify requests keep moving.
+    """
+
+    def __init__(
+        self, user_id: str | None = None, mongo_client: AsyncMongoClient | None = None
+    ) -> None:
+        """Open the track store of one Spotify account.
+
+        Pass mongo_client to share one connection pool between several accounts.
+        """
+        super().__init__(user_id)
+        self.owns_client = mongo_client is None
+        self.mongo_client = self.create_client() if mongo_client is None else mongo_client
+        self.mongo_db = self.mongo_client[self.mongo_db_name]
+
+    @classmethod
+    def create_client(cls, settings: MongoSettings | None = None) -> AsyncMongoClient:
+        settings = cls.load_mongo_settings() if settings is None else settings
+        return AsyncMongoClient(**cls.client_options(settings))
+
+    async def close(self) -> None:
+        if not self.owns_client:
+            # Shared pool; whoever created it closes it.
+            return
+        self.logger.debug("Closing MongoDB client connection")
+        await self.mongo_client.close()
+
+    async def check_connection(self) -> bool:
+        self.logger.debug("Checking MongoDB connection via server_info()")
+        is_up = True
+        try:
+            info = await self.mongo_client.server_info()
+            self.logger.debug("MongoDB connection ok: version=%s", info.get("version"))
+            # Create indexes now that we know the DB is up
+            await self.ensure_indexes()
+        except Exception:
+            self.logger.exception("MongoDB is not available")
+            is_up = False
+        return is_up
+
+    async def ensure_indexes(self) -> None:
+        """Build the tracks indexes only when the stored spec version is out of date.
+
+        The applied version lives in the meta collection, so a warm startup costs a single
+        find_one instead of one create_index round trip per index.
+        """
+        meta_coll = self.get_meta_coll()
+        spec = await meta_coll.find_one({"_id": "index_spec"})
+        applied_version = spec.get("version") if spec else None
+        if applied_version == self.INDEX_SPEC_VERSION:
+            self.logger.debug(
+                "Index spec v%d already applied on %s; skipping index builds",
+                self.INDEX_SPEC_VERSION,
+                self.tracks_coll_name,
+            )
+            return
+
+        self.logger.info(
+            "Index spec changed (applied=%s, current=%d); building indexes on %s",
+            applied_version,
+            self.INDEX_SPEC_VERSION,
+            self.tracks_coll_name,
+        )
+        await self.build_indexes()
+
+    async def build_indexes(self) -> None:
+        """Backfill the random keys, drop obsolete indexes and build INDEX_SPEC."""
+        tracks_coll = self.get_tracks_coll()
+        for field in RANDOM_KEY_FIELDS:
+            await tracks_coll.update_many(
+                {field: {"$exists": False}}, [{"$set": {field: {"$rand": {}}}}]
+            )
+        wanted = {index.document["name"] for index in self.INDEX_SPEC}
+        async for index in await tracks_coll.list_indexes():
+            name = index.get("name")
+            if name != "_id_" and name not in wanted:
+                self.logger.info("Dropping obsolete index %s", name)
+                await tracks_coll.drop_index(name)
+        await tracks_coll.create_indexes(list(self.INDEX_SPEC))
+        await self.get_meta_coll().update_one(
+            {"_id": "index_spec"},
+            {"$set": {"version": self.INDEX_SPEC_VERSION, "applied_at": datetime.now(UTC)}},
+            upsert=True,
+        )
+
+    def get_meta_coll(self) -> AsyncCollection:
+        self.logger.debug("Retrieving collection: %s", self.meta_coll_name)
+        return self.mongo_db[self.meta_coll_name]
+
+    def get_tracks_coll(self) -> AsyncCollection:
+        self.logger.debug("Retrieving collection: %s", self.tracks_coll_name)
+        return self.mongo_db[self.tracks_coll_name]
+
+    def get_runs_coll(self) -> AsyncCollection:
+        self.logger.debug("Retrieving collection: %s", self.runs_coll_name)
+        return self.mongo_db[self.runs_coll_name]
+
+    def get_sync_coll(self) -> AsyncCollection:
+        """Tracks collection for library syncs, writing with settings.sync_write_concern."""
+        tracks_coll = self.get_tracks_coll()
+        write_concern = self.sync_write_concern()
+        if write_concern is None:
+            return tracks_coll
+        return tracks_coll.with_options(write_concern=write_concern)
+
+    def get_export_coll(self) -> AsyncCollection:
+        """Tracks collection for exports, reading with settings.read_preference."""
+        tracks_coll = self.get_tracks_coll()
+        read_preference = self.export_read_preference()
+        if read_preference is None:
+            return tracks_coll
+        return tracks_coll.with_options(read_preference=read_preference)
+
+    async def count_track(self, mongo_filters: MongoFilter) -> int:
+        self.logger.debug("Counting documents in 'tracks' with filters=%s", mongo_filters)
+        return await self.get_tracks_coll().count_documents(mongo_filters)
+
+    async def sync_tracks(self, tracks: list[ItemV2]) -> None:
+        """Mirror the liked tracks into MongoDB, writing only what changed.
+
+        Tracks whose content_hash matches the stored one are skipped. Every written track is
+        stamped with a fresh change_seq and every removed one leaves a tombstone, which is what
+        incremental exports read.
+        """
+        self.logger.debug("Syncing tracks to MongoDB: sum=%d", len(tracks))
+        self.track_snapshot = None
+
+        existing = await self.stored_track_hashes()
+        incoming_uris = {t.uri for t in tracks}
+        changed, hashes = self.changed_tracks(tracks, existing)
+
+        uris_to_delete = existing.keys() - incoming_uris
+        current_span().set(tracks=len(tracks), changed=len(changed), deleted=len(uris_to_delete))
+        if not uris_to_delete and not changed:
+            self.logger.info("Library unchanged; nothing to sync")
+            return
+        change_seq = await self.next_change_seq()
+        library_changed = bool(uris_to_delete)
+
+        # Drop tombstones of re-liked tracks, and stale ones about to be rewritten
+        stale_tombstones = [
+            self.tombstone_id(uri) for uri in (incoming_uris - existing.keys()) | uris_to_delete
+        ]
+        if stale_tombstones:
+            await self.get_meta_coll().delete_many({"_id": {"$in": stale_tombstones}})
+        if uris_to_delete:
+            await self.remove_missing_tracks(existing, uris_to_delete, change_seq)
+
+        # New tracks are spliced at random into the part of the rotation cycle not yet played
+        rotation_cursor = max((await self.get_rotation_state())["cursor"], 0.0)
+        operations = [
+            self.track_upsert(t, rotation_cursor, change_seq, hashes[t.uri]) for t in changed
+        ]
+
+        if operations:
+            if await self.write_track_upserts(operations):
+                library_changed = True
+            self.logger.info(
+                "Upserted %d changed tracks into DB (%d unchanged)",
+                len(operations),
+                len(tracks) - len(operations),
+            )
+
+        if library_changed:
+            await self.bump_library_version()
+
+    async def sync_track_pages(self, pages: AsyncIterable[list[ItemV2]]) -> int:
+        """Mirror the liked tracks like sync_tracks, one page at a time, and count them.
+
+        Only the stored URIs and digests are kept for the whole sync, so memory does not grow
+        with the library. Pages are written as they arrive; the tracks no page listed are
+        removed at the end, so a sync that fails halfway deletes nothing.
+        """
+        self.track_snapshot = None
+        existing = await self.stored_track_hashes()
+        rotation_cursor = max((await self.get_rotation_state())["cursor"], 0.0)
+        seen: set[str] = set()
+        change_seq: int | None = None
+        library_changed = False
+        upserted = 0
+        uris_to_delete: set[str] = set()
+        try:
+            async for page in pages:
+                seen.update(t.uri for t in page)
+                changed, hashes = self.changed_tracks(page, existing)
+                if not changed:
+                    continue
+                if change_seq is None:
+                    change_seq = await self.next_change_seq()
+                reliked = [self.tombstone_id(t.uri) for t in changed if t.uri not in existing]
+                if reliked:
+                    await self.get_meta_coll().delete_many({"_id": {"$in": reliked}})
+                operations = [
+                    self.track_upsert(t, rotation_cursor, change_seq, hashes[t.uri])
+                    for t in changed
+                ]
+                if await self.write_track_upserts(operations):
+                    library_changed = True
+                upserted += len(operations)
+
+            uris_to_delete = existing.keys() - seen
+            if uris_to_delete:
+                if change_seq is None:
+                    change_seq = await self.next_change_seq()
+                await self.get_meta_coll().delete_many(
+                    {"_id": {"$in": [self.tombstone_id(uri) for uri in uris_to_delete]}}
+                )
+                await self.remove_missing_tracks(existing, uris_to_delete, change_seq)
+                library_changed = True
+        finally:
+            # Pages already written changed the library even when a later one failed.
+            if library_changed:
+                await self.bump_library_version()
+        current_span().set(tracks=len(seen), changed=upserted, deleted=len(uris_to_delete))
+        self.logger.info(
+            "Streamed %d tracks into DB: %d upserted, %d deleted",
+            len(seen),
+            upserted,
+            len(uris_to_delete),
+        )
+        return len(seen)
+
+    async def stored_track_hashes(self) -> dict[str, dict[str, Any]]:
+        """The URI and content digest of every stored track, keyed by URI."""
+        return {
+            doc.get("uri"): doc
+            async for doc in self.get_tracks_coll().find({}, {"uri": 1, "content_hash": 1})
+        }
+
+    async def remove_missing_tracks(
+        self, existing: dict[str, dict[str, Any]], uris: set[str], change_seq: int
+    ) -> None:
+        """Delete tracks no longer liked, leaving a tombstone for incremental exports."""
+        self.logger.info("Deleting %d missing tracks from DB", len(uris))
+        await self.get_sync_coll().delete_many({"uri": {"$in": list(uris)}})
+        await self.get_meta_coll().insert_many(
+            [self.tombstone_doc(existing[uri], change_seq) for uri in uris]
+        )
+
+    async def write_track_upserts(self, operations: list[UpdateOne]) -> bool:
+        """Bulk-write track upserts in batches; True when any document was inserted or changed."""
+        batch_size = 1000
+        max_retries = 5
+        changed = False
+        for i in range(0, len(operations), batch_size):
+            batch = operations[i : i + batch_size]
+            for attempt in range(max_retries):
+                try:
+                    result = await self.get_sync_coll().bulk_write(batch)
+                    if result.upserted_count or result.modified_count:
+                        changed = True
+                    break
+                except AutoReconnect:
+                    if attempt == max_retries - 1:
+                        raise
+                    self.logger.warning(
+                        "AutoReconnect in bulk_write (Docker idle timeout). Retrying batch."
+                    )
+        return changed
+
+    async def next_change_seq(self) -> int:
+        """Allocate the change_seq stamped on everything the current write touches."""
+        counter = await self.get_meta_coll().find_one_and_update(
+            {"_id": "change_seq"},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return int(counter["value"])
+
+    async def get_change_seq(self) -> int:
+        counter = await self.get_meta_coll().find_one({"_id": "change_seq"})
+        return int(counter["value"]) if counter else 0
+
+    async def get_export_mark(self, full: bool = False) -> int | None:
+        """Return the change_seq the last export of this kind covered, or None before it."""
+        mark = await self.get_meta_coll().find_one({"_id": self.export_mark_id(full)})
+        return int(mark["change_seq"]) if mark else None
+
+    async def save_export_mark(self, change_seq: int, full: bool = False) -> None:
+        meta_coll = self.get_meta_coll()
+        await meta_coll.update_one(
+            {"_id": self.export_mark_id(full)},
+            {"$set": {"change_seq": change_seq, "exported_at": datetime.now(UTC)}},
+            upsert=True,
+        )
+        # A deletion can go once both kinds of export have it; a kind with no mark yet starts
+        # with a full export and does not need tombstones.
+        other_mark = await self.get_export_mark(not full)
+        covered = change_seq if other_mark is None else min(change_seq, other_mark)
+        await meta_coll.delete_many({"kind": "tombstone", "change_seq": {"$lte": covered}})
+
+    async def save_sync_page(self, offset: int, total: int, tracks: list[ItemV2]) -> None:
+        """Checkpoint one fetched page of liked tracks until the sync that needs it finishes."""
+        current_span().set(page_offset=offset, tracks=len(tracks))
+        page = self.sync_page_doc(offset, total, tracks)
+        await self.get_meta_coll().replace_one({"_id": page["_id"]}, page, upsert=True)
+
+    async def load_sync_pages(self, total: int) -> dict[int, list[ItemV2]]:
+        """Return the checkpointed pages of an interrupted sync, keyed by offset."""
+        cursor = self.get_meta_coll().find(self.sync_pages_filter(total))
+        return self.parse_sync_pages([doc async for doc in cursor])
+
+    async def clear_sync_pages(self) -> None:
+        await self.get_meta_coll().delete_many({"kind": "sync_page"})
+
+    async def get_library_version(self) -> int:
+        """Return a counter that changes whenever sync_tracks changes the library."""
+        library = await self.get_meta_coll().find_one({"_id": "library"})
+        return int(library["version"]) if library else 0
+
+    async def bump_library_version(self) -> None:
+        await self.get_meta_coll().update_one(
+            {"_id": "library"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(UTC)}},
+            upsert=True,
+        )
+        self.logger.debug("Library changed; bumped library version")
+
+    def reset_collection(self, collection_name: str) -> None:
+        self.logger.debug("Resetting collection: %s", collection_name)
+        if collection_name == self.tracks_coll_name:
+            self.logger.warning("tracks collection is no longer reset; use sync_tracks instead")
+        else:
+            raise ValueError("Invalid collection name")
+
+    async def export_to_json(
+        self,
+        export_format: ExportFormat = "json",
+        compression: ExportCompression | None = None,
+        batch_size: int = BaseDB.EXPORT_BATCH_SIZE,
+        since: int | None = None,
+        full: bool = False,
+    ) -> Path:
+        """Stream the library to export-<date>.<format>[.gz|.zst], one cursor batch at a time.
+
+        With since, only tracks stamped after that change_seq are written, followed by a
+        {"_id", "uri", "deleted": true} row per track removed since then. With full, whole
+        track documents are written as Extended JSON, which import_tracks can restore.
+        Encoding happens on the event loop; opening, compressing and writing each batch run in
+        a worker thread.
+        """
+        self.logger.debug(
+            "Exporting tracks: format=%s compression=%s batch_size=%d since=%s full=%s",
+            export_format,
+            compression,
+            batch_size,
+            since,
+            full,
+        )
+        current_span().set(batch_size=batch_size)
+        path = export_path(export_format, compression, date.today(), since)
+        writer = ExportWriter(export_format, extended=full)
+        started = time.perf_counter()
+        tracks = self.get_export_coll().find(
+            self.changes_filter(since),
+            None if full else self.EXPORT_PROJECTION,
+            batch_size=batch_size,
+        )
+        out = await asyncio.to_thread(open_export, path, compression)
+        try:
+            await asyncio.to_thread(out.write, writer.header())
+            async for batch in batched_cursor(tracks, batch_size):
+                rows = batch if full else [self.export_row(track) for track in batch]
+                await asyncio.to_thread(out.write, writer.encode(rows))
+            if since is not None:
+                tombstones = self.get_meta_coll().find(self.tombstones_filter(since))
+                async for batch in batched_cursor(tombstones, batch_size):
+                    rows = [self.tombstone_row(tombstone) for tombstone in batch]
+                    await asyncio.to_thread(out.write, writer.encode(rows))
+            await asyncio.to_thread(out.write, writer.footer())
+        finally:
+            await asyncio.to_thread(out.close)
+
+        self.log_export(path, writer.count, time.perf_counter() - started)
+        return path
+
+    async def export_columnar(
+        self,
+        export_format: ExportFormat = "parquet",
+        compression: ExportCompression | None = None,
+        batch_size: int = BaseDB.EXPORT_BATCH_SIZE,
+        since: int | None = None,
+    ) -> Path:
+        """Write the library as Arrow IPC or Parquet, one record batch per cursor batch."""
+        self.logger.debug(
+            "Exporting tracks: format=%s compression=%s batch_size=%d since=%s",
+            export_format,
+            compression,
+            batch_size,
+            since,
+        )
+        current_span().set(batch_size=batch_size)
+        path = export_path(export_format, compression, date.today(), since)
+        started = time.perf_counter()
+        tracks = self.get_export_coll().find(
+            self.changes_filter(since), COLUMNAR_PROJECTION, batch_size=batch_size
+        )
+        writer = await asyncio.to_thread(ColumnarWriter, path, export_format, compression)
+        try:
+            async for batch in batched_cursor(tracks, batch_size):
+                await asyncio.to_thread(writer.write, batch)
+            if since is not None:
+                tombstones = self.get_meta_coll().find(self.tombstones_filter(since))
+                async for batch in batched_cursor(tombstones, batch_size):
+                    rows = [self.tombstone_row(tombstone) for tombstone in batch]
+                    await asyncio.to_thread(writer.write, rows)
+        finally:
+            await asyncio.to_thread(writer.close)
+
+        self.log_export(path, writer.count, time.perf_counter() - started)
+        return path
+
+    async def export_tracks(
+        self,
+        export_format: ExportFormat = "json",
+        compression: ExportCompression | None = None,
+        batch_size: int = BaseDB.EXPORT_BATCH_SIZE,
+        incremental: bool = False,
+        full: bool = False,
+    ) -> Path:
+        """Export the library and move this kind's high-water mark to the current change_seq.
+
+        An incremental export only covers what changed since the previous export of the same
+        kind, so summary exports do not break a chain of --export-full backups; the first one
+        falls back to a full export. full writes whole documents (JSON and NDJSON only).
+        """
+        if full and export_format in COLUMNAR_FORMATS:
+            raise ValueError("Full exports are written as JSON or NDJSON only")
+        since = await self.get_export_mark(full) if incremental else None
+        if incremental and since is None:
+            self.logger.info("No previous export found; writing a full export")
+        high_water_mark = await self.get_change_seq()
+        if export_format in COLUMNAR_FORMATS:
+            path = await self.export_columnar(export_format, compression, batch_size, since)
+        else:
+            path = await self.export_to_json(export_format, compression, batch_size, since, full)
+        await self.save_export_mark(high_water_mark, full)
+        return path
+
+    async def import_tracks(self, path: Path, batch_size: int = BaseDB.EXPORT_BATCH_SIZE) -> int:
+        """Restore an empty tracks collection from an --export-full file, with no Spotify calls.
+
+        The whole file is checked before the first insert. Documents then go in as unordered
+        insert_many batches with only the unique uri index in place; INDEX_SPEC is built once
+        after the load, and the change_seq counter is moved past the imported stamps so later
+        syncs still show up in incremental exports. If the load fails, the inserted documents
+        are removed and the indexes rebuilt; the applied index spec is cleared for the whole
+        load, so even a killed import is rebuilt at the next startup. An incremental export
+        is applied on top of the stored tracks instead (see apply_changes).
+        """
+        if is_incremental_export(path):
+            return await self.apply_changes(path, batch_size)
+        tracks_coll = self.get_tracks_coll()
+        if await tracks_coll.count_documents({}, limit=1):
+            raise RuntimeError(
+                f"{self.tracks_coll_name} is not empty; --import only restores an empty cache "
+                "from a full export"
+            )
+        total = await asyncio.to_thread(self.check_import, path, batch_size)
+        self.logger.info("Importing %d tracks from %s", total, path)
+        current_span().set(batch_size=batch_size, documents=total)
+        self.track_snapshot = None
+        started = time.perf_counter()
+        await self.get_meta_coll().delete_one({"_id": "index_spec"})
+        await self.drop_load_indexes()
+        try:
+            count, change_seq = await self.insert_import(path, batch_size)
+        except Exception:
+            self.logger.exception("Import failed; removing the imported tracks")
+            await tracks_coll.delete_many({})
+            await self.build_indexes()
+            raise
+
+        self.logger.info("Building indexes on %s", self.tracks_coll_name)
+        await self.build_indexes()
+        await self.get_meta_coll().update_one(
+            {"_id": "change_seq"}, {"$max": {"value": change_seq}}, upsert=True
+        )
+        await self.bump_library_version()
+        self.log_import(path, count, time.perf_counter() - started)
+        return count
+
+    async def apply_changes(self, path: Path, batch_size: int) -> int:
+        """Apply an incremental --export-full file on top of an earlier import.
+
+        The whole file is checked first. Changed tracks then replace the stored ones with the
+        same uri, or are inserted, and tombstoned tracks are deleted, one ordered bulk_write per
+        batch. The indexes stay in place, and the change_seq counter is moved past the applied
+        stamps.
+        """
+        total = await asyncio.to_thread(self.check_import, path, batch_size, incremental=True)
+        self.logger.info("Applying %d changes from %s", total, path)
+        current_span().set(batch_size=batch_size, documents=total)
+        self.track_snapshot = None
+        started = time.perf_counter()
+        count = 0
+        change_seq = 0
+        async for batch in read_export_batches(path, batch_size):
+            await self.get_sync_coll().bulk_write(
+                [write for doc in batch for write in self.change_writes(doc)]
+            )
+            count += len(batch)
+            change_seq = max(change_seq, *(int(doc.get("change_seq", 0)) for doc in batch))
+            self.logger.info("Applied %d changes so far", count)
+
+        await self.get_meta_coll().update_one(
+            {"_id": "change_seq"}, {"$max": {"value": change_seq}}, upsert=True
+        )
+        await self.bump_library_version()
+        self.log_import(path, count, time.perf_counter() - started)
+        return count
+
+    def check_import(self, path: Path, batch_size: int, incremental: bool = False) -> int:
+        """Read the whole export once and return its row count, before anything is written.
+
+        Runs in a worker thread. Rows import_doc refuses (import_change for an incremental
+        file) and repeated uris are reported here, so a bad file never leaves a half-applied
+        collection behind.
+        """
+        check = self.import_change if incremental else self.import_doc
+        uris: set[str] = set()
+        for batch in read_export(path, batch_size):
+            for doc in batch:
+                uri = check(doc)["uri"]
+                if uri in uris:
+                    raise ValueError(f"Cannot import {path}: track {uri!r} appears twice")
+                uris.add(uri)
+        return len(uris)
+
+    async def drop_load_indexes(self) -> None:
+        """Drop every index but _id and LOAD_INDEXES, which are built if missing."""
+        tracks_coll = self.get_tracks_coll()
+        kept = {index.document["name"] for index in self.LOAD_INDEXES}
+        async for index in await tracks_coll.list_indexes():
+            name = index.get("name")
+            if name != "_id_" and name not in kept:
+                await tracks_coll.drop_index(name)
+        await tracks_coll.create_indexes(list(self.LOAD_INDEXES))
+
+    async def insert_import(self, path: Path, batch_size: int) -> tuple[int, int]:
+        """Insert the export batch by batch; return the count and the highest change_seq."""
+        tracks_coll = self.get_tracks_coll()
+        count = 0
+        change_seq = 0
+        async for batch in read_export_batches(path, batch_size):
+            await tracks_coll.insert_many(batch, ordered=False)
+            count += len(batch)
+            change_seq = max(change_seq, *(int(doc.get("change_seq", 0)) for doc in batch))
+            self.logger.info("Imported %d tracks so far", count)
+        return count, change_seq
+
+    async def validate_item_count(self, no_items: int) -> None:
+        self.check_item_range(no_items)
+        self.check_available_items(no_items, await self.count_track({}))
+
+    async def generate_random_tracks(self, no_items: int, exclude: Sequence[str] = ()) -> list[str]:
+        self.logger.info(
+            "Generating a playlist with %d items using Least-Recently-Played logic", no_items
+        )
+        cursor = await self.get_tracks_coll().aggregate(self.window_pipeline(no_items, exclude))
+        result = await cursor.to_list()
+
+        if not result:
+            raise ValueError("No tracks found in the database")
+        return result[0].get("tracks", [])
+
+    async def generate_lrp_tracks(
+        self, no_items: int, seed: int | None = None, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        """Sample no_items tracks from the head of the (played_at, rand_key) index."""
+        self.logger.info(
+            "Generating a playlist with %d items using indexed Least-Recently-Played logic",
+            no_items,
+        )
+        cursor = (
+            self.get_tracks_coll()
+            .find(exclude_filter(exclude), {"_id": 0, "uri": 1})
+            .sort(LRP_SORT)
+            .limit(self.window_size(no_items))
+        )
+        return self.pick_lrp([doc["uri"] for doc in await cursor.to_list()], no_items, seed)
+
+    async def generate_weighted_tracks(
+        self, no_items: int, seed: int | None = None, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        """Draw no_items tracks without replacement, weighted by selection_weights.
+
+        The column snapshot of the library is loaded on first use. numpy is only imported
+        here, so exports, imports and --stats never load it.
+        """
+        from spotify.selection import TrackSnapshot, WeightedSelector  # noqa: PLC0415
+
+        self.logger.info(
+            "Generating a playlist with %d items using weighted selection (seed=%s)",
+            no_items,
+            seed,
+        )
+        if self.track_snapshot is None:
+            cursor = await self.get_tracks_coll().aggregate(list(self.SNAPSHOT_PIPELINE))
+            self.track_snapshot = TrackSnapshot.from_documents(await cursor.to_list())
+            self.logger.debug("Loaded track snapshot: tracks=%d", len(self.track_snapshot))
+        selector = WeightedSelector(self.track_snapshot, self.selection_weights, seed)
+        latest_uris = selector.select(no_items, exclude=exclude)
+
+        if not latest_uris:
+            raise ValueError("No tracks found in the database")
+        return latest_uris
+
+    async def generate_diverse_tracks(
+        self, no_items: int, seed: int | None = None, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        """Least-recently-played selection with a per-artist cap and spacing rule."""
+        self.logger.info(
+            "Generating a playlist with %d items, max %d per artist, spacing %d",
+            no_items,
+            self.MAX_TRACKS_PER_ARTIST,
+            self.ARTIST_SPACING,
+        )
+        cursor = await self.get_tracks_coll().aggregate(self.diverse_pipeline(no_items, exclude))
+        candidates = [
+            (doc["uri"], str(doc.get("artist_id") or "")) for doc in await cursor.to_list()
+        ]
+        return self.pick_diverse(candidates, no_items, seed)
+
+    async def generate_duration_tracks(
+        self, target_ms: int, seed: int | None = None, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        """Pick least-recently-played tracks whose durations add up to about target_ms."""
+        self.logger.info(
+            "Generating a playlist of about %d minutes (+/- %d s) using LRP logic",
+            target_ms // 60_000,
+            self.DURATION_TOLERANCE_MS // 1000,
+        )
+        cursor = (
+            self.get_tracks_coll()
+            .find(exclude_filter(exclude), {"_id": 0, "uri": 1, "duration_ms": 1})
+            .sort(LRP_SORT)
+            .limit(self.duration_window_size(target_ms))
+        )
+        candidates = [
+            (doc["uri"], int(doc.get("duration_ms") or 0)) for doc in await cursor.to_list()
+        ]
+        return self.pick_duration(candidates, target_ms, seed)
+
+    async def get_rotation_state(self) -> RotationState:
+        return self.parse_rotation_state(await self.get_meta_coll().find_one({"_id": "rotation"}))
+
+    async def _take_rotation_head(
+        self, cursor: float, no_items: int, exclude: Sequence[str]
+    ) -> tuple[list[str], float]:
+        query: dict[str, object] = {"rotation_key": {"$gt": cursor}, **exclude_filter(exclude)}
+        docs = (
+            await self.get_tracks_coll()
+            .find(query, {"_id": 0, "uri": 1, "rotation_key": 1})
+            .sort("rotation_key", ASCENDING)
+            .limit(no_items)
+            .to_list()
+        )
+        last_key = float(docs[-1]["rotation_key"]) if docs else cursor
+        return [doc["uri"] for doc in docs], last_key
+
+    async def generate_rotation_tracks(
+        self, no_items: int, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        """Play the whole library once per cycle, in a shuffled order.
+
+        Every track carries a rotation_key in [0, 1) and the meta collection holds a single
+        cursor document, so the cycle's permutation is "all keys above the cursor, in key
+        order". A run reads the next no_items entries of the rotation_key index and moves the
+        cursor; deleted tracks simply disappear from the index. When the cycle runs out, all
+        keys are re-rolled server-side to start the next one; the tracks that closed the old
+        cycle are kept after the new cursor so they still play once in the new cycle.
+        """
+        state = await self.get_rotation_state()
+        self.logger.info(
+            "Generating a playlist with %d items from rotation cycle %d", no_items, state["cycle"]
+        )
+        latest_uris, cursor = await self._take_rotation_head(state["cursor"], no_items, exclude)
+        cycle = state["cycle"]
+
+        if len(latest_uris) < no_items:
+            cycle += 1
+            self.logger.info("Rotation cycle %d complete; shuffling cycle %d", cycle - 1, cycle)
+            tracks_coll = self.get_tracks_coll()
+            await tracks_coll.update_many({}, [{"$set": {"rotation_key": {"$rand": {}}}}])
+            head, cursor = await self._take_rotation_head(
+                -1.0, no_items - len(latest_uris), [*exclude, *latest_uris]
+            )
+            if latest_uris:
+                await tracks_coll.bulk_write(self.rotation_rekeys(latest_uris, cursor))
+            latest_uris = latest_uris + head
+
+        if not latest_uris:
+            raise ValueError("No tracks found in the database")
+        await self.get_meta_coll().update_one(
+            {"_id": "rotation"}, {"$set": {"cycle": cycle, "cursor": cursor}}, upsert=True
+        )
+        return latest_uris
+
+    async def update_played_at(self, latest_uris: list[str]) -> None:
+        played_at = datetime.now(UTC)
+        change_seq = await self.next_change_seq()
+        # Pipeline update so each track gets its own fresh rand_key.
+        await self.get_tracks_coll().update_many(
+            {"uri": {"$in": latest_uris}},
+            [
+                {
+                    "$set": {
+                        "played_at": played_at,
+                        "rand_key": {"$rand": {}},
+                        "change_seq": change_seq,
+                    }
+                }
+            ],
+        )
+        if self.track_snapshot is not None:
+            self.track_snapshot.mark_played(latest_uris, played_at.timestamp())
+        self.logger.debug("Marked %d tracks as played", len(latest_uris))
+
+    async def save_pending_plan(
+        self, latest_uris: list[str], selection: str, playlist_id: str
+    ) -> None:
+        """Store a playlist's next selection so the next run can write to Spotify right away."""
+        await self.get_meta_coll().replace_one(
+            {"_id": f"pending_plan:{playlist_id}"},
+            self.pending_plan_doc(latest_uris, selection, await self.get_library_version()),
+            upsert=True,
+        )
+        self.logger.info(
+            "Stored pending plan with %d tracks for %s on playlist %s",
+            len(latest_uris),
+            selection,
+            playlist_id,
+        )
+
+    async def take_pending_plan(self, selection: str, playlist_id: str) -> list[str] | None:
+        """Pop the playlist's pending plan; return its URIs if still valid for this request."""
+        plan = await self.get_meta_coll().find_one_and_delete(
+            {"_id": f"pending_plan:{playlist_id}"}
+        )
+        if not plan:
+            self.logger.debug("No pending plan found")
+            return None
+
+        latest_uris = self.check_pending_plan(plan, selection, await self.get_library_version())
+        if latest_uris is None and str(plan.get("selection", "")).startswith("rotation"):
+            # Its tracks were already consumed from the cycle; put them back in the remainder.
+            await self.return_to_rotation(list(plan.get("uris") or []))
+        return latest_uris
+
+    async def load_run_journal(self, playlist_id: str, selection: str) -> RunJournal | None:
+        """Return the playlist's unfinished run to resume, dropping it if it no longer applies.
+
+        The journal records the selection before anything reaches Spotify, then every step
+        as it completes: select, clear, populate, played and queue.
+        """
+        journal = await self.get_meta_coll().find_one({"_id": self.run_journal_id(playlist_id)})
+        resumed = self.check_run_journal(journal, selection)
+        if journal and resumed is None:
+            await self.finish_run_journal(playlist_id)
+            steps = journal.get("steps") or {}
+            if str(journal.get("selection", "")).startswith("rotation") and "played" not in steps:
+                # Taken from the cycle but never played; put them back in the remainder.
+                await self.return_to_rotation(list(journal.get("uris") or []))
+        return resumed
+
+    async def start_run_journal(
+        self, playlist_id: str, selection: str, latest_uris: list[str]
+    ) -> None:
+        """Record a playlist's selection before anything is written to Spotify."""
+        now = datetime.now(UTC)
+        await self.get_meta_coll().update_one(
+            {"_id": self.run_journal_id(playlist_id)},
+            {
+                "$set": {
+                    "kind": "run_journal",
+                    "selection": selection,
+                    "uris": latest_uris,
+                    "started_at": now,
+                    "steps.select": now,
+                }
+            },
+            upsert=True,
+        )
+
+    async def mark_run_step(self, playlist_id: str, step: RunStep) -> None:
+        await self.get_meta_coll().update_one(
+            {"_id": self.run_journal_id(playlist_id)},
+            {"$set": {f"steps.{step}": datetime.now(UTC)}},
+            upsert=True,
+        )
+
+    async def finish_run_journal(self, playlist_id: str) -> None:
+        await self.get_meta_coll().delete_one({"_id": self.run_journal_id(playlist_id)})
+
+    async def save_run(self, summary: RunSummary) -> None:
+        await self.get_runs_coll().insert_one(dict(summary))
+
+    async def load_runs(self, limit: int) -> list[RunSummary]:
+        """Return the latest limit run summaries, oldest first."""
+        cursor = self.get_runs_coll().find({}, {"_id": 0}).sort("started_at", DESCENDING)
+        return [doc async for doc in cursor.limit(limit)][::-1]
+
+    async def return_to_rotation(self, latest_uris: list[str]) -> None:
+        if not latest_uris:
+            return
+        cursor = max((await self.get_rotation_state())["cursor"], 0.0)
+        await self.get_tracks_coll().bulk_write(self.rotation_rekeys(latest_uris, cursor))
+        self.logger.debug("Returned %d tracks to the rotation cycle", len(latest_uris))
+
+    async def select_random_tracks(
+        self,
+        no_items: int,
+        mode: SelectionMode = "lrp",
+        seed: int | None = None,
+        exclude: Sequence[str] = (),
+    ) -> list[str]:
+        """Validate and dispatch to the selection engine without marking anything played."""
+        self.logger.debug(
+            "Dispatching select_random_tracks: no_items=%d mode=%s excluded=%d",
+            no_items,
+            mode,
+            len(exclude),
+        )
+        await self.validate_item_count(no_items)
+        if mode == "lrp":
+            latest_uris = await self.generate_lrp_tracks(no_items, seed, exclude)
+        elif mode == "window":
+            latest_uris = await self.generate_random_tracks(no_items, exclude)
+        elif mode == "weighted":
+            latest_uris = await self.generate_weighted_tracks(no_items, seed, exclude)
+        elif mode == "diverse":
+            latest_uris = await self.generate_diverse_tracks(no_items, seed, exclude)
+        elif mode == "rotation":
+            latest_uris = await self.generate_rotation_tracks(no_items, exclude)
+        else:
+            raise ValueError(f"Invalid selection mode: {mode}")
+        return latest_uris
+
+    async def generate_random_playlist(
+        self, no_items: int, mode: SelectionMode = "lrp", seed: int | None = None
+    ) -> list[str]:
+        latest_uris = await self.select_random_tracks(no_items, mode, seed)
+        await self.update_played_at(latest_uris)
+        return latest_uris
+
+    async def select_duration_tracks(
+        self, target_ms: int, seed: int | None = None, exclude: Sequence[str] = ()
+    ) -> list[str]:
+        self.validate_duration(target_ms)
+        return await self.generate_duration_tracks(target_ms, seed, exclude)
+
+    async def generate_duration_playlist(
+        self, target_ms: int, seed: int | None = None
+    ) -> list[str]:
+        latest_uris = await self.select_duration_tracks(target_ms, seed)
+        await self.update_played_at(latest_uris)
+        return latest_uris
@@ -13,6 +13,7 @@ import pkce
 from spotify.helpers import CustomHTTPServer, RequestHandler
 from spotify.schema import SpotifyCredentials, SpotifySecrets
 from spotify.token import Token, TokenError
+from spotify.tracing import current_span, traced
 
 
 class SpotifyError(TypedDict):
@@ -43,9 +44,11 @@ class Auth:
         "user-modify-playback-state user-read-playback-state"
     )
 
-    def __init__(self) -> None:
+    def __init__(self, user_id: str | None = None) -> None:
         self.logger = logging.getLogger(__name__)
-        self.logger.debug("Initializing Auth with PKCE")
+        self.logger.debug("Initializing Auth with PKCE: user_id=%s", user_id)
+        # Selects the token store; None is the single-account tokens.json.
+        self.user_id = user_id
         code_verifier, code_challenge = pkce.generate_pkce_pair()
         # Group secrets (client_id, client_secret, state)
         self.secrets = SpotifySecrets(
@@ -81,14 +84,14 @@ class Auth:
     def is_token_expired(self) -> bool:
         now = time.time()
         expires_at = self.credentials.expires_at
-        remaining = (expires_at - self.REFRESH_LEEWAY_SECONDS) - now
-        self.logger.debug(
-            "Checking token expiration: now=%.0f expires_at=%.0f leeway=%ds remaining=%.0fs",
-            now,
-            expires_at,
-            self.REFRESH_LEEWAY_SECONDS,
-            remaining,
-        )
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "Checking token expiration: now=%.0f expires_at=%.0f leeway=%ds remaining=%.0fs",
+                now,
+                expires_at,
+                self.REFRESH_LEEWAY_SECONDS,
+                (expires_at - self.REFRESH_LEEWAY_SECONDS) - now,
+            )
         return now >= (expires_at - self.REFRESH_LEEWAY_SECONDS)
 
     def build_and_store_token(
@@ -100,7 +103,8 @@ class Auth:
             "refresh_token" in data,
             data.get("expires_in"),
         )
-        token = Token(
+        token = Token.for_user(
+            self.user_id,
             access_token=data["access_token"],
             refresh_token=data.get("refresh_token", previous_refresh_token or ""),
             token_expires_at=time.time() + data["expires_in"],
@@ -142,6 +146,7 @@ class Auth:
             f"&code_challenge={self.secrets.code_challenge}"
         )
 
+    @traced("auth.exchange_code_for_token")
     async def exchange_code_for_token(self, authorization_code: str) -> Token:
         self.logger.debug(
             "Exchanging authorization code for access token: code_len=%d redirect_uri=%s",
@@ -161,6 +166,7 @@ class Auth:
             response = await client.post(
                 self.TOKEN_URL, headers=headers, data=data, timeout=self.TIMEOUT
             )
+        current_span().set(status_code=response.status_code, response_bytes=len(response.content))
         response_data = response.json()
         if response.status_code != HTTPStatus.OK:
             raise TokenError(f"Error obtaining access token: {response_data}")
@@ -172,6 +178,7 @@ class Auth:
         asyncio.run(self.exchange_code_for_token(code))
         self.auth_event.set()
 
+    @traced("auth.start_auth_flow")
     def start_auth_flow(self) -> None:
         """Perform interactive OAuth code grant, blocking until completion or timeout."""
         self.logger.debug(
@@ -201,6 +208,7 @@ class Auth:
             httpd.shutdown()
             thread.join(timeout=2)
 
+    @traced("auth.refresh_access_token")
     async def refresh_access_token(self) -> Token | None:
         self.logger.debug(
             "Refreshing access token: token_url=%s has_refresh=%s",
@@ -219,6 +227,7 @@ class Auth:
             response = await client.post(
                 self.TOKEN_URL, headers=headers, data=data, timeout=self.TIMEOUT
             )
+        current_span().set(status_code=response.status_code, response_bytes=len(response.content))
         response_data = response.json()
         if response.status_code == HTTPStatus.OK:
             return self.build_and_store_token(response_data, self.credentials.refresh_token)
@@ -228,10 +237,11 @@ class Auth:
             return None
         raise TokenError(f"Error refreshing access token: {response_data}")
 
+    @traced("auth.load_or_authenticate_tokens")
     async def load_or_authenticate_tokens(self) -> None:
         self.logger.debug("Initializing token data: attempting to load stored tokens")
         try:
-            token_data = Token()
+            token_data = Token.for_user(self.user_id)
             token_data.load_tokens()
             # Update in-memory credentials from persisted token store
             self.credentials.access_token = token_data.access_token
@@ -242,16 +252,19 @@ class Auth:
                 token_data.token_expires_at,
                 time.time(),
             )
-            if self.is_token_expired():
+            expired = self.is_token_expired()
+            current_span().set(token_expired=expired)
+            if expired:
                 # Run async refresh in sync context
                 await self.refresh_access_token()
         except TokenError:
             self.logger.debug("No valid stored tokens found; starting authentication flow")
             self.start_auth_flow()
 
+    @traced("auth.get_valid_access_token")
     async def get_valid_access_token(self) -> str:
-        self.logger.debug("Ensuring valid access token; will refresh if expired")
-        if self.is_token_expired():
+        expired = self.is_token_expired()
+        current_span().set(token_expired=expired)
+        if expired:
             await self.refresh_access_token()
-        self.logger.debug("Returning access token")
         return self.credentials.access_token
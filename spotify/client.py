@@ -1,21 +1,45 @@
 import asyncio
 import logging
-from collections.abc import AsyncGenerator
+import re
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
 from http import HTTPStatus
+from itertools import batched
 from os import environ
+from types import TracebackType
+from typing import Self
 
 import httpx
-from tenacity import retry, retry_if_result, stop_after_attempt, wait_exponential
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_result,
+    stop_after_attempt,
+    wait_exponential,
+)
 
+from spotify.async_db import AsyncDB
 from spotify.auth import Auth
-from spotify.db import DB
+from spotify.logs import Lazy, SampledLog
+from spotify.memory import projected_sync_bytes
 from spotify.schema import (
     AddPlaylistPayload,
     DeletePlaylistPayload,
     HeadersType,
+    ItemV2,
     LikedTracksResponse,
     PlaylistItems,
 )
+from spotify.tracing import current_span, traced
+
+# Spotify IDs are 22 base62 characters; span URLs replace them so equal calls group together.
+SPOTIFY_ID = re.compile(r"[0-9A-Za-z]{22}")
+
+
+def record_attempt(retry_state: RetryCallState) -> None:
+    """tenacity ``before`` hook: count attempts on the span around the retried request."""
+    current_span().set(retry_attempt=retry_state.attempt_number)
 
 
 class Client:
@@ -25,31 +49,130 @@ class Client:
     BATCH_SIZE = 100
     MAX_CONCURRENT_REQUESTS = 5
 
-    def __init__(self, auth: Auth, my_mongo: DB) -> None:
+    def __init__(
+        self,
+        auth: Auth,
+        my_mongo: AsyncDB,
+        request_sem: asyncio.Semaphore | None = None,
+        memory_budget: int | None = None,
+    ) -> None:
         self.logger = logging.getLogger(__name__)
         self.auth = auth
         self.api_url = "https://api.spotify.com/v1"
         self.db = my_mongo
-        self.spotify_playlist_id = environ["SPOTIFY_PLAYLIST_ID"]
+        # Only the default target; runs with a playlists config pass playlist_id explicitly.
+        self.spotify_playlist_id = environ.get("SPOTIFY_PLAYLIST_ID", "")
+        # One rate limiter for every request this client makes, however many playlists run;
+        # pass request_sem to share it between the clients of several accounts.
+        self.request_sem = request_sem or asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        # Shared connection pool while the client is used as an async context manager.
+        self.http: httpx.AsyncClient | None = None
+        # perf_counter() when the first authenticated request was sent, for startup reports.
+        self.first_request_at: float | None = None
+        # API responses, 429s included, and tracks synced, for the run history.
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.tracks_synced: int | None = None
+        # Bytes a sync may hold; larger libraries are streamed into MongoDB page by page.
+        self.memory_budget = memory_budget
+        # Per-page and per-request logs; see SampledLog.
+        self.page_log = SampledLog(self.logger)
         self.logger.debug(
             "Initialized Client: api_url=%s playlist_id=%s",
             self.api_url,
             self.spotify_playlist_id,
         )
 
+    async def __aenter__(self) -> Self:
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.MAX_CONCURRENT_REQUESTS)
+        )
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    @asynccontextmanager
+    async def http_client(self) -> AsyncIterator[httpx.AsyncClient]:
+        """Yield the shared connection pool, or a short-lived client outside ``async with``."""
+        if self.http is not None:
+            yield self.http
+            return
+        async with httpx.AsyncClient() as client:
+            yield client
+
+    def playlist_items_url(self, playlist_id: str | None = None) -> str:
+        playlist_id = playlist_id or self.spotify_playlist_id
+        if not playlist_id:
+            raise ValueError("No playlist ID given and SPOTIFY_PLAYLIST_ID is not set")
+        return f"{self.api_url}/playlists/{playlist_id}/items"
+
     async def _get_headers(self) -> HeadersType:
-        self.logger.debug("Generating request headers using current access token")
         access_token = await self.auth.get_valid_access_token()
-        self.logger.debug("Access token obtained: length=%d", len(access_token or ""))
+        if self.first_request_at is None:
+            self.first_request_at = time.perf_counter()
         return {"Authorization": f"Bearer {access_token}"}
 
-    def describe_paging_window(self, url: str) -> str:
+    @traced("spotify.warm_up")
+    async def warm_up(self) -> None:
+        """Open the pool's connections to the API before the first real request needs them.
+
+        Each unauthenticated HEAD is answered with a 401 but leaves its connection, TCP and
+        TLS handshakes done, in the shared pool. Failures only cost the head start. Outside
+        ``async with`` there is no pool to keep the connections in, so nothing is sent.
+        """
+        if self.http is None:
+            return
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self.http.head(self.api_url, timeout=self.TIMEOUT)
+                for _ in range(self.MAX_CONCURRENT_REQUESTS)
+            ),
+            return_exceptions=True,
+        )
+        opened = sum(not isinstance(result, BaseException) for result in results)
         self.logger.debug(
-            "Parsing batch window from URL: %s",
-            url
-            if len(url) <= self.MAX_LOG_URL_LENGTH
-            else url[: self.MAX_LOG_URL_LENGTH - 3] + "...",
+            "Warmed up %d of %d connections to %s in %.2fs",
+            opened,
+            len(results),
+            self.api_url,
+            time.perf_counter() - started,
         )
+
+    def record_response(self, url: str, response: httpx.Response, items: int | None = None) -> None:
+        """Count a response for the run summary and describe it on the request's span."""
+        self.request_count += 1
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            self.rate_limited_count += 1
+        span = current_span()
+        if not span.recording:
+            return
+        parsed = httpx.URL(url)
+        span.set(
+            url_template=SPOTIFY_ID.sub("{id}", parsed.path),
+            page_offset=int(parsed.params["offset"]) if "offset" in parsed.params else None,
+            page_limit=int(parsed.params["limit"]) if "limit" in parsed.params else None,
+            items=items,
+            status_code=response.status_code,
+            response_bytes=len(response.content),
+        )
+
+    def describe_paging_window(self, url: str) -> str:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "Parsing batch window from URL: %s",
+                url
+                if len(url) <= self.MAX_LOG_URL_LENGTH
+                else url[: self.MAX_LOG_URL_LENGTH - 3] + "...",
+            )
         url_parts = url.split("?")
         valid_number_of_parts = 2
         temp_list: list[str] = []
@@ -70,11 +193,12 @@ class Client:
         self.logger.debug("Computed human readable batch window: %s", human)
         return human
 
+    @traced("spotify.get_available_all_devices")
     async def get_available_all_devices(self) -> list[str]:
         self.logger.debug("Getting all available device IDs")
         devices: list[str] = []
         headers = await self._get_headers()
-        async with httpx.AsyncClient() as client:
+        async with self.http_client() as client:
             response = await client.get(
                 f"{self.api_url}/me/player/devices", headers=headers, timeout=self.TIMEOUT
             )
@@ -88,33 +212,43 @@ class Client:
                 devices.append(d_id)
         return devices
 
+    @traced("spotify.GET")
     @retry(
         wait=wait_exponential(multiplier=1, min=1, max=10),
         stop=stop_after_attempt(5),
         retry=retry_if_result(lambda r: r.status_code == HTTPStatus.TOO_MANY_REQUESTS),
+        before=record_attempt,
     )
     async def _make_get_request(self, client: httpx.AsyncClient, url: str) -> httpx.Response:
         headers = await self._get_headers()
-        return await client.get(url, headers=headers, timeout=self.TIMEOUT)
+        response = await client.get(url, headers=headers, timeout=self.TIMEOUT)
+        self.record_response(url, response)
+        return response
 
+    @traced("spotify.DELETE")
     @retry(
         wait=wait_exponential(multiplier=1, min=1, max=10),
         stop=stop_after_attempt(5),
         retry=retry_if_result(lambda r: r.status_code == HTTPStatus.TOO_MANY_REQUESTS),
+        before=record_attempt,
     )
     async def _make_delete_request(
         self, client: httpx.AsyncClient, url: str, json_data: DeletePlaylistPayload
     ) -> httpx.Response:
         headers = await self._get_headers()
         headers["Content-Type"] = "application/json"
-        return await client.request(
+        response = await client.request(
             "DELETE", url, headers=headers, json=json_data, timeout=self.TIMEOUT
         )
+        self.record_response(url, response, items=len(json_data["items"]))
+        return response
 
+    @traced("spotify.POST")
     @retry(
         wait=wait_exponential(multiplier=1, min=1, max=10),
         stop=stop_after_attempt(5),
         retry=retry_if_result(lambda r: r.status_code == HTTPStatus.TOO_MANY_REQUESTS),
+        before=record_attempt,
     )
     async def _make_post_request(
         self,
@@ -126,16 +260,19 @@ class Client:
         headers = await self._get_headers()
         if json_data is not None:
             headers["Content-Type"] = "application/json"
-        return await client.post(
+        response = await client.post(
             url, headers=headers, json=json_data, params=params, timeout=self.TIMEOUT
         )
+        self.record_response(url, response, items=len(json_data["uris"]) if json_data else None)
+        return response
 
     async def fetch_liked_items(self, client: httpx.AsyncClient, url: str) -> LikedTracksResponse:
-        human_readable = self.describe_paging_window(url)
-        self.logger.info(
+        self.page_log.log(
+            "liked_tracks",
+            logging.INFO,
             "Fetching liked tracks batch: url=%s human_readable=%s timeout=%ss",
             url,
-            human_readable,
+            Lazy(self.describe_paging_window, url),
             self.TIMEOUT,
         )
         response = await self._make_get_request(client, url)
@@ -153,11 +290,12 @@ class Client:
         return result
 
     async def fetch_playlist_items(self, client: httpx.AsyncClient, url: str) -> PlaylistItems:
-        human_readable = self.describe_paging_window(url)
-        self.logger.info(
+        self.page_log.log(
+            "playlist_items",
+            logging.INFO,
             "Fetching playlist items: url=%s human_readable=%s timeout=%ss",
             url,
-            human_readable,
+            Lazy(self.describe_paging_window, url),
             self.TIMEOUT,
         )
         response = await self._make_get_request(client, url)
@@ -178,7 +316,7 @@ class Client:
         self, client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str
     ) -> LikedTracksResponse | PlaylistItems:
         async with sem:
-            if f"/playlists/{self.spotify_playlist_id}/items" in url:
+            if "/playlists/" in url and "/items" in url:
                 return await self.fetch_playlist_items(client, url)
             elif "/me/tracks" in url:
                 return await self.fetch_liked_items(client, url)
@@ -206,36 +344,141 @@ class Client:
         async with sem:
             return await self._make_post_request(client, url, json_data, params)
 
+    def liked_tracks_url(self, offset: int) -> str:
+        return f"{self.api_url}/me/tracks?offset={offset}&limit={self.ME_BATCH_SIZE}"
+
+    @traced("spotify.fetch_liked_page")
+    async def fetch_liked_page(
+        self, client: httpx.AsyncClient, offset: int, total: int, checkpoint: bool = True
+    ) -> list[ItemV2]:
+        """Fetch one page of liked tracks and checkpoint it as soon as it arrives."""
+        response_data = await self.fetch_with_sem(
+            client, self.request_sem, self.liked_tracks_url(offset)
+        )
+        tracks = [item.track for item in response_data.items if item.track]
+        if checkpoint:
+            await self.db.save_sync_page(offset, total, tracks)
+        return tracks
+
+    async def stream_liked_pages(
+        self, client: httpx.AsyncClient, first_page: list[ItemV2], total: int
+    ) -> AsyncGenerator[list[ItemV2]]:
+        """Yield the liked tracks page by page, fetching MAX_CONCURRENT_REQUESTS at a time.
+
+        Only one window of pages is in memory, so nothing is checkpointed: the pages are
+        written as they arrive instead.
+        """
+        yield first_page
+        offsets = range(self.ME_BATCH_SIZE, total, self.ME_BATCH_SIZE)
+        for window in batched(offsets, self.MAX_CONCURRENT_REQUESTS):
+            pages = await asyncio.gather(
+                *(
+                    self.fetch_liked_page(client, offset, total, checkpoint=False)
+                    for offset in window
+                )
+            )
+            for page in pages:
+                yield page
+
+    async def load_checkpoints(
+        self, total: int, first_page: list[ItemV2]
+    ) -> dict[int, list[ItemV2]]:
+        """Return the checkpointed pages a rerun can reuse, keyed by offset, with first_page.
+
+        A like plus an unlike leaves total unchanged but shifts every offset. New likes come
+        first, so the checkpoints only still line up if the first page saved with them matches
+        the one just fetched; otherwise they are all dropped.
+        """
+        pages = await self.db.load_sync_pages(total)
+        saved_first = pages.pop(0, None)
+        if saved_first is None or [track.uri for track in saved_first] != [
+            track.uri for track in first_page
+        ]:
+            if pages:
+                self.logger.info(
+                    "Liked tracks changed since the last checkpoint; dropping %d pages",
+                    len(pages),
+                )
+                await self.db.clear_sync_pages()
+                pages = {}
+            await self.db.save_sync_page(0, total, first_page)
+        pages[0] = first_page
+        return pages
+
+    @traced("spotify.get_all_liked_tracks")
     async def get_all_liked_tracks(self) -> None:
+        """Fetch every liked track and sync them, resuming from the pages a failed run saved.
+
+        Each page is checkpointed in MongoDB once fetched, and a failing page no longer
+        cancels the others. A rerun only fetches the first page, for the total and to check
+        the checkpoints against, and the pages still missing; the checkpoints are dropped once
+        sync_tracks has stored the library.
+        When the whole library would not fit in memory_budget, the pages are streamed into
+        MongoDB instead, without checkpoints.
+        """
         self.logger.debug("Starting retrieval of all liked tracks")
         self.logger.info("Getting all liked tracks")
-        url = f"{self.api_url}/me/tracks?offset=0&limit={self.ME_BATCH_SIZE}"
-        all_tracks = []
-
-        async with httpx.AsyncClient() as client:
-            first_batch = await self.fetch_liked_items(client, url)
-            all_tracks.extend([item.track for item in first_batch.items if item.track])
-            sem = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
 
-            tasks = []
-            for offset in range(self.ME_BATCH_SIZE, first_batch.total, self.ME_BATCH_SIZE):
-                next_url = f"{self.api_url}/me/tracks?offset={offset}&limit={self.ME_BATCH_SIZE}"
-                tasks.append(self.fetch_with_sem(client, sem, next_url))
-
-            if tasks:
-                responses = await asyncio.gather(*tasks)
-                for response_data in responses:
-                    all_tracks.extend([item.track for item in response_data.items if item.track])
+        async with self.http_client() as client:
+            first_batch = await self.fetch_liked_items(client, self.liked_tracks_url(0))
+            total = first_batch.total
+            first_page = [item.track for item in first_batch.items if item.track]
+            if self.memory_budget is not None and (
+                projected_sync_bytes(total) > self.memory_budget
+            ):
+                self.logger.info(
+                    "%d liked tracks need about %d MiB, over the %d MiB budget; streaming the sync",
+                    total,
+                    projected_sync_bytes(total) // 2**20,
+                    self.memory_budget // 2**20,
+                )
+                self.tracks_synced = await self.db.sync_track_pages(
+                    self.stream_liked_pages(client, first_page, total)
+                )
+                await self.db.clear_sync_pages()
+                return
+            pages = await self.load_checkpoints(total, first_page)
+            missing = [
+                offset
+                for offset in range(self.ME_BATCH_SIZE, total, self.ME_BATCH_SIZE)
+                if offset not in pages
+            ]
+            if len(pages) > 1:
+                self.logger.info(
+                    "Resuming liked tracks sync: %d pages checkpointed, %d to fetch",
+                    len(pages) - 1,
+                    len(missing),
+                )
+
+            results = await asyncio.gather(
+                *(self.fetch_liked_page(client, offset, total) for offset in missing),
+                return_exceptions=True,
+            )
+            errors: list[BaseException] = []
+            for offset, result in zip(missing, results, strict=True):
+                if isinstance(result, BaseException):
+                    errors.append(result)
+                else:
+                    pages[offset] = result
+            if errors:
+                self.logger.error(
+                    "%d of %d liked tracks pages failed; rerun to fetch only those",
+                    len(errors),
+                    len(missing),
+                )
+                raise errors[0]
 
         # Do a single sync at the end
-        self.db.sync_tracks(all_tracks)
+        tracks = [track for offset in sorted(pages) for track in pages[offset]]
+        await self.db.sync_tracks(tracks)
+        self.tracks_synced = len(tracks)
+        await self.db.clear_sync_pages()
         self.logger.debug("Completed retrieval of liked tracks")
 
     async def _yield_playlist_tracks_batches(
-        self, client: httpx.AsyncClient
+        self, client: httpx.AsyncClient, url: str
     ) -> AsyncGenerator[list[str]]:
         """Yield batches of track URIs from the playlist, always fetching from offset 0."""
-        url = f"{self.api_url}/playlists/{self.spotify_playlist_id}/items"
         while True:
             try:
                 response_data = await self.fetch_playlist_items(client, url)
@@ -258,16 +501,17 @@ class Client:
                 self.logger.exception("Error fetching playlist tracks batch")
                 break
 
-    async def delete_all_playlist_tracks(self) -> None:
-        self.logger.debug("Deleting playlist content: playlist_id=%s", self.spotify_playlist_id)
+    @traced("spotify.delete_all_playlist_tracks")
+    async def delete_all_playlist_tracks(self, playlist_id: str | None = None) -> None:
+        url = self.playlist_items_url(playlist_id)
+        self.logger.debug("Deleting playlist content: url=%s", url)
         self.logger.info("Deleting playlist content")
-        url = f"{self.api_url}/playlists/{self.spotify_playlist_id}/items"
 
-        async with httpx.AsyncClient() as client:
-            sem = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        async with self.http_client() as client:
+            sem = self.request_sem
 
             # Use async generator to process batches
-            async for batch_uris in self._yield_playlist_tracks_batches(client):
+            async for batch_uris in self._yield_playlist_tracks_batches(client, url):
                 self.logger.debug("Deleting batch: size=%d", len(batch_uris))
                 data: DeletePlaylistPayload = {"items": [{"uri": uri} for uri in batch_uris]}
                 try:
@@ -276,16 +520,17 @@ class Client:
                     self.logger.exception("Failed to delete batch")
                     raise
 
-    async def populate_playlist_with_uris(self, uri_list: list[str]) -> None:
-        self.logger.debug(
-            "Generating content in playlist: playlist_id=%s", self.spotify_playlist_id
-        )
+    @traced("spotify.populate_playlist_with_uris")
+    async def populate_playlist_with_uris(
+        self, uri_list: list[str], playlist_id: str | None = None
+    ) -> None:
+        url = self.playlist_items_url(playlist_id)
+        self.logger.debug("Generating content in playlist: url=%s", url)
         self.logger.info("Generating content")
-        url = f"{self.api_url}/playlists/{self.spotify_playlist_id}/items"
         self.logger.debug("Preparing to add tracks: total=%d", len(uri_list))
 
-        async with httpx.AsyncClient() as client:
-            sem = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        async with self.http_client() as client:
+            sem = self.request_sem
 
             tasks = []
             for i in range(0, len(uri_list), self.BATCH_SIZE):
@@ -299,9 +544,12 @@ class Client:
             for response in responses:
                 response.raise_for_status()
 
-    async def update_queue(self, uri_list: list[str]) -> None:
-        devices = await self.get_available_all_devices()
-        sem = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+    @traced("spotify.update_queue")
+    async def update_queue(self, uri_list: list[str], devices: list[str] | None = None) -> None:
+        """Queue uri_list on every device, fetching the devices unless they are given."""
+        if devices is None:
+            devices = await self.get_available_all_devices()
+        sem = self.request_sem
 
         async def queue_device(client: httpx.AsyncClient, device_id: str) -> None:
             for uri in uri_list:
@@ -310,18 +558,26 @@ class Client:
                     "device_id": device_id,
                     "uri": uri,
                 }
-                self.logger.info("Adding track %s to queue for device %s", uri, device_id)
+                self.page_log.log(
+                    f"queue:{device_id}",
+                    logging.INFO,
+                    "Adding track %s to queue for device %s",
+                    uri,
+                    device_id,
+                )
                 response = await self.post_with_sem(client, sem, url, params=params)
                 response.raise_for_status()
+            self.logger.info("Queued %d tracks on device %s", len(uri_list), device_id)
 
-        async with httpx.AsyncClient() as client:
+        async with self.http_client() as client:
             await asyncio.gather(*(queue_device(client, d) for d in devices))
 
+    @traced("spotify.get_all_playlists")
     async def get_all_playlists(self) -> None:
         self.logger.info("Getting all playlists")
         url: str | None = f"{self.api_url}/me/playlists?offset=0&limit={self.ME_BATCH_SIZE}"
 
-        async with httpx.AsyncClient() as client:
+        async with self.http_client() as client:
             while url:
                 self.logger.debug("Fetching playlists batch: url=%s timeout=%ss", url, self.TIMEOUT)
                 headers = await self._get_headers()
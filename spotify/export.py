@@ -0,0 +1,228 @@
+import gzip
+import json
+import re
+from collections.abc import Iterator, Mapping, Sequence
+from datetime import date
+from itertools import batched
+from pathlib import Path
+from typing import Any, TextIO
+
+from bson import json_util
+
+from spotify.options import ExportCompression, ExportFormat
+
+COMPRESSION_SUFFIXES: dict[ExportCompression, str] = {"gzip": ".gz", "zstd": ".zst"}
+# Arrow and Parquet compress inside the file, so their names never get a suffix.
+COLUMNAR_FORMATS: tuple[ExportFormat, ...] = ("arrow", "parquet")
+# Full exports keep BSON types as MongoDB Extended JSON, e.g. played_at as {"$date": "..."}.
+EXTENDED_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+_INCREMENTAL_NAME = re.compile(r"-since-\d+\.")
+
+# What the columnar formats read: flat track fields plus the album and artist fields that
+# columnar_row flattens.
+COLUMNAR_PROJECTION: Mapping[str, int] = {
+    "_id": 1,
+    "uri": 1,
+    "name": 1,
+    "type": 1,
+    "duration_ms": 1,
+    "popularity": 1,
+    "explicit": 1,
+    "played_at": 1,
+    "album._id": 1,
+    "album.name": 1,
+    "album.release_date": 1,
+    "artists._id": 1,
+    "artists.name": 1,
+}
+
+
+def export_path(
+    export_format: ExportFormat,
+    compression: ExportCompression | None,
+    day: date,
+    since: int | None = None,
+) -> Path:
+    """export-<day>.<format>, or export-<day>-since-<since>.<format> for incremental exports."""
+    suffix = ""
+    if compression and export_format not in COLUMNAR_FORMATS:
+        suffix = COMPRESSION_SUFFIXES[compression]
+    stem = f"export-{day}" if since is None else f"export-{day}-since-{since}"
+    return Path(f"{stem}.{export_format}{suffix}")
+
+
+def open_export(path: Path, compression: ExportCompression | None, mode: str = "w") -> TextIO:
+    """Open path for text writing, or reading with mode="r", (de)compressing on the fly."""
+    if compression == "gzip":
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    if compression == "zstd":
+        # Standard library from Python 3.14; imported here so the other formats work without it.
+        from compression import zstd  # noqa: PLC0415
+
+        return zstd.open(path, f"{mode}t", encoding="utf-8")
+    return path.open(mode, encoding="utf-8")
+
+
+def import_settings(path: Path) -> tuple[ExportFormat, ExportCompression | None]:
+    """Tell the format and compression of an export file from its name."""
+    name = path.name
+    compression: ExportCompression | None = None
+    for candidate, suffix in COMPRESSION_SUFFIXES.items():
+        if name.endswith(suffix):
+            compression = candidate
+            name = name.removesuffix(suffix)
+    export_format = Path(name).suffix.removeprefix(".")
+    if export_format == "json":
+        return "json", compression
+    if export_format == "ndjson":
+        return "ndjson", compression
+    raise ValueError(f"Cannot import {path}: only JSON and NDJSON exports can be imported")
+
+
+def is_incremental_export(path: Path) -> bool:
+    """Tell an incremental export, export-<day>-since-<since>.<format>, from its name."""
+    return _INCREMENTAL_NAME.search(path.name) is not None
+
+
+def parse_export_line(line: str) -> dict[str, Any] | None:
+    """Decode one line of an export, or None for the brackets around a JSON array."""
+    text = line.strip().removesuffix(",")
+    if text in ("", "[", "]", "[]"):
+        return None
+    return json_util.loads(text, json_options=EXTENDED_JSON_OPTIONS)
+
+
+def read_export(path: Path, batch_size: int) -> Iterator[tuple[dict[str, Any], ...]]:
+    """Yield the documents of a JSON or NDJSON export, batch_size at a time.
+
+    ExportWriter puts every JSON array item on a line of its own, so both formats are read
+    line by line and only the current batch is held in memory.
+    """
+    _, compression = import_settings(path)
+    with open_export(path, compression, "r") as source:
+        documents = (parse_export_line(line) for line in source)
+        yield from batched((doc for doc in documents if doc is not None), batch_size)
+
+
+class ExportWriter:
+    """Serialize export rows batch by batch, as NDJSON lines or the items of one JSON array.
+
+    Nothing but the current batch is held in memory: header() is written first, then
+    encode() for every batch read off the cursor, then footer().
+    """
+
+    def __init__(self, export_format: ExportFormat, extended: bool = False) -> None:
+        """With extended, rows may hold BSON types and are written as Extended JSON."""
+        self.export_format = export_format
+        self.extended = extended
+        self.count = 0
+
+    def dumps(self, row: Mapping[str, object]) -> str:
+        if self.extended:
+            return json_util.dumps(
+                row, json_options=EXTENDED_JSON_OPTIONS, ensure_ascii=False, separators=(",", ":")
+            )
+        return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+    def header(self) -> str:
+        return "[" if self.export_format == "json" else ""
+
+    def encode(self, rows: Sequence[Mapping[str, object]]) -> str:
+        lines = [self.dumps(row) for row in rows]
+        if self.export_format == "ndjson":
+            text = "".join(f"{line}\n" for line in lines)
+        else:
+            # Array items are separated by ",\n"; the first item has no leading comma.
+            text = ",\n".join(lines)
+            if self.count and lines:
+                text = f",\n{text}"
+            elif lines:
+                text = f"\n{text}"
+        self.count += len(lines)
+        return text
+
+    def footer(self) -> str:
+        if self.export_format == "ndjson":
+            return ""
+        return "\n]\n" if self.count else "]\n"
+
+
+def columnar_row(track: Mapping[str, Any]) -> dict[str, object]:
+    """Flatten one projected track document, or a tombstone row, into the columnar schema."""
+    album = track.get("album") or {}
+    artists = [artist for artist in track.get("artists") or [] if isinstance(artist, Mapping)]
+    return {
+        "_id": str(track.get("_id")),
+        "uri": track.get("uri"),
+        "name": track.get("name"),
+        "type": track.get("type"),
+        "duration_ms": track.get("duration_ms"),
+        "popularity": track.get("popularity"),
+        "explicit": track.get("explicit"),
+        "played_at": track.get("played_at"),
+        "album_id": album.get("_id"),
+        "album_name": album.get("name"),
+        "album_release_date": album.get("release_date"),
+        "artist_ids": [artist.get("_id") for artist in artists],
+        "artist_names": [artist.get("name") for artist in artists],
+        "deleted": bool(track.get("deleted")),
+    }
+
+
+class ColumnarWriter:
+    """Write export rows as Arrow IPC or Parquet, one record batch per cursor batch.
+
+    Arrow files use the random-access IPC file format, so readers can memory-map them with
+    pyarrow.memory_map and pyarrow.ipc.open_file and query the columns without copying.
+    pyarrow is an optional dependency (the "arrow" extra) and is only imported here.
+    """
+
+    def __init__(
+        self, path: Path, export_format: ExportFormat, compression: ExportCompression | None
+    ) -> None:
+        try:
+            import pyarrow as pa  # noqa: PLC0415
+        except ImportError as exc:
+            raise ImportError(
+                "Arrow and Parquet exports need pyarrow; install the 'arrow' extra"
+            ) from exc
+
+        if export_format == "arrow" and compression == "gzip":
+            raise ValueError("Arrow files support zstd compression only")
+        self.pa = pa
+        self.schema = pa.schema(
+            [
+                ("_id", pa.string()),
+                ("uri", pa.string()),
+                ("name", pa.string()),
+                ("type", pa.string()),
+                ("duration_ms", pa.int64()),
+                ("popularity", pa.int64()),
+                ("explicit", pa.bool_()),
+                ("played_at", pa.timestamp("ms", tz="UTC")),
+                ("album_id", pa.string()),
+                ("album_name", pa.string()),
+                ("album_release_date", pa.timestamp("ms", tz="UTC")),
+                ("artist_ids", pa.list_(pa.string())),
+                ("artist_names", pa.list_(pa.string())),
+                ("deleted", pa.bool_()),
+            ]
+        )
+        self.count = 0
+        if export_format == "parquet":
+            import pyarrow.parquet as pq  # noqa: PLC0415
+
+            self.writer = pq.ParquetWriter(path, self.schema, compression=compression or "none")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            self.writer = pa.ipc.new_file(path, self.schema, options=options)
+
+    def write(self, tracks: Sequence[Mapping[str, Any]]) -> None:
+        if not tracks:
+            return
+        rows = [columnar_row(track) for track in tracks]
+        self.writer.write_batch(self.pa.RecordBatch.from_pylist(rows, schema=self.schema))
+        self.count += len(rows)
+
+    def close(self) -> None:
+        self.writer.close()
@@ -1,3 +1,4 @@
+import re
 from collections.abc import Callable
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from os import environ
@@ -5,6 +6,39 @@ from typing import Any
 from urllib.parse import parse_qs, urlparse
 
 _AfInetAddress = tuple[str, int]
+_DURATION_PATTERN = re.compile(r"(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?")
+_SIZE_PATTERN = re.compile(r"(\d+)([kmg]?)i?b?")
+_SIZE_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30}
+
+
+def parse_duration(value: str) -> int:
+    """Parse a human duration such as '3h', '90m' or '2h30m' into milliseconds.
+
+    A bare number is taken as minutes.
+    """
+    text = value.strip().lower()
+    if text.isdigit():
+        return int(text) * 60_000
+    match = _DURATION_PATTERN.fullmatch(text)
+    if not text or not match:
+        raise ValueError(f"Invalid duration: {value!r}")
+    hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000
+
+
+def parse_size(value: str) -> int:
+    """Parse a human memory size such as '512M', '2G' or '256MiB' into bytes.
+
+    Units are powers of 1024; a bare number is taken as MiB.
+    """
+    text = value.strip().lower()
+    if text.isdigit():
+        return int(text) * _SIZE_UNITS["m"]
+    match = _SIZE_PATTERN.fullmatch(text)
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    number, unit = match.groups()
+    return int(number) * _SIZE_UNITS[unit]
 
 
 class CustomHTTPServer(HTTPServer):
@@ -0,0 +1,145 @@
+import resource
+import statistics
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Literal, NamedTuple, TypedDict
+
+# Runs kept in the report, the earlier runs each one is compared against, and how much slower
+# than their median a run must be to count as a regression.
+STATS_RUNS = 200
+BASELINE_RUNS = 10
+MIN_BASELINE_RUNS = 3
+REGRESSION_FACTOR = 1.5
+PERCENTILES = (50, 90, 99)
+# Phases shorter than this are all noise; they are never flagged.
+MIN_REGRESSION_SECONDS = 0.5
+
+
+class RunSummary(TypedDict):
+    started_at: datetime
+    mode: Literal["refresh", "export"]
+    status: Literal["ok", "error"]
+    error: str | None
+    duration: float
+    phases: dict[str, float]
+    requests: int
+    rate_limited: int
+    tracks_synced: int | None
+    peak_rss_mb: float
+
+
+class Regression(NamedTuple):
+    run: RunSummary
+    metric: str
+    seconds: float
+    baseline: float
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values: Sequence[float]) -> dict[int, float]:
+    if len(values) == 1:
+        return dict.fromkeys(PERCENTILES, values[0])
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {percentile: cuts[percentile - 1] for percentile in PERCENTILES}
+
+
+def run_metrics(run: RunSummary) -> dict[str, float]:
+    return {"total": run["duration"], **run["phases"]}
+
+
+def run_kind(run: RunSummary) -> str:
+    """Group key for baselines and percentiles.
+
+    An export, or a refresh that skipped the liked-tracks fetch, is far quicker than a refresh
+    that fetched the library, so runs are only compared with runs of the same kind.
+    """
+    if run["mode"] == "export":
+        return "export"
+    return "refresh" if run["tracks_synced"] is not None else "refresh (cached library)"
+
+
+def group_by_kind(runs: Sequence[RunSummary]) -> dict[str, list[RunSummary]]:
+    groups: dict[str, list[RunSummary]] = {}
+    for run in runs:
+        groups.setdefault(run_kind(run), []).append(run)
+    return groups
+
+
+def find_regressions(runs: Sequence[RunSummary]) -> list[Regression]:
+    """Flag each metric of a successful run that is REGRESSION_FACTOR times its baseline.
+
+    The baseline is the median over the BASELINE_RUNS successful runs of the same kind before
+    it, so it rolls forward with the data and a slowdown shows up in the first run it affects.
+    """
+    earlier_runs: dict[str, list[RunSummary]] = {}
+    regressions: list[Regression] = []
+    for run in runs:
+        if run["status"] != "ok":
+            continue
+        previous = earlier_runs.setdefault(run_kind(run), [])[-BASELINE_RUNS:]
+        for metric, seconds in run_metrics(run).items():
+            history = [
+                run_metrics(earlier)[metric]
+                for earlier in previous
+                if metric in run_metrics(earlier)
+            ]
+            if len(history) < MIN_BASELINE_RUNS or seconds < MIN_REGRESSION_SECONDS:
+                continue
+            baseline = statistics.median(history)
+            if seconds > baseline * REGRESSION_FACTOR:
+                regressions.append(Regression(run, metric, seconds, baseline))
+        earlier_runs[run_kind(run)].append(run)
+    return regressions
+
+
+def kind_report(kind: str, runs: Sequence[RunSummary]) -> list[str]:
+    """Percentiles per metric over the runs of one kind."""
+    lines = [
+        f"{kind}: {len(runs)} runs",
+        f"{'metric':<16}" + "".join(f"{f'p{percentile}':>10}" for percentile in PERCENTILES),
+    ]
+    samples: dict[str, list[float]] = {}
+    for run in runs:
+        if run["status"] == "ok":
+            for metric, seconds in run_metrics(run).items():
+                samples.setdefault(metric, []).append(seconds)
+    for metric, values in samples.items():
+        cuts = percentiles(values)
+        lines.append(f"{metric:<16}" + "".join(f"{cuts[p]:>9.2f}s" for p in PERCENTILES))
+    for label, values in (
+        ("requests", [float(run["requests"]) for run in runs]),
+        ("429s", [float(run["rate_limited"]) for run in runs]),
+        ("peak RSS (MB)", [run["peak_rss_mb"] for run in runs]),
+    ):
+        cuts = percentiles(values)
+        lines.append(f"{label:<16}" + "".join(f"{cuts[p]:>10.0f}" for p in PERCENTILES))
+    return lines
+
+
+def stats_report(runs: Sequence[RunSummary]) -> list[str]:
+    """Percentiles per kind of run over the given runs, oldest first, then the regressions."""
+    if not runs:
+        return ["No runs recorded yet"]
+    failed = sum(run["status"] == "error" for run in runs)
+    lines = [
+        (
+            f"{len(runs)} runs from {runs[0]['started_at']:%Y-%m-%d %H:%M} to "
+            f"{runs[-1]['started_at']:%Y-%m-%d %H:%M}, {failed} failed"
+        )
+    ]
+    for kind, kind_runs in group_by_kind(runs).items():
+        lines.extend(kind_report(kind, kind_runs))
+    regressions = find_regressions(runs)
+    lines.append(f"{len(regressions)} regressions against the rolling baseline")
+    lines.extend(
+        f"  {regression.run['started_at']:%Y-%m-%d %H:%M} {run_kind(regression.run)} "
+        f"{regression.metric}: {regression.seconds:.2f}s, "
+        f"{regression.seconds / regression.baseline:.1f}x the {regression.baseline:.2f}s "
+        "median of the previous runs"
+        for regression in regressions
+    )
+    return lines
@@ -0,0 +1,72 @@
+import logging
+import queue
+import sys
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
+
+# Logs written once per page or request emit the first call and then one in this many.
+SAMPLE_EVERY = 10
+SAMPLE_SUFFIX = " (call %d, logging 1 in %d)"
+
+
+@contextmanager
+def queued_logging(
+    level: int = logging.INFO, stream: TextIO | None = None
+) -> Iterator[QueueListener]:
+    """Send every record through a queue to a listener thread that writes it to stream.
+
+    The logging thread, usually the event loop, only formats the message and enqueues it, so
+    a slow terminal or pipe never blocks it. Leaving the block drains the queue and removes
+    the handler again.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    queue_handler = QueueHandler(records)
+    root = logging.getLogger()
+    previous_level = root.level
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    try:
+        yield listener
+    finally:
+        listener.stop()
+        root.removeHandler(queue_handler)
+        root.setLevel(previous_level)
+        handler.flush()
+
+
+class Lazy:
+    """Log argument computed only when a record is actually emitted."""
+
+    __slots__ = ("args", "func")
+
+    def __init__(self, func: Callable[..., object], *args: object) -> None:
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.func(*self.args))
+
+
+class SampledLog:
+    """Emit the first call per key and then one in every `every`, for per-page and per-request logs.
+
+    Each emitted record says which call it was, so the totals can still be read off the log.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = SAMPLE_EVERY) -> None:
+        self.logger = logger
+        self.every = every
+        self.counts: dict[str, int] = {}
+
+    def log(self, key: str, level: int, msg: str, *args: object) -> None:
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if (count - 1) % self.every or not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, msg + SAMPLE_SUFFIX, *args, count, self.every, stacklevel=2)
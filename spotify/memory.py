@@ -0,0 +1,111 @@
+import logging
+import os
+import resource
+import tracemalloc
+from collections.abc import Awaitable
+from pathlib import Path
+from typing import NamedTuple
+
+# Measured with tracemalloc on /me/tracks pages whose tracks and albums list ~185 markets:
+# about 30 KiB per parsed track plus 7 KiB for its UpdateOne, rounded up.
+TRACK_MEMORY_BYTES = 40 * 1024
+# One export batch may use this share of the budget; encoding and the write buffer need the rest.
+EXPORT_BATCH_BUDGET_SHARE = 4
+TOP_SITES = 10
+MIB = 1024 * 1024
+
+
+def projected_sync_bytes(total: int) -> int:
+    """Memory a sync holding every liked track and its upsert at once is expected to need."""
+    return total * TRACK_MEMORY_BYTES
+
+
+def fit_batch_size(batch_size: int, budget: int) -> int:
+    """Shrink an export batch until it fits its share of the memory budget."""
+    return max(1, min(batch_size, budget // (EXPORT_BATCH_BUDGET_SHARE * TRACK_MEMORY_BYTES)))
+
+
+def current_rss_bytes() -> int:
+    """Resident set size now, or the peak so far where /proc is not available."""
+    try:
+        statm = Path("/proc/self/statm").read_text(encoding="ascii")
+        return int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PhaseMemory(NamedTuple):
+    start: int
+    end: int
+    peak: int
+    rss: int
+
+
+class MemoryMonitor:
+    """Account memory per phase with tracemalloc, for --memory.
+
+    Every phase start and end is a boundary: the traced peak since the previous boundary is
+    charged to every phase running in between, then reset, so overlapping phases each see the
+    peak they took part in. The snapshot taken at the end of the phase holding the most memory
+    names the top allocation sites.
+    """
+
+    def __init__(self, top: int = TOP_SITES) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.top = top
+        self.running: dict[str, int] = {}
+        self.phases: dict[str, PhaseMemory] = {}
+        self.peaks: dict[str, int] = {}
+        self.largest: tuple[str, tracemalloc.Snapshot] | None = None
+        self.largest_size = 0
+
+    async def run[T](self, main: Awaitable[T]) -> T:
+        tracemalloc.start()
+        try:
+            return await main
+        finally:
+            self.log_report()
+            tracemalloc.stop()
+
+    def boundary(self) -> int:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for name in self.running:
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        return current
+
+    def phase_started(self, name: str) -> None:
+        self.running[name] = self.boundary()
+
+    def phase_finished(self, name: str) -> None:
+        end = self.boundary()
+        start = self.running.pop(name)
+        self.phases[name] = PhaseMemory(start, end, self.peaks.pop(name, end), current_rss_bytes())
+        if end > self.largest_size:
+            self.largest_size = end
+            self.largest = (name, tracemalloc.take_snapshot())
+
+    def log_report(self) -> None:
+        for name, usage in self.phases.items():
+            self.logger.info(
+                "Memory: phase %s peaked at %.1f MiB traced (%+.1f MiB over its start), "
+                "%.1f MiB traced and %.1f MiB RSS at its end",
+                name,
+                usage.peak / MIB,
+                (usage.peak - usage.start) / MIB,
+                usage.end / MIB,
+                usage.rss / MIB,
+            )
+        if self.largest is None:
+            return
+        name, snapshot = self.largest
+        self.logger.info("Memory: top allocation sites at the end of phase %s", name)
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            frame = stat.traceback[0]
+            self.logger.info(
+                "Memory:   %.1f MiB in %d blocks at %s:%d",
+                stat.size / MIB,
+                stat.count,
+                frame.filename,
+                frame.lineno,
+            )
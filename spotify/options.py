@@ -0,0 +1,14 @@
+from typing import Literal
+
+# Values and defaults of the CLI flags and config settings. Kept apart from spotify.schema so
+# the CLI and the export writers can use them without building the pydantic models.
+type SelectionMode = Literal["lrp", "window", "weighted", "diverse", "rotation"]
+type ExportFormat = Literal["json", "ndjson", "arrow", "parquet"]
+type ExportCompression = Literal["gzip", "zstd"]
+type MongoCompressor = Literal["zstd", "snappy", "zlib"]
+type MongoReadPreference = Literal[
+    "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+]
+
+# Documents per cursor batch, and per insert batch for --import.
+EXPORT_BATCH_SIZE = 1000
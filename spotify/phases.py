@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from contextvars import ContextVar
+from typing import NamedTuple, Protocol, TypedDict
+
+from spotify.tracing import span
+
+type PhaseFunc = Callable[[], Awaitable[object]]
+
+# Name of the phase the running task belongs to; tasks a phase starts inherit it.
+CURRENT_PHASE: ContextVar[str | None] = ContextVar("current_phase", default=None)
+
+
+class Phase(NamedTuple):
+    name: str
+    run: PhaseFunc
+    after: tuple[str, ...]
+
+
+class PhaseTiming(TypedDict):
+    start: float
+    end: float
+
+
+class PhaseMonitor(Protocol):
+    """Told when each phase starts and ends, for measurements taken at phase boundaries."""
+
+    def phase_started(self, name: str) -> None: ...
+
+    def phase_finished(self, name: str) -> None: ...
+
+
+class PhaseGraph:
+    """The phases of a run with the phases each one waits for.
+
+    run() starts every phase as soon as the phases it waits for are done, so independent ones
+    overlap. Phases can only wait for phases declared before them, which keeps the graph
+    acyclic. Every phase is timed, and the report names the critical path: the chain of
+    phases, each gated by the one before it, that decided the total time.
+    """
+
+    def __init__(self, monitor: PhaseMonitor | None = None) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.phases: dict[str, Phase] = {}
+        self.timings: dict[str, PhaseTiming] = {}
+        self.monitor = monitor
+
+    def add(self, name: str, run: PhaseFunc, after: Sequence[str] = ()) -> None:
+        if name in self.phases:
+            raise ValueError(f"Phase {name} is already declared")
+        undeclared = [dependency for dependency in after if dependency not in self.phases]
+        if undeclared:
+            raise ValueError(f"Phase {name} waits for undeclared phases: {', '.join(undeclared)}")
+        self.phases[name] = Phase(name, run, tuple(after))
+
+    async def run(self) -> dict[str, PhaseTiming]:
+        """Run every phase; the first failure cancels the phases still running and is raised."""
+        started = time.perf_counter()
+        tasks: dict[str, asyncio.Task[None]] = {}
+
+        async def run_phase(phase: Phase) -> None:
+            for dependency in phase.after:
+                await tasks[dependency]
+            start = time.perf_counter() - started
+            CURRENT_PHASE.set(phase.name)
+            self.logger.debug("Starting phase %s", phase.name)
+            if self.monitor is not None:
+                self.monitor.phase_started(phase.name)
+            try:
+                with span(f"phase.{phase.name}"):
+                    await phase.run()
+            finally:
+                if self.monitor is not None:
+                    self.monitor.phase_finished(phase.name)
+            self.timings[phase.name] = {"start": start, "end": time.perf_counter() - started}
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for phase in self.phases.values():
+                    tasks[phase.name] = group.create_task(run_phase(phase), name=phase.name)
+        except ExceptionGroup as errors:
+            # Phases waiting on a failed one re-raise its error; report the first failure only.
+            raise errors.exceptions[0] from errors
+        finally:
+            self.log_report()
+        return self.timings
+
+    def critical_path(self) -> list[str]:
+        """Walk back from the phase that ended last through the dependency that ended last."""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda phase: self.timings[phase]["end"])
+        path = [name]
+        while dependencies := [dep for dep in self.phases[name].after if dep in self.timings]:
+            name = max(dependencies, key=lambda phase: self.timings[phase]["end"])
+            path.append(name)
+        return path[::-1]
+
+    def log_report(self) -> None:
+        for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["start"]):
+            self.logger.info(
+                "Phase %s took %.2fs (started at %.2fs)",
+                name,
+                timing["end"] - timing["start"],
+                timing["start"],
+            )
+        path = self.critical_path()
+        if path:
+            self.logger.info(
+                "Critical path (%.2fs): %s",
+                self.timings[path[-1]]["end"],
+                " -> ".join(
+                    f"{name} {self.timings[name]['end'] - self.timings[name]['start']:.2f}s"
+                    for name in path
+                ),
+            )
@@ -0,0 +1,119 @@
+import bisect
+import random
+from collections import Counter
+from collections.abc import Sequence
+
+# Upper bound on single add/swap moves select_by_duration tries after the greedy fill.
+MAX_DURATION_MOVES = 32
+
+
+def diversify(
+    candidates: Sequence[tuple[str, str]],
+    no_items: int,
+    max_per_artist: int,
+    spacing: int,
+    rng: random.Random,
+) -> list[str]:
+    """Pick no_items (uri, artist_id) candidates with an artist cap and spacing rule.
+
+    Candidates are expected in preference order (e.g. least-recently-played first). One pass
+    keeps a candidate while its artist is under max_per_artist; if the window runs dry, the
+    skipped candidates backfill in order so the playlist still reaches no_items. The picks are
+    then shuffled and greedily reordered so the same artist does not reappear within
+    ``spacing`` positions whenever the mix allows it.
+    """
+    picked: list[tuple[str, str]] = []
+    skipped: list[tuple[str, str]] = []
+    per_artist: Counter[str] = Counter()
+    for uri, artist_id in candidates:
+        if len(picked) == no_items:
+            break
+        if per_artist[artist_id] < max_per_artist:
+            per_artist[artist_id] += 1
+            picked.append((uri, artist_id))
+        else:
+            skipped.append((uri, artist_id))
+    picked.extend(skipped[: no_items - len(picked)])
+
+    rng.shuffle(picked)
+    remaining: Counter[str] = Counter(artist_id for _, artist_id in picked)
+    ordered: list[str] = []
+    last_seen: dict[str, int] = {}
+
+    def spacing_key(index: int) -> tuple[int, int, int]:
+        artist_id = picked[index][1]
+        seen = last_seen.get(artist_id)
+        if seen is None or len(ordered) - seen > spacing:
+            # Place artists with the most tracks left first so they do not bunch at the end.
+            return (0, -remaining[artist_id], index)
+        # Every remaining track is too close: take the artist seen longest ago.
+        return (1, seen, index)
+
+    while picked:
+        uri, artist_id = picked.pop(min(range(len(picked)), key=spacing_key))
+        remaining[artist_id] -= 1
+        last_seen[artist_id] = len(ordered)
+        ordered.append(uri)
+    return ordered
+
+
+def select_by_duration(
+    candidates: Sequence[tuple[str, int]],
+    target_ms: int,
+    tolerance_ms: int,
+    max_items: int,
+    rng: random.Random,
+) -> list[str]:
+    """Approximate subset-sum: pick (uri, duration_ms) candidates totalling about target_ms.
+
+    A greedy fill over the shuffled candidates adds tracks that do not overshoot
+    target_ms + tolerance_ms until the total is within tolerance. If it is still short, a few
+    refinement moves close the gap: add one unpicked track whose length fits the gap, or swap
+    a picked track for an unpicked one whose length differs by about the gap. Unpicked tracks
+    are kept sorted by duration so each move is a bisect per picked track, i.e. O(k log n).
+    Best effort: the closest total found is returned even if it misses the tolerance.
+    """
+    pool = list(candidates)
+    rng.shuffle(pool)
+    low, high = target_ms - tolerance_ms, target_ms + tolerance_ms
+
+    picked: list[tuple[str, int]] = []
+    unpicked: list[tuple[int, str]] = []
+    total = 0
+    for uri, duration in pool:
+        if total < low and len(picked) < max_items and total + duration <= high:
+            picked.append((uri, duration))
+            total += duration
+        else:
+            unpicked.append((duration, uri))
+    unpicked.sort()
+
+    def find_unpicked(min_ms: int, max_ms: int) -> int | None:
+        index = bisect.bisect_left(unpicked, (min_ms, ""))
+        if index < len(unpicked) and unpicked[index][0] <= max_ms:
+            return index
+        return None
+
+    for _ in range(MAX_DURATION_MOVES):
+        if low <= total <= high:
+            break
+        gap = target_ms - total
+        index = find_unpicked(gap - tolerance_ms, gap + tolerance_ms)
+        if index is not None and len(picked) < max_items:
+            duration, uri = unpicked.pop(index)
+            picked.append((uri, duration))
+            total += duration
+            continue
+        for position, (out_uri, out_duration) in enumerate(picked):
+            index = find_unpicked(
+                out_duration + gap - tolerance_ms, out_duration + gap + tolerance_ms
+            )
+            if index is not None:
+                duration, uri = unpicked.pop(index)
+                bisect.insort(unpicked, (out_duration, out_uri))
+                picked[position] = (uri, duration)
+                total += duration - out_duration
+                break
+        else:
+            break
+    return [uri for uri, _ in picked]
@@ -0,0 +1,203 @@
+import asyncio
+import cProfile
+import logging
+import pstats
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Coroutine, Generator, Iterable
+from pathlib import Path
+from typing import Any
+
+from spotify.phases import CURRENT_PHASE
+
+# cProfile self time is grouped by the first category whose marker appears in the function's
+# file name or description. The selector poll is the event loop idling until a socket (Spotify
+# or MongoDB) or a timer is ready.
+CATEGORIES = (
+    ("waiting for I/O", ("select.epoll", "select.kqueue", "select.poll", "select.select")),
+    ("pydantic validation", ("pydantic",)),
+    ("JSON", ("json",)),
+    ("MongoDB driver", ("pymongo", "bson")),
+    ("HTTP client", ("httpx", "httpcore", "h11", "h2", "ssl", "socket")),
+)
+OTHER_CATEGORY = "other"
+OUTSIDE_PHASES = "(outside phases)"
+# What runs between task steps: the event loop polling for I/O and its callbacks.
+EVENT_LOOP = "(event loop)"
+
+
+def categorize(filename: str, function: str) -> str:
+    text = f"{filename} {function}"
+    for category, markers in CATEGORIES:
+        if any(marker in text for marker in markers):
+            return category
+    return OTHER_CATEGORY
+
+
+def merge_stats(profiles: Iterable[cProfile.Profile]) -> pstats.Stats:
+    stats = pstats.Stats()
+    for profile in profiles:
+        # pstats refuses a profile that recorded nothing.
+        if profile.getstats():
+            stats.add(profile)
+    return stats
+
+
+class RunProfiler:
+    """Profile one run: a cProfile dump plus wall-clock and CPU time per phase.
+
+    Every task is stepped through _TimedSteps, so a phase's CPU time includes the tasks it
+    starts. Wall time minus CPU time is what the phase spent waiting on Spotify, MongoDB or
+    other phases. Each step is profiled into its phase's own cProfile, so the category split
+    is per phase too; the event loop between steps gets a profile of its own. Work done in
+    threads (asyncio.to_thread) is not profiled.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.loop_profile = cProfile.Profile()
+        self.phase_profiles: defaultdict[str, list[cProfile.Profile]] = defaultdict(list)
+        self.phase_cpu: defaultdict[str, float] = defaultdict(float)
+        self.phase_spans: dict[str, tuple[float, float]] = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def step_profile(self, phase: str | None) -> cProfile.Profile:
+        """Switch profiling from the event loop to a task step of phase."""
+        self.loop_profile.disable()
+        if phase is None:
+            # The step may start a phase; it is filed once the step shows which.
+            profile = cProfile.Profile()
+        else:
+            profiles = self.phase_profiles[phase]
+            if not profiles:
+                profiles.append(cProfile.Profile())
+            profile = profiles[0]
+        profile.enable()
+        return profile
+
+    def end_step(
+        self, profile: cProfile.Profile, step_phase: str | None, start: float, cpu_start: float
+    ) -> None:
+        profile.disable()
+        phase = CURRENT_PHASE.get()
+        if step_phase is None:
+            self.phase_profiles[phase or OUTSIDE_PHASES].append(profile)
+        self.charge(phase, start, cpu_start)
+        self.loop_profile.enable()
+
+    def charge(self, phase: str | None, start: float, cpu_start: float) -> None:
+        now = time.perf_counter()
+        name = phase or OUTSIDE_PHASES
+        self.phase_cpu[name] += time.thread_time() - cpu_start
+        first, _ = self.phase_spans.get(name, (start, now))
+        self.phase_spans[name] = (first, now)
+
+    async def _timed[T](self, coro: Awaitable[T]) -> T:
+        return await _TimedSteps(coro, self)
+
+    def _create_task(
+        self, loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, Any], **kwargs: Any
+    ) -> asyncio.Task[Any]:
+        return asyncio.Task(self._timed(coro), loop=loop, **kwargs)
+
+    async def run[T](self, main: Awaitable[T]) -> T:
+        loop = asyncio.get_running_loop()
+        previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._create_task)
+        started, cpu_started = time.perf_counter(), time.process_time()
+        self.loop_profile.enable()
+        try:
+            return await self._timed(main)
+        finally:
+            self.loop_profile.disable()
+            self.wall = time.perf_counter() - started
+            self.cpu = time.process_time() - cpu_started
+            loop.set_task_factory(previous_factory)
+            merge_stats(self.profiles()).dump_stats(self.path)
+            self.log_report()
+
+    def profiles(self) -> list[cProfile.Profile]:
+        return [
+            self.loop_profile,
+            *(profile for profiles in self.phase_profiles.values() for profile in profiles),
+        ]
+
+    @staticmethod
+    def categories_of(profiles: Iterable[cProfile.Profile]) -> dict[str, float]:
+        """Self time in seconds per category, slowest first."""
+        totals: defaultdict[str, float] = defaultdict(float)
+        stats = merge_stats(profiles)
+        for (filename, _, function), (_, _, self_time, _, _) in stats.stats.items():
+            totals[categorize(filename, function)] += self_time
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def categories(self) -> dict[str, float]:
+        """Self time in seconds per category over the whole run, slowest first."""
+        return self.categories_of(self.profiles())
+
+    def phase_categories(self) -> dict[str, dict[str, float]]:
+        """Self time per category for each phase and for the event loop between steps."""
+        split = {
+            phase: self.categories_of(profiles) for phase, profiles in self.phase_profiles.items()
+        }
+        split[EVENT_LOOP] = self.categories_of([self.loop_profile])
+        return split
+
+    def log_report(self) -> None:
+        self.logger.info(
+            "Profile: %.2fs wall, %.2fs CPU (%.0f%%); written to %s",
+            self.wall,
+            self.cpu,
+            100 * self.cpu / self.wall if self.wall else 0,
+            self.path,
+        )
+        for name, (first, last) in sorted(self.phase_spans.items(), key=lambda item: item[1]):
+            wall = last - first
+            cpu = self.phase_cpu[name]
+            self.logger.info(
+                "Profile: phase %s %.2fs wall, %.2fs CPU, %.2fs waiting",
+                name,
+                wall,
+                cpu,
+                max(wall - cpu, 0.0),
+            )
+        for category, seconds in self.categories().items():
+            self.logger.info("Profile: %s %.2fs", category, seconds)
+        for name, categories in self.phase_categories().items():
+            self.logger.info(
+                "Profile: %s split %s",
+                name,
+                ", ".join(f"{category} {seconds:.2f}s" for category, seconds in categories.items()),
+            )
+
+
+class _TimedSteps[T]:
+    """Await a coroutine one step at a time, charging each step's CPU and profile to its phase."""
+
+    def __init__(self, coro: Awaitable[T], profiler: RunProfiler) -> None:
+        self.coro = coro
+        self.profiler = profiler
+
+    def __await__(self) -> Generator[Any, Any, T]:
+        steps = self.coro.__await__()
+        send, value = steps.send, None
+        while True:
+            step_phase = CURRENT_PHASE.get()
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            profile = self.profiler.step_profile(step_phase)
+            try:
+                future = send(value)
+            except StopIteration as done:
+                return done.value
+            finally:
+                self.profiler.end_step(profile, step_phase, start, cpu_start)
+            try:
+                value, send = (yield future), steps.send
+            except GeneratorExit:
+                steps.close()
+                raise
+            # Cancellation included: the coroutine decides what to do with it.
+            except BaseException as error:  # noqa: BLE001
+                value, send = error, steps.throw
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+from collections.abc import Iterator, Mapping, Sequence
+from datetime import UTC, datetime
+from typing import Literal
+
+from pymongo.errors import PyMongoError
+
+from spotify.async_db import AsyncDB
+from spotify.client import Client
+from spotify.db import RunJournal
+from spotify.history import RunSummary, peak_rss_mb
+from spotify.phases import PhaseGraph, PhaseTiming
+from spotify.schema import PlaylistTarget, RunStep
+
+logger = logging.getLogger(__name__)
+
+
+def describe_selection(target: PlaylistTarget) -> str:
+    if target.duration:
+        return f"duration:{target.duration}"
+    return f"{target.selection}:{target.size}"
+
+
+async def select_tracks(
+    my_mongo: AsyncDB, target: PlaylistTarget, seed: int | None, exclude: list[str]
+) -> list[str]:
+    if target.duration:
+        return await my_mongo.select_duration_tracks(target.duration, seed=seed, exclude=exclude)
+    return await my_mongo.select_random_tracks(
+        target.size, mode=target.selection, seed=seed, exclude=exclude
+    )
+
+
+async def select_playlists(
+    my_mongo: AsyncDB,
+    targets: list[PlaylistTarget],
+    seed: int | None,
+    plans: list[list[str] | None],
+) -> list[list[str]]:
+    """Fill in a selection for every target without a plan, keeping all of them disjoint.
+
+    Selections run one after the other against the same library, each excluding every track
+    already planned or selected for another target.
+    """
+    taken = [uri for plan in plans if plan for uri in plan]
+    selections: list[list[str]] = []
+    for target, plan in zip(targets, plans, strict=True):
+        uris = plan
+        if uris is None:
+            uris = await select_tracks(my_mongo, target, seed, taken)
+            taken += uris
+        selections.append(uris)
+    return selections
+
+
+async def sync_library(my_mongo: AsyncDB, sp_client: Client, update_cache: bool) -> None:
+    if update_cache or await my_mongo.count_track({}) == 0:
+        logger.info("Populating local cache of liked tracks")
+        await sp_client.get_all_liked_tracks()
+    else:
+        logger.info("Skipping cache update; using existing liked tracks from DB")
+
+
+def step_done(journal: RunJournal | None, step: RunStep) -> bool:
+    return journal is not None and step in journal["steps"]
+
+
+async def load_run_journals(
+    my_mongo: AsyncDB, targets: list[PlaylistTarget]
+) -> list[RunJournal | None]:
+    """Read what the previous run left unfinished for every target."""
+    return [
+        await my_mongo.load_run_journal(target.playlist_id, describe_selection(target))
+        for target in targets
+    ]
+
+
+async def plan_playlists(
+    my_mongo: AsyncDB,
+    targets: list[PlaylistTarget],
+    seed: int | None,
+    precompute: bool,
+    journals: list[RunJournal | None],
+) -> list[list[str]]:
+    """Pick this run's tracks for every target and journal them before touching Spotify.
+
+    A target with an unfinished run keeps that run's tracks. Nothing is marked played here;
+    the populate phase does that once the tracks are in the playlist.
+    """
+    plans = [
+        journal["uris"]
+        if journal
+        else await my_mongo.take_pending_plan(describe_selection(target), target.playlist_id)
+        if precompute
+        else None
+        for target, journal in zip(targets, journals, strict=True)
+    ]
+    selections = await select_playlists(my_mongo, targets, seed, plans)
+    for target, journal, uris in zip(targets, journals, selections, strict=True):
+        if journal is None:
+            await my_mongo.start_run_journal(target.playlist_id, describe_selection(target), uris)
+    return selections
+
+
+async def clear_playlist(my_mongo: AsyncDB, sp_client: Client, target: PlaylistTarget) -> None:
+    await sp_client.delete_all_playlist_tracks(target.playlist_id)
+    await my_mongo.mark_run_step(target.playlist_id, "clear")
+
+
+def start_clearing(
+    my_mongo: AsyncDB,
+    sp_client: Client,
+    targets: list[PlaylistTarget],
+    journals: list[RunJournal | None],
+) -> asyncio.Future[list[None]]:
+    """Start emptying every target playlist in the background.
+
+    Clearing only talks to Spotify, so it runs while plan_playlists works on MongoDB; it is
+    awaited before the populate phase adds anything. A playlist the previous run
+    already populated is left alone; any other is cleared again, since a populate that
+    failed halfway may have added part of its tracks.
+    """
+    return asyncio.gather(
+        *(
+            clear_playlist(my_mongo, sp_client, target)
+            for target, journal in zip(targets, journals, strict=True)
+            if not step_done(journal, "populate")
+        )
+    )
+
+
+async def populate_target(
+    my_mongo: AsyncDB,
+    sp_client: Client,
+    target: PlaylistTarget,
+    uris: list[str],
+    journal: RunJournal | None,
+) -> None:
+    """Fill one target and mark its tracks played, unless its journal shows that done."""
+    if not step_done(journal, "populate"):
+        await sp_client.populate_playlist_with_uris(uris, target.playlist_id)
+        await my_mongo.mark_run_step(target.playlist_id, "populate")
+    if not step_done(journal, "played"):
+        # Only tracks that reached the playlist move forward in least-recently-played order.
+        await my_mongo.update_played_at(uris)
+        await my_mongo.mark_run_step(target.playlist_id, "played")
+
+
+class PlaylistRefresh:
+    """The steps of a playlist refresh as phases of a PhaseGraph.
+
+    Clearing waits for the library sync, so a failed sync leaves the playlists as they were,
+    but overlaps the selection; the queue devices are fetched while the playlists are filled.
+    """
+
+    def __init__(
+        self,
+        my_mongo: AsyncDB,
+        sp_client: Client,
+        targets: list[PlaylistTarget],
+        seed: int | None,
+        precompute: bool,
+    ) -> None:
+        self.my_mongo = my_mongo
+        self.sp_client = sp_client
+        self.targets = targets
+        self.seed = seed
+        self.precompute = precompute
+        self.journals: list[RunJournal | None] = []
+        self.selections: list[list[str]] = []
+        self.devices: list[str] = []
+
+    def add_phases(
+        self,
+        graph: PhaseGraph,
+        db_ready: Sequence[str] = (),
+        spotify_ready: Sequence[str] = (),
+        library_ready: Sequence[str] = (),
+    ) -> None:
+        """Declare the refresh phases.
+
+        db_ready, spotify_ready and library_ready name the phases that connect MongoDB, log
+        in to Spotify and sync the library; a standalone refresh leaves them empty.
+        """
+        graph.add("journals", self.load_journals, after=db_ready)
+        graph.add("clear", self.clear, after=("journals", *spotify_ready, *library_ready))
+        graph.add("select", self.select, after=("journals", *library_ready))
+        graph.add("populate", self.populate, after=("clear", "select"))
+        queue_after = ["populate"]
+        if any(target.queue for target in self.targets):
+            graph.add("devices", self.fetch_devices, after=spotify_ready)
+            queue_after.append("devices")
+        graph.add("queue", self.queue, after=queue_after)
+        if self.precompute:
+            graph.add("precompute", self.precompute_next, after=("queue",))
+
+    async def load_journals(self) -> None:
+        self.journals = await load_run_journals(self.my_mongo, self.targets)
+
+    async def clear(self) -> None:
+        await start_clearing(self.my_mongo, self.sp_client, self.targets, self.journals)
+
+    async def select(self) -> None:
+        self.selections = await plan_playlists(
+            self.my_mongo, self.targets, self.seed, self.precompute, self.journals
+        )
+
+    async def fetch_devices(self) -> None:
+        self.devices = await self.sp_client.get_available_all_devices()
+
+    async def populate(self) -> None:
+        await asyncio.gather(
+            *(
+                populate_target(self.my_mongo, self.sp_client, target, uris, journal)
+                for target, uris, journal in self.runs()
+            )
+        )
+
+    async def queue(self) -> None:
+        await asyncio.gather(
+            *(self.queue_target(target, uris, journal) for target, uris, journal in self.runs())
+        )
+
+    async def queue_target(
+        self, target: PlaylistTarget, uris: list[str], journal: RunJournal | None
+    ) -> None:
+        """Queue one target's tracks if it asks for it, then close its journal."""
+        if target.queue and not step_done(journal, "queue"):
+            await self.sp_client.update_queue(uris, self.devices)
+            # A rerun after finish_run_journal failed must not queue the tracks twice.
+            await self.my_mongo.mark_run_step(target.playlist_id, "queue")
+        await self.my_mongo.finish_run_journal(target.playlist_id)
+
+    async def precompute_next(self) -> None:
+        await precompute_playlists(self.my_mongo, self.targets, self.seed)
+
+    def runs(self) -> Iterator[tuple[PlaylistTarget, list[str], RunJournal | None]]:
+        return zip(self.targets, self.selections, self.journals, strict=True)
+
+
+async def precompute_playlists(
+    my_mongo: AsyncDB, targets: list[PlaylistTarget], seed: int | None
+) -> None:
+    """Store the next run's selections while nothing is waiting on us."""
+    next_selections = await select_playlists(my_mongo, targets, seed, [None] * len(targets))
+    for target, uris in zip(targets, next_selections, strict=True):
+        await my_mongo.save_pending_plan(uris, describe_selection(target), target.playlist_id)
+
+
+def run_summary(
+    mode: Literal["refresh", "export"],
+    started_at: datetime,
+    timings: Mapping[str, PhaseTiming],
+    sp_client: Client,
+    error: Exception | None,
+) -> RunSummary:
+    """Summarize one account's run for the history --stats reports on."""
+    return {
+        "started_at": started_at,
+        "mode": mode,
+        "status": "ok" if error is None else "error",
+        "error": None if error is None else repr(error),
+        "duration": (datetime.now(UTC) - started_at).total_seconds(),
+        "phases": {name: timing["end"] - timing["start"] for name, timing in timings.items()},
+        "requests": sp_client.request_count,
+        "rate_limited": sp_client.rate_limited_count,
+        "tracks_synced": sp_client.tracks_synced,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def record_run(my_mongo: AsyncDB, summary: RunSummary) -> None:
+    """Store the run in the history --stats reads; losing one summary never fails a run."""
+    try:
+        await my_mongo.save_run(summary)
+    except PyMongoError as e:
+        logger.warning("Could not record the run summary: %s", e)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime
+from functools import partial
+from typing import TypedDict
+
+from pymongo import AsyncMongoClient
+
+from spotify.async_db import AsyncDB
+from spotify.auth import Auth
+from spotify.client import Client
+from spotify.phases import PhaseGraph
+from spotify.runner import PlaylistRefresh, record_run, run_summary, sync_library
+from spotify.schema import UserConfig, UsersConfig
+
+
+class UserReport(TypedDict):
+    user_id: str
+    # Seconds spent in each phase that finished: sync and the PlaylistRefresh phases.
+    phases: dict[str, float]
+    total: float
+    error: str | None
+
+
+def user_report(
+    user_id: str, phases: dict[str, float], total: float, failure: Exception | None
+) -> UserReport:
+    error = None if failure is None else str(failure) or type(failure).__name__
+    return {"user_id": user_id, "phases": phases, "total": total, "error": error}
+
+
+class Account:
+    """One user's DB partition, token store and API client."""
+
+    def __init__(
+        self, config: UserConfig, my_mongo: AsyncDB, auth: Auth, sp_client: Client
+    ) -> None:
+        self.config = config
+        self.db = my_mongo
+        self.auth = auth
+        self.client = sp_client
+
+
+class Scheduler:
+    """Refresh the playlists of many Spotify accounts from one process.
+
+    All accounts share one MongoDB connection pool and one request semaphore, so Spotify
+    traffic stays within max_concurrent_requests however many accounts run; at most
+    max_concurrent_users accounts are worked on at the same time. A failing account, including
+    one whose MongoDB check or token load fails, is reported and does not stop the others.
+    """
+
+    def __init__(
+        self,
+        config: UsersConfig,
+        update_cache: bool = False,
+        precompute: bool = False,
+        seed: int | None = None,
+    ) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.update_cache = update_cache
+        self.precompute = precompute
+        self.seed = seed
+        self.user_sem = asyncio.Semaphore(config.max_concurrent_users)
+        self.request_sem = asyncio.Semaphore(config.max_concurrent_requests)
+        self.logger.debug(
+            "Initialized Scheduler: users=%d max_concurrent_users=%d max_concurrent_requests=%d",
+            len(config.users),
+            config.max_concurrent_users,
+            config.max_concurrent_requests,
+        )
+
+    async def open_account(self, user: UserConfig, mongo_client: AsyncMongoClient) -> Account:
+        my_mongo = AsyncDB(user.user_id, mongo_client)
+        if not await my_mongo.check_connection():
+            raise ConnectionError("MongoDB is not available")
+        sp_auth = Auth(user.user_id)
+        await sp_auth.load_or_authenticate_tokens()
+        sp_client = Client(sp_auth, my_mongo, request_sem=self.request_sem)
+        return Account(user, my_mongo, sp_auth, sp_client)
+
+    async def open_accounts(self, mongo_client: AsyncMongoClient) -> list[Account | UserReport]:
+        """Open every account in config order; one that fails to open becomes its failed report."""
+        opened: list[Account | UserReport] = []
+        # Sequential on purpose: the interactive OAuth flow listens on a single local port.
+        for user in self.config.users:
+            started = time.perf_counter()
+            try:
+                opened.append(await self.open_account(user, mongo_client))
+            except Exception as exc:
+                self.logger.exception("Opening the account of user %s failed", user.user_id)
+                opened.append(user_report(user.user_id, {}, time.perf_counter() - started, exc))
+        return opened
+
+    async def run_account(self, account: Account) -> UserReport:
+        """Run one account's sync and refresh as the same phases a single-account run uses.
+
+        MongoDB and the tokens are already checked by open_accounts, so the refresh phases
+        only wait for the library sync. The run summary goes to the account's own runs
+        collection, like a single-account run's.
+        """
+        user_id = account.config.user_id
+        graph = PhaseGraph()
+        graph.add("sync", partial(sync_library, account.db, account.client, self.update_cache))
+        PlaylistRefresh(
+            account.db, account.client, account.config.playlists, self.seed, self.precompute
+        ).add_phases(graph, library_ready=("sync",))
+        failure: Exception | None = None
+        async with self.user_sem:
+            self.logger.info("Refreshing playlists for user %s", user_id)
+            started_at = datetime.now(UTC)
+            started = time.perf_counter()
+            try:
+                async with account.client:
+                    await graph.run()
+            except Exception as exc:
+                self.logger.exception("Refreshing playlists for user %s failed", user_id)
+                failure = exc
+            total = time.perf_counter() - started
+            await record_run(
+                account.db,
+                run_summary("refresh", started_at, graph.timings, account.client, failure),
+            )
+        phases = {name: timing["end"] - timing["start"] for name, timing in graph.timings.items()}
+        return user_report(user_id, phases, total, failure)
+
+    def log_reports(self, reports: list[UserReport]) -> None:
+        for report in reports:
+            self.logger.info(
+                "user=%s total=%.2fs %s status=%s",
+                report["user_id"],
+                report["total"],
+                " ".join(f"{name}={seconds:.2f}s" for name, seconds in report["phases"].items()),
+                "ok" if report["error"] is None else f"failed ({report['error']})",
+            )
+
+    async def run(self) -> list[UserReport]:
+        mongo_client = AsyncDB.create_client()
+        try:
+            opened = await self.open_accounts(mongo_client)
+            ran = iter(
+                await asyncio.gather(
+                    *(self.run_account(item) for item in opened if isinstance(item, Account))
+                )
+            )
+            # Back in config order, with the accounts that failed to open in their place.
+            reports = [next(ran) if isinstance(item, Account) else item for item in opened]
+        finally:
+            await mongo_client.close()
+        self.log_reports(reports)
+        return reports
@@ -1,7 +1,10 @@
 from datetime import UTC, date, datetime
-from typing import Annotated, Any, Literal, TypedDict
+from typing import Annotated, Any, Literal, Self, TypedDict
 
-from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from spotify.helpers import parse_duration
+from spotify.options import MongoCompressor, MongoReadPreference, SelectionMode
 
 type HeadersType = dict[str, str]
 type ReasonType = Literal["market", "product", "explicit"]
@@ -11,6 +14,7 @@ type ItemType = Literal["track", "episode", "show", "audiobook"]
 type OwnerType = Literal["user"]
 type PlaylistType = Literal["playlist"]
 type CopyrightType = Literal["C", "P"]
+type RunStep = Literal["select", "clear", "populate", "played", "queue"]
 
 
 class Copyright(BaseModel):
@@ -97,6 +101,142 @@ class SpotifySecrets(BaseModel):
     model_config = ConfigDict(title="SpotifySecrets", extra="forbid")
 
 
+class SelectionWeights(BaseModel):
+    recency: float = Field(
+        default=1.0, ge=0, description="Weight of the time-since-played term (0 to 1)"
+    )
+    recency_half_life_days: float = Field(
+        default=30.0, gt=0, description="Days after which the time-since-played term reaches 0.5"
+    )
+    popularity: float = Field(
+        default=0.25, ge=0, description="Weight of Spotify popularity scaled to 0-1"
+    )
+    never_played: float = Field(
+        default=2.0, ge=0, description="Extra weight for tracks that were never played"
+    )
+
+    model_config = ConfigDict(title="SelectionWeights", extra="forbid")
+
+
+class MongoSettings(BaseModel):
+    uri: str | None = Field(
+        None, description="Full connection string; replaces hosts and the MONGO_INITDB_ROOT_* login"
+    )
+    hosts: list[str] = Field(
+        default=["localhost:27017"], min_length=1, description="host:port seeds of the deployment"
+    )
+    replica_set: str | None = Field(None, description="Replica set name to connect to")
+    max_pool_size: int | None = Field(
+        None, ge=1, description="Connections per server (maxPoolSize)"
+    )
+    min_pool_size: int | None = Field(
+        None, ge=0, description="Connections kept open while idle (minPoolSize)"
+    )
+    max_idle_time_ms: int | None = Field(
+        default=50_000, ge=1, description="Close pooled connections idle for longer than this"
+    )
+    compressors: list[MongoCompressor] = Field(
+        default=[], description="Wire compressors to offer the server, in order of preference"
+    )
+    zlib_compression_level: int | None = Field(
+        None, ge=-1, le=9, description="Level used when zlib is negotiated"
+    )
+    connect_timeout_ms: int | None = Field(None, ge=1, description="TCP connect timeout")
+    server_selection_timeout_ms: int | None = Field(
+        None, ge=1, description="How long an operation waits for a usable server"
+    )
+    socket_timeout_ms: int | None = Field(None, ge=1, description="Per-operation socket timeout")
+    sync_write_concern: int | Literal["majority"] | None = Field(
+        None, description="Write concern 'w' for library syncs; unset uses the client default"
+    )
+    sync_journal: bool | None = Field(
+        None, description="Wait for the journal on library sync writes"
+    )
+    read_preference: MongoReadPreference | None = Field(
+        None, description="Where exports read from; selections always read the primary"
+    )
+
+    model_config = ConfigDict(title="MongoSettings", extra="forbid")
+
+    @model_validator(mode="after")
+    def _check_settings(self) -> Self:
+        if (
+            self.min_pool_size is not None
+            and self.max_pool_size is not None
+            and self.min_pool_size > self.max_pool_size
+        ):
+            raise ValueError("min_pool_size may not exceed max_pool_size")
+        if isinstance(self.sync_write_concern, int) and self.sync_write_concern < 1:
+            raise ValueError("sync_write_concern must acknowledge writes (w >= 1)")
+        return self
+
+
+class PlaylistTarget(BaseModel):
+    name: str = Field(..., description="Label used in logs")
+    playlist_id: str = Field(..., description="Spotify ID of the playlist to refresh")
+    size: int = Field(default=100, ge=1, le=100, description="Number of tracks to select")
+    selection: SelectionMode = Field(default="lrp", description="Track selection mode")
+    duration: int | None = Field(
+        None,
+        gt=0,
+        description="Target length in milliseconds instead of a size; accepts '3h'-style text",
+    )
+    queue: bool = Field(default=False, description="Also add the tracks to the playback queue")
+
+    model_config = ConfigDict(title="PlaylistTarget", extra="forbid")
+
+    @field_validator("duration", mode="before")
+    @classmethod
+    def _parse_duration(cls, value: object) -> object:
+        return parse_duration(value) if isinstance(value, str) else value
+
+
+class PlaylistsConfig(BaseModel):
+    playlists: list[PlaylistTarget] = Field(
+        ..., min_length=1, description="Playlists refreshed by a single run"
+    )
+
+    model_config = ConfigDict(title="PlaylistsConfig", extra="forbid")
+
+    @model_validator(mode="after")
+    def _check_targets(self) -> Self:
+        playlist_ids = [target.playlist_id for target in self.playlists]
+        if len(set(playlist_ids)) != len(playlist_ids):
+            raise ValueError("Each playlist may only be listed once")
+        if sum(target.queue for target in self.playlists) > 1:
+            raise ValueError("At most one playlist may set queue")
+        return self
+
+
+class UserConfig(PlaylistsConfig):
+    user_id: str = Field(
+        ...,
+        pattern=r"^[A-Za-z0-9_-]+$",
+        description="Account label; names the user's collections and token file",
+    )
+
+    model_config = ConfigDict(title="UserConfig", extra="forbid")
+
+
+class UsersConfig(BaseModel):
+    users: list[UserConfig] = Field(..., min_length=1, description="Accounts refreshed by a run")
+    max_concurrent_users: int = Field(
+        default=4, ge=1, description="How many accounts are processed at the same time"
+    )
+    max_concurrent_requests: int = Field(
+        default=10, ge=1, description="Spotify requests in flight across all accounts"
+    )
+
+    model_config = ConfigDict(title="UsersConfig", extra="forbid")
+
+    @model_validator(mode="after")
+    def _check_users(self) -> Self:
+        user_ids = [user.user_id for user in self.users]
+        if len(set(user_ids)) != len(user_ids):
+            raise ValueError("Each user_id may only be listed once")
+        return self
+
+
 class ExternalUrls(BaseModel):
     spotify: str = Field("", description="Canonical Spotify Web API URL for this object")
 
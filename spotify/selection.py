@@ -0,0 +1,171 @@
+import logging
+import math
+import time
+from collections.abc import Iterable, Mapping
+from typing import Self
+
+import numpy as np
+import numpy.typing as npt
+
+from spotify.schema import SelectionWeights
+
+type FloatArray = npt.NDArray[np.floating]
+type IntArray = npt.NDArray[np.int64]
+
+SECONDS_PER_DAY = 86_400.0
+# Floor applied to every score so no eligible track ever becomes impossible to draw.
+MIN_SCORE = 1e-6
+# How many candidates weighted_sample aims to keep per requested item before ranking them.
+OVERSAMPLE = 4
+# Past this the float32 cut-off is infinite and every eligible row has arrived.
+MAX_CUTOFF = float(np.finfo(np.float32).max)
+
+
+class TrackSnapshot:
+    """Compact column snapshot of the track library.
+
+    One row per track; a track's row number is its "uri index". Columns:
+    played_at as epoch seconds (-inf when never played, so its age is +inf), popularity
+    (0-100) and the primary artist as an integer code into ``artist_ids``.
+    """
+
+    def __init__(
+        self,
+        uris: list[str],
+        played_at: FloatArray,
+        popularity: FloatArray,
+        artist_codes: IntArray,
+        artist_ids: list[str],
+    ) -> None:
+        self.uris = uris
+        self.played_at = played_at
+        self.popularity = popularity
+        self.artist_codes = artist_codes
+        self.artist_ids = artist_ids
+        self.uri_index = {uri: i for i, uri in enumerate(uris)}
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Mapping[str, object]]) -> Self:
+        """Build a snapshot from projected track documents.
+
+        Each document needs ``uri`` and may carry ``played_at`` (epoch milliseconds),
+        ``popularity`` and ``artist_id``.
+        """
+        uris: list[str] = []
+        played_at: list[float] = []
+        popularity: list[float] = []
+        artist_codes: list[int] = []
+        artist_lookup: dict[str, int] = {}
+        for doc in docs:
+            uris.append(str(doc["uri"]))
+            played_ms = doc.get("played_at")
+            played_at.append(
+                float(played_ms) / 1000.0 if isinstance(played_ms, int | float) else -math.inf
+            )
+            pop = doc.get("popularity")
+            popularity.append(float(pop) if isinstance(pop, int | float) else 0.0)
+            artist_id = str(doc.get("artist_id") or "")
+            artist_codes.append(artist_lookup.setdefault(artist_id, len(artist_lookup)))
+        return cls(
+            uris=uris,
+            played_at=np.asarray(played_at, dtype=np.float64),
+            popularity=np.asarray(popularity, dtype=np.float32),
+            artist_codes=np.asarray(artist_codes, dtype=np.int64),
+            artist_ids=list(artist_lookup),
+        )
+
+    def mark_played(self, uris: Iterable[str], played_at: float) -> None:
+        """Keep the snapshot in step with DB.update_played_at without reloading it."""
+        rows = [self.uri_index[uri] for uri in uris if uri in self.uri_index]
+        self.played_at[rows] = played_at
+
+
+def score_tracks(snapshot: TrackSnapshot, weights: SelectionWeights, now: float) -> FloatArray:
+    """Return a positive selection weight per track.
+
+    The recency term rises from 0 (just played) towards 1 with the configured half-life,
+    never-played tracks get the full recency term plus their own boost, and popularity
+    contributes linearly. Computed in float32 without boolean-mask assignments: day-scale
+    ages do not need more precision and the whole pass stays a handful of vector ops.
+    """
+    never_played = np.isneginf(snapshot.played_at)
+    age_days = ((now - snapshot.played_at) / SECONDS_PER_DAY).astype(np.float32)
+    np.maximum(age_days, 0.0, out=age_days)
+    # decay = 2 ** (-age / half_life); +inf ages (never played) decay to exactly 0
+    decay = np.exp(age_days * np.float32(-math.log(2) / weights.recency_half_life_days))
+
+    recency_weight = np.float32(weights.recency)
+    scores = recency_weight - recency_weight * decay
+    scores += snapshot.popularity * np.float32(weights.popularity / 100.0)
+    scores += never_played * np.float32(weights.never_played)
+    np.maximum(scores, np.float32(MIN_SCORE), out=scores)
+    return scores
+
+
+def weighted_sample(scores: FloatArray, no_items: int, rng: np.random.Generator) -> IntArray:
+    """Draw no_items row indices without replacement, proportionally to scores.
+
+    Exponential race (Efraimidis-Spirakis): every row arrives at E / score with E ~ Exp(1),
+    and the no_items earliest arrivals win. Instead of computing E for every row, pick a
+    cut-off T that about OVERSAMPLE * no_items rows beat, test "arrival < T" as
+    U > exp(-T * score) in one vectorized float32 pass, and only rank the survivors exactly.
+    T doubles in the rare case fewer than no_items rows survive, until it overflows and every
+    eligible row is a candidate. Rows with a score of 0 never arrive. The result is in draw
+    order.
+    """
+    eligible = int(np.count_nonzero(scores > 0))
+    no_items = min(no_items, eligible)
+    if no_items == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # U in (0, 1]: a draw of exactly 0 could never beat a threshold, nor be ranked by log(U).
+    uniforms = 1 - rng.random(scores.shape[0], dtype=np.float32)
+    cutoff = OVERSAMPLE * no_items / float(scores.sum(dtype=np.float64))
+    candidates = np.flatnonzero(scores > 0)
+    while cutoff <= MAX_CUTOFF:
+        thresholds = np.exp(scores * np.float32(-cutoff))
+        survivors = np.flatnonzero(uniforms > thresholds)
+        if survivors.size >= no_items or survivors.size == eligible:
+            candidates = survivors
+            break
+        cutoff *= 2
+
+    cand_scores = scores[candidates].astype(np.float64)
+    arrivals = -np.log(uniforms[candidates].astype(np.float64)) / cand_scores
+    order = np.argsort(arrivals)[:no_items]
+    return candidates[order].astype(np.int64)
+
+
+class WeightedSelector:
+    """Vectorized weighted track selection over a TrackSnapshot."""
+
+    def __init__(
+        self,
+        snapshot: TrackSnapshot,
+        weights: SelectionWeights | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.snapshot = snapshot
+        self.weights = weights or SelectionWeights()
+        self.rng = np.random.default_rng(seed)
+        self.logger.debug(
+            "Initialized WeightedSelector: tracks=%d weights=%s seed=%s",
+            len(snapshot),
+            self.weights.model_dump(),
+            seed,
+        )
+
+    def select(
+        self, no_items: int, now: float | None = None, exclude: Iterable[str] = ()
+    ) -> list[str]:
+        now = time.time() if now is None else now
+        scores = score_tracks(self.snapshot, self.weights, now)
+        uri_index = self.snapshot.uri_index
+        excluded_rows = [uri_index[uri] for uri in exclude if uri in uri_index]
+        scores[excluded_rows] = 0.0
+        rows = weighted_sample(scores, no_items, self.rng)
+        return [self.snapshot.uris[row] for row in rows]
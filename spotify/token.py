@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import TypedDict
+from typing import Self, TypedDict
 
 from pydantic import BaseModel, PrivateAttr
 
@@ -15,15 +15,16 @@ class TokenError(Exception):
     """Raised when token persistence or loading fails."""
 
 
-def _default_token_path() -> Path:
+def _default_token_path(user_id: str | None = None) -> Path:
     """Return a writable path for storing tokens.
 
     Uses XDG cache dir if available, else falls back to ~/.cache/randomness/tokens.json.
-    This avoids writing into the installed package directory.
+    This avoids writing into the installed package directory. Each user_id gets its own
+    tokens-<user_id>.json next to it.
     """
     cache_dir = Path.home() / ".cache" / "randomness"
     cache_dir.mkdir(parents=True, exist_ok=True)
-    return cache_dir / "tokens.json"
+    return cache_dir / ("tokens.json" if user_id is None else f"tokens-{user_id}.json")
 
 
 class Token(BaseModel):
@@ -39,6 +40,23 @@ class Token(BaseModel):
     # Private attribute (sunder name) for persistence path.
     _file_path: Path = PrivateAttr(default_factory=_default_token_path)
 
+    @classmethod
+    def for_user(
+        cls,
+        user_id: str | None,
+        access_token: str = "",
+        refresh_token: str = "",
+        token_expires_at: float = 0.0,
+    ) -> Self:
+        """Build a token persisted in the given user's token file."""
+        token = cls(
+            access_token=access_token,
+            refresh_token=refresh_token,
+            token_expires_at=token_expires_at,
+        )
+        token._file_path = _default_token_path(user_id)
+        return token
+
     def load_tokens(self) -> None:
         """Load token values from disk or raise TokenError if missing/corrupt."""
         if not self._file_path.exists():
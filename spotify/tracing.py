@@ -0,0 +1,266 @@
+"""Trace spans for one run, written as an OpenTelemetry (OTLP/JSON) file.
+
+Run from the repository root to print a trace as a waterfall:
+
+    python -m spotify.tracing trace-20260131T080000.json
+"""
+
+import argparse
+import functools
+import inspect
+import json
+import logging
+import secrets
+import time
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self, cast
+
+type AttributeValue = str | int | float | bool
+
+SERVICE_NAME = "randomness"
+STATUS_OK = 1
+STATUS_ERROR = 2
+WATERFALL_WIDTH = 60
+
+
+class Span:
+    __slots__ = ("attributes", "end_ns", "error", "name", "parent_id", "span_id", "start_ns")
+
+    recording = True
+
+    def __init__(self, name: str, parent_id: str | None) -> None:
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: dict[str, AttributeValue] = {}
+        self.error: str | None = None
+
+    def set(self, **attributes: AttributeValue | None) -> None:
+        self.attributes.update(
+            {key: value for key, value in attributes.items() if value is not None}
+        )
+
+
+class _NoSpan(Span):
+    """Stand-in returned while tracing is off, so callers can set attributes unconditionally."""
+
+    recording = False
+
+    def __init__(self) -> None:
+        super().__init__("", None)
+
+    def set(self, **attributes: AttributeValue | None) -> None:
+        return None
+
+
+NO_SPAN = _NoSpan()
+# The span a task is in; tasks inherit it from the code that started them.
+CURRENT_SPAN: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Collect the spans of one run and write them to an OTLP/JSON file on exit.
+
+    While no tracer is active, span() costs one context variable lookup.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.trace_id = secrets.token_hex(16)
+        self.spans: list[Span] = []
+        self.token: Token[Tracer | None] | None = None
+
+    def __enter__(self) -> Self:
+        self.token = ACTIVE_TRACER.set(self)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self.token is not None:
+            ACTIVE_TRACER.reset(self.token)
+        self.path.write_text(json.dumps(self.to_otlp()))
+        self.logger.info("Wrote %d spans to %s", len(self.spans), self.path)
+
+    def to_otlp(self) -> dict[str, object]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": encode_attributes({"service.name": SERVICE_NAME})},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self.encode_span(span) for span in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def encode_span(self, span: Span) -> dict[str, object]:
+        status: dict[str, object] = {"code": STATUS_OK}
+        if span.error is not None:
+            status = {"code": STATUS_ERROR, "message": span.error}
+        return {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": encode_attributes(span.attributes),
+            "status": status,
+        }
+
+
+ACTIVE_TRACER: ContextVar[Tracer | None] = ContextVar("active_tracer", default=None)
+
+
+def encode_attributes(attributes: Mapping[str, AttributeValue]) -> list[dict[str, object]]:
+    encoded: list[dict[str, object]] = []
+    for key, value in attributes.items():
+        match value:
+            case bool():
+                typed: dict[str, object] = {"boolValue": value}
+            case int():
+                typed = {"intValue": str(value)}
+            case float():
+                typed = {"doubleValue": value}
+            case _:
+                typed = {"stringValue": str(value)}
+        encoded.append({"key": key, "value": typed})
+    return encoded
+
+
+@contextmanager
+def span(name: str, **attributes: AttributeValue | None) -> Iterator[Span]:
+    """Record the block as a child of the current span, or do nothing while tracing is off."""
+    tracer = ACTIVE_TRACER.get()
+    if tracer is None:
+        yield NO_SPAN
+        return
+    parent = CURRENT_SPAN.get()
+    current = Span(name, parent.span_id if parent else None)
+    current.set(**attributes)
+    token = CURRENT_SPAN.set(current)
+    try:
+        yield current
+    except BaseException as error:
+        current.error = repr(error)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        CURRENT_SPAN.reset(token)
+        tracer.spans.append(current)
+
+
+def current_span() -> Span:
+    return CURRENT_SPAN.get() or NO_SPAN
+
+
+def traced[F: Callable[..., Any]](name: str) -> Callable[[F], F]:
+    """Run every call of the decorated function, sync or async, in a span."""
+
+    def decorate(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return cast(F, async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorate
+
+
+def traced_methods[C: type](prefix: str) -> Callable[[C], C]:
+    """Trace every public coroutine method a class defines as ``<prefix>.<method>``."""
+
+    def decorate(cls: C) -> C:
+        for attr, value in list(vars(cls).items()):
+            if not attr.startswith("_") and inspect.iscoroutinefunction(value):
+                setattr(cls, attr, traced(f"{prefix}.{attr}")(value))
+        return cls
+
+    return decorate
+
+
+def load_spans(path: Path) -> list[dict[str, Any]]:
+    document = json.loads(path.read_text())
+    return [
+        record
+        for resource in document["resourceSpans"]
+        for scope in resource["scopeSpans"]
+        for record in scope["spans"]
+    ]
+
+
+def waterfall(spans: list[dict[str, Any]], width: int = WATERFALL_WIDTH) -> list[str]:
+    """Render spans as text bars on a shared time axis, children under their parent."""
+    if not spans:
+        return []
+    start = min(int(record["startTimeUnixNano"]) for record in spans)
+    end = max(int(record["endTimeUnixNano"]) for record in spans)
+    scale = width / max(end - start, 1)
+    children: dict[str, list[dict[str, Any]]] = {}
+    for record in sorted(spans, key=lambda record: int(record["startTimeUnixNano"])):
+        children.setdefault(record["parentSpanId"], []).append(record)
+    known = {record["spanId"] for record in spans}
+    roots = [
+        record for parent, group in children.items() if parent not in known for record in group
+    ]
+    lines: list[str] = []
+
+    def render(record: dict[str, Any], depth: int) -> None:
+        span_start = int(record["startTimeUnixNano"]) - start
+        span_end = int(record["endTimeUnixNano"]) - start
+        offset = int(span_start * scale)
+        length = max(int(span_end * scale) - offset, 1)
+        bar = " " * offset + "#" * length
+        failed = " !" if record["status"].get("code") == STATUS_ERROR else ""
+        attributes = " ".join(
+            f"{item['key']}={next(iter(item['value'].values()))}" for item in record["attributes"]
+        )
+        label = f"{'  ' * depth}{record['name']}"
+        lines.append(
+            f"{label:<40.40} {bar:<{width}} {(span_end - span_start) / 1e6:9.1f}ms"
+            f"{failed} {attributes}".rstrip()
+        )
+        for child in children.get(record["spanId"], []):
+            render(child, depth + 1)
+
+    for root in sorted(roots, key=lambda record: int(record["startTimeUnixNano"])):
+        render(root, 0)
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path, help="Trace file written by main.py --trace")
+    parser.add_argument("--width", type=int, default=WATERFALL_WIDTH)
+    args = parser.parse_args()
+    for line in waterfall(load_spans(args.path), args.width):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
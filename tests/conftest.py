@@ -3,9 +3,9 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 from dotenv import load_dotenv
 
+from spotify.async_db import AsyncDB
 from spotify.auth import Auth
 from spotify.client import Client
-from spotify.db import DB
 
 load_dotenv()
 
@@ -24,7 +24,8 @@ def _setup_env(monkeypatch: pytest.MonkeyPatch) -> None:
 @pytest.fixture
 def mock_db() -> MagicMock:
     """Mock the DB class."""
-    db = MagicMock(spec=DB)
+    db = MagicMock(spec=AsyncDB)
+    db.load_sync_pages.return_value = {}
     return db
 
 
@@ -0,0 +1,990 @@
+# pylint: disable=redefined-outer-name
+import gzip
+import json
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Self, cast
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo import DeleteOne, InsertOne, ReadPreference, WriteConcern
+from pymongo.errors import AutoReconnect
+
+from spotify.async_db import AsyncDB
+from spotify.export import COLUMNAR_PROJECTION
+from spotify.options import SelectionMode
+from spotify.schema import ItemV2, Track
+
+TEST_PLAYLIST_SIZE = 5
+LIBRARY_VERSION = 7
+EXPORT_COUNT = 5
+CHANGE_SEQ = 12
+EXPORT_MARK = 9
+EXPECTED_RECORD_BATCHES = 3
+EXPECTED_IMPORT_BATCHES = 3
+STREAMED_TRACKS = 2
+EXPECTED_RANDOM_COUNT = 2
+EXPECTED_TRACK_PIPELINE_SIZE = 4
+EXPECTED_SUCCESS_RETRIES = 3
+EXPECTED_MAX_RETRIES = 5
+EXPECTED_ROW_GROUPS = 2
+EXPECTED_INDEX_COUNT = 5
+ROTATION_CURSOR = 0.75
+NEW_CYCLE_CURSOR = 0.1
+ROTATION_RETURN_CURSOR = 0.5
+THREE_HOURS_MS = 3 * 60 * 60 * 1000
+
+
+class FakeCursor:
+    """Minimal AsyncCursor: chainable sort/limit, to_list and async iteration."""
+
+    def __init__(self, docs: list[dict[str, object]]) -> None:
+        self.docs = docs
+        self.sort = MagicMock(return_value=self)
+        self.limit = MagicMock(return_value=self)
+
+    async def to_list(self) -> list[dict[str, object]]:
+        return self.docs
+
+    def __aiter__(self) -> Self:
+        self.iterator = iter(self.docs)
+        return self
+
+    async def __anext__(self) -> dict[str, object]:
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+@pytest.fixture
+def db_instance(monkeypatch: pytest.MonkeyPatch) -> AsyncDB:
+    monkeypatch.setenv("MONGO_INITDB_ROOT_USERNAME", "user")
+    monkeypatch.setenv("MONGO_INITDB_ROOT_PASSWORD", "pass")
+    monkeypatch.setenv("MONGO_INITDB_DATABASE", "test_db")
+    with patch("spotify.async_db.AsyncMongoClient"):
+        return AsyncDB()
+
+
+@pytest.fixture
+def mock_coll(db_instance: AsyncDB) -> AsyncMock:
+    coll = AsyncMock()
+    # find() is synchronous in the async API; only iterating the cursor awaits
+    coll.find = MagicMock(return_value=FakeCursor([]))
+    mock_db = cast(MagicMock, db_instance.mongo_db)
+    mock_db.__getitem__.return_value = coll
+    return coll
+
+
+@pytest.mark.asyncio
+async def test_check_connection_skips_current_index_spec(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test a warm startup costs one server_info and one find_one."""
+    mock_client = cast(MagicMock, db_instance.mongo_client)
+    mock_client.server_info = AsyncMock(return_value={"version": "8.0"})
+    mock_coll.find_one.return_value = {"_id": "index_spec", "version": AsyncDB.INDEX_SPEC_VERSION}
+
+    assert await db_instance.check_connection() is True
+    mock_client.server_info.assert_awaited_once()
+    mock_coll.create_indexes.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test sync_tracks tombstones missing tracks, upserts new ones and bumps the version."""
+    mock_coll.find.return_value = FakeCursor([{"_id": "old", "uri": "old_uri"}])
+    mock_coll.find_one.return_value = None
+    mock_coll.find_one_and_update.return_value = {"_id": "change_seq", "value": CHANGE_SEQ}
+    tracks: list[ItemV2] = [
+        Track.model_construct(uri="new_uri", type="track", id="new_uri", name="Track 1")
+    ]
+
+    await db_instance.sync_tracks(tracks)
+
+    mock_coll.delete_many.assert_any_await({"uri": {"$in": ["old_uri"]}})
+    tombstone = mock_coll.insert_many.call_args[0][0][0]
+    assert tombstone["_id"] == "tombstone:old_uri"
+    assert tombstone["change_seq"] == CHANGE_SEQ
+    upsert = mock_coll.bulk_write.call_args[0][0][0]
+    assert upsert._doc["$set"]["change_seq"] == CHANGE_SEQ
+    assert mock_coll.update_one.call_args[0][0] == {"_id": "library"}
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_skips_unchanged(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test tracks whose stored content_hash matches are not written again."""
+    track = Track.model_construct(uri="uri1", type="track", id="uri1", name="Track 1")
+    mock_coll.find.return_value = FakeCursor(
+        [{"uri": "uri1", "content_hash": AsyncDB.content_hash(track)}]
+    )
+
+    await db_instance.sync_tracks([track])
+
+    mock_coll.bulk_write.assert_not_called()
+    mock_coll.find_one_and_update.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_track_pages(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test pages are upserted as they come and unlisted tracks are tombstoned at the end."""
+    kept = Track.model_construct(uri="kept_uri", type="track", id="kept_uri", name="Kept")
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"_id": "kept", "uri": "kept_uri", "content_hash": AsyncDB.content_hash(kept)},
+            {"_id": "old", "uri": "old_uri"},
+        ]
+    )
+    mock_coll.find_one.return_value = None
+    mock_coll.find_one_and_update.return_value = {"_id": "change_seq", "value": CHANGE_SEQ}
+    new = Track.model_construct(uri="new_uri", type="track", id="new_uri", name="New")
+
+    async def pages() -> AsyncIterator[list[ItemV2]]:
+        yield [kept]
+        yield [new]
+
+    assert await db_instance.sync_track_pages(pages()) == STREAMED_TRACKS
+
+    mock_coll.find_one_and_update.assert_awaited_once()
+    mock_coll.bulk_write.assert_awaited_once()
+    (upserts,), _ = mock_coll.bulk_write.call_args
+    assert [upsert._filter["uri"] for upsert in upserts] == ["new_uri"]
+    mock_coll.delete_many.assert_any_await({"_id": {"$in": ["tombstone:new_uri"]}})
+    mock_coll.delete_many.assert_any_await({"uri": {"$in": ["old_uri"]}})
+    tombstone = mock_coll.insert_many.call_args[0][0][0]
+    assert tombstone["_id"] == "tombstone:old_uri"
+    assert mock_coll.update_one.call_args[0][0] == {"_id": "library"}
+
+
+@pytest.mark.asyncio
+async def test_export_tracks_incremental(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test an incremental export writes changes and tombstones since the mark, then moves it."""
+    monkeypatch.chdir(tmp_path)
+    docs = {
+        "export_mark:summary": {"_id": "export_mark:summary", "change_seq": EXPORT_MARK},
+        "change_seq": {"_id": "change_seq", "value": CHANGE_SEQ},
+    }
+    mock_coll.find_one.side_effect = lambda query: docs.get(query["_id"])
+    mock_coll.find.side_effect = [
+        FakeCursor([{"_id": "id1", "name": "Changed"}]),
+        FakeCursor([{"track_id": "id2", "uri": "uri2", "kind": "tombstone"}]),
+    ]
+
+    path = await db_instance.export_tracks("ndjson", incremental=True)
+
+    assert path.name.endswith(f"-since-{EXPORT_MARK}.ndjson")
+    assert mock_coll.find.call_args_list[0][0][0] == {"change_seq": {"$gt": EXPORT_MARK}}
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [row["_id"] for row in rows] == ["id1", "id2"]
+    assert rows[1]["deleted"] is True
+    mark_update = mock_coll.update_one.call_args[0]
+    assert mark_update[0] == {"_id": "export_mark:summary"}
+    assert mark_update[1]["$set"]["change_seq"] == CHANGE_SEQ
+    # No --export-full backup has been taken, so nothing else needs the tombstones
+    mock_coll.delete_many.assert_awaited_once_with(
+        {"kind": "tombstone", "change_seq": {"$lte": CHANGE_SEQ}}
+    )
+
+
+@pytest.mark.asyncio
+async def test_export_tracks_keeps_full_backup_chain(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a summary export neither moves the --export-full mark nor drops its tombstones."""
+    monkeypatch.chdir(tmp_path)
+    meta = {
+        "export_mark:full": {"_id": "export_mark:full", "change_seq": EXPORT_MARK},
+        "change_seq": {"_id": "change_seq", "value": CHANGE_SEQ},
+    }
+    mock_coll.find_one.side_effect = lambda query: meta.get(query["_id"])
+
+    async def save_mark(
+        query: dict[str, str], update: dict[str, dict[str, object]], **_kwargs: object
+    ) -> None:
+        meta[query["_id"]] = {"_id": query["_id"], **update["$set"]}
+
+    mock_coll.update_one.side_effect = save_mark
+    mock_coll.find.side_effect = lambda *_args, **_kwargs: FakeCursor([])
+
+    await db_instance.export_tracks("json")
+    assert meta["export_mark:full"]["change_seq"] == EXPORT_MARK
+    mock_coll.delete_many.assert_awaited_once_with(
+        {"kind": "tombstone", "change_seq": {"$lte": EXPORT_MARK}}
+    )
+
+    path = await db_instance.export_tracks("ndjson", incremental=True, full=True)
+    assert path.name.endswith(f"-since-{EXPORT_MARK}.ndjson")
+    assert meta["export_mark:full"]["change_seq"] == CHANGE_SEQ
+    assert mock_coll.delete_many.call_args[0][0] == {
+        "kind": "tombstone",
+        "change_seq": {"$lte": CHANGE_SEQ},
+    }
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_lrp(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test the default mode samples the LRP index head and marks the tracks played."""
+    cursor = FakeCursor([{"uri": "uri_ex1"}, {"uri": "uri_ex2"}])
+    mock_coll.find.return_value = cursor
+    mock_coll.count_documents.return_value = 100
+
+    result = await db_instance.generate_random_playlist(TEST_PLAYLIST_SIZE)
+
+    assert sorted(result) == ["uri_ex1", "uri_ex2"]
+    cursor.sort.assert_called_once_with([("played_at", 1), ("rand_key", 1)])
+    cursor.limit.assert_called_once_with(AsyncDB.MAX_SIZE_WINDOW)
+    assert mock_coll.update_many.call_args[0][0] == {"uri": {"$in": result}}
+
+
+@pytest.mark.asyncio
+async def test_select_random_tracks_window_exclude(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test the window mode awaits the aggregation and filters excluded uris first."""
+    mock_coll.count_documents.return_value = 100
+    mock_coll.aggregate.return_value = FakeCursor([{"tracks": ["uri_ex3"]}])
+
+    result = await db_instance.select_random_tracks(1, mode="window", exclude=["uri_ex1"])
+
+    assert result == ["uri_ex3"]
+    pipeline = mock_coll.aggregate.call_args[0][0]
+    assert pipeline[0] == {"$match": {"uri": {"$nin": ["uri_ex1"]}}}
+    mock_coll.update_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_generate_weighted_tracks_uses_snapshot(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test the snapshot is loaded once and reused."""
+    mock_coll.aggregate.return_value = FakeCursor(
+        [{"uri": "a", "played_at": None, "popularity": 10}, {"uri": "b", "popularity": 90}]
+    )
+
+    first = await db_instance.generate_weighted_tracks(2, seed=1)
+    second = await db_instance.generate_weighted_tracks(2, seed=1)
+
+    assert sorted(first) == sorted(second) == ["a", "b"]
+    mock_coll.aggregate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_take_pending_plan(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test a plan for the same request and library version is used."""
+    mock_coll.find_one_and_delete.return_value = {
+        "uris": ["uri_ex1"],
+        "selection": "lrp:100",
+        "library_version": LIBRARY_VERSION,
+    }
+    mock_coll.find_one.return_value = {"_id": "library", "version": LIBRARY_VERSION}
+
+    assert await db_instance.take_pending_plan("lrp:100", "daily") == ["uri_ex1"]
+    mock_coll.find_one_and_delete.assert_awaited_once_with({"_id": "pending_plan:daily"})
+
+
+@pytest.mark.asyncio
+async def test_load_run_journal(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test an unfinished run is resumed for the same selection with its completed steps."""
+    mock_coll.find_one.return_value = {
+        "_id": "run_journal:daily",
+        "selection": "lrp:100",
+        "uris": ["uri1"],
+        "steps": {"select": None, "clear": None},
+    }
+
+    journal = await db_instance.load_run_journal("daily", "lrp:100")
+
+    assert journal == {"selection": "lrp:100", "uris": ["uri1"], "steps": ["select", "clear"]}
+    mock_coll.delete_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_load_run_journal_discards_other_selection(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test a journal for another request is dropped and its unplayed rotation tracks returned."""
+    mock_coll.find_one.side_effect = [
+        {"_id": "run_journal:daily", "selection": "rotation:100", "uris": ["uri1"], "steps": {}},
+        None,
+    ]
+
+    assert await db_instance.load_run_journal("daily", "lrp:100") is None
+    mock_coll.delete_one.assert_awaited_once_with({"_id": "run_journal:daily"})
+    mock_coll.bulk_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_export_to_json_streams_batches(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test the export reads a projected cursor and writes every batch as NDJSON."""
+    monkeypatch.chdir(tmp_path)
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"_id": f"id{i}", "href": f"href{i}", "name": f"Track {i}", "artists": []}
+            for i in range(EXPORT_COUNT)
+        ]
+    )
+
+    path = await db_instance.export_to_json("ndjson", batch_size=2)
+
+    assert mock_coll.find.call_args[0][1] == AsyncDB.EXPORT_PROJECTION
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["_id"] for line in lines] == [f"id{i}" for i in range(EXPORT_COUNT)]
+
+
+@pytest.mark.asyncio
+async def test_export_tracks_arrow(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test the Arrow export writes every cursor batch into one IPC file."""
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    mock_coll.find.return_value = FakeCursor([{"_id": f"id{i}"} for i in range(EXPORT_COUNT)])
+
+    path = await db_instance.export_tracks("arrow", batch_size=2)
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        assert reader.num_record_batches == EXPECTED_RECORD_BATCHES
+        assert reader.read_all().num_rows == EXPORT_COUNT
+
+
+@pytest.mark.asyncio
+async def test_import_tracks(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a full export is restored in unordered batches with only the unique index built."""
+    monkeypatch.chdir(tmp_path)
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"_id": f"id{i}", "uri": f"uri{i}", "played_at": None, "change_seq": i}
+            for i in range(EXPORT_COUNT)
+        ]
+    )
+    path = await db_instance.export_to_json("ndjson", full=True)
+    mock_coll.count_documents.return_value = 0
+    mock_coll.list_indexes = AsyncMock(
+        side_effect=lambda: FakeCursor([{"name": "_id_"}, {"name": "uri_1"}, {"name": "rk_1"}])
+    )
+    call_order = MagicMock()
+    call_order.attach_mock(mock_coll.insert_many, "insert_many")
+    call_order.attach_mock(mock_coll.create_indexes, "create_indexes")
+
+    assert await db_instance.import_tracks(path, batch_size=2) == EXPORT_COUNT
+
+    mock_coll.delete_one.assert_awaited_once_with({"_id": "index_spec"})
+    mock_coll.drop_index.assert_any_await("rk_1")
+    assert [
+        index.document["name"] for index in mock_coll.create_indexes.call_args_list[0][0][0]
+    ] == ["uri_1"]
+    assert mock_coll.insert_many.await_count == EXPECTED_IMPORT_BATCHES
+    assert mock_coll.insert_many.call_args.kwargs == {"ordered": False}
+    assert [name for name, _, _ in call_order.mock_calls][-1] == "create_indexes"
+    mock_coll.delete_many.assert_not_called()
+    mock_coll.update_one.assert_any_await(
+        {"_id": "change_seq"}, {"$max": {"value": EXPORT_COUNT - 1}}, upsert=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_import_tracks_rejects_summary_export(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path
+) -> None:
+    """Test an export without whole documents is refused instead of half-restored."""
+    path = tmp_path / "export-2026-01-02.ndjson"
+    path.write_text('{"_id":"id1","href":"href1","name":"Track 1"}\n', encoding="utf-8")
+    mock_coll.count_documents.return_value = 0
+
+    with pytest.raises(ValueError, match="--export-full"):
+        await db_instance.import_tracks(path)
+    mock_coll.insert_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_import_tracks_checks_every_row_first(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path
+) -> None:
+    """Test a bad row anywhere in the file is refused before anything is written."""
+    path = tmp_path / "export-2026-01-02.ndjson"
+    rows = [
+        {"_id": "id1", "uri": "uri1", "played_at": None},
+        {"_id": "id2", "uri": "uri2", "played_at": None},
+        {"_id": "id3", "uri": "uri1", "played_at": None},
+    ]
+    path.write_text("".join(f"{json.dumps(row)}\n" for row in rows), encoding="utf-8")
+    mock_coll.count_documents.return_value = 0
+
+    with pytest.raises(ValueError, match="appears twice"):
+        await db_instance.import_tracks(path, batch_size=2)
+    mock_coll.insert_many.assert_not_called()
+    mock_coll.drop_index.assert_not_called()
+    mock_coll.delete_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_import_tracks_failure_removes_partial_load(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path
+) -> None:
+    """Test a failed insert removes what was loaded and rebuilds the indexes."""
+    path = tmp_path / "export-2026-01-02.ndjson"
+    rows = [{"_id": f"id{i}", "uri": f"uri{i}", "played_at": None} for i in range(EXPORT_COUNT)]
+    path.write_text("".join(f"{json.dumps(row)}\n" for row in rows), encoding="utf-8")
+    mock_coll.count_documents.return_value = 0
+    mock_coll.list_indexes = AsyncMock(side_effect=lambda: FakeCursor([]))
+    mock_coll.insert_many.side_effect = [None, OSError("disk full")]
+
+    with pytest.raises(OSError, match="disk full"):
+        await db_instance.import_tracks(path, batch_size=2)
+
+    mock_coll.delete_many.assert_awaited_once_with({})
+    # The spec is cleared before the load and only written back by a successful build
+    mock_coll.delete_one.assert_awaited_once_with({"_id": "index_spec"})
+    assert mock_coll.create_indexes.call_args[0][0] == list(AsyncDB.INDEX_SPEC)
+    mock_coll.update_one.assert_awaited_once()
+    assert mock_coll.update_one.call_args[0][0] == {"_id": "index_spec"}
+
+
+@pytest.mark.asyncio
+async def test_import_tracks_applies_incremental_export(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path
+) -> None:
+    """Test an incremental full export replaces changed tracks and deletes tombstoned ones."""
+    path = tmp_path / f"export-2026-01-02-since-{EXPORT_MARK}.ndjson"
+    rows = [
+        # uri1 was unliked and liked again since the full export, so it has a new _id
+        {"_id": "id1_reliked", "uri": "uri1", "played_at": None, "change_seq": CHANGE_SEQ},
+        {"_id": "id2", "uri": "uri2", "deleted": True},
+    ]
+    path.write_text("".join(f"{json.dumps(row)}\n" for row in rows), encoding="utf-8")
+    mock_coll.count_documents.return_value = 1
+
+    assert await db_instance.import_tracks(path) == len(rows)
+
+    (writes,), options = mock_coll.bulk_write.call_args
+    assert [type(write) for write in writes] == [DeleteOne, InsertOne, DeleteOne]
+    assert writes[0]._filter == {"uri": "uri1"}
+    assert writes[1]._doc["_id"] == "id1_reliked"
+    assert writes[2]._filter == {"uri": "uri2"}
+    # The delete has to land before the insert of the same uri
+    assert options.get("ordered", True) is True
+    mock_coll.insert_many.assert_not_called()
+    mock_coll.drop_index.assert_not_called()
+    mock_coll.update_one.assert_any_await(
+        {"_id": "change_seq"}, {"$max": {"value": CHANGE_SEQ}}, upsert=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_import_tracks_rejects_incremental_summary_export(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path
+) -> None:
+    """Test an incremental export without whole documents is refused before any write."""
+    path = tmp_path / f"export-2026-01-02-since-{EXPORT_MARK}.ndjson"
+    path.write_text('{"_id":"id1","href":"href1","name":"Track 1"}\n', encoding="utf-8")
+
+    with pytest.raises(ValueError, match="--export-full"):
+        await db_instance.import_tracks(path)
+    mock_coll.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_load_runs_oldest_first(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test the latest runs are read newest first and returned oldest first."""
+    mock_coll.find.return_value = FakeCursor([{"duration": 2.0}, {"duration": 1.0}])
+
+    runs = await db_instance.load_runs(2)
+
+    assert [run["duration"] for run in runs] == [1.0, 2.0]
+    mock_coll.find.assert_called_once_with({}, {"_id": 0})
+    mock_coll.find.return_value.sort.assert_called_once_with("started_at", -1)
+    mock_coll.find.return_value.limit.assert_called_once_with(2)
+    assert cast(MagicMock, db_instance.mongo_db).__getitem__.call_args.args == ("runs",)
+
+
+@pytest.mark.asyncio
+async def test_close_shared_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a shared client is left open for the other users."""
+    monkeypatch.setenv("MONGO_INITDB_DATABASE", "test_db")
+    shared_client = MagicMock()
+    shared_client.close = AsyncMock()
+    db = AsyncDB("alice", shared_client)
+    assert db.tracks_coll_name == "tracks_alice"
+    await db.close()
+    shared_client.close.assert_not_called()
+
+
+def test_init(db_instance: AsyncDB) -> None:
+    """Test AsyncDB opens its own client on the plain collections."""
+    assert db_instance.mongo_client is not None
+    assert db_instance.mongo_db is not None
+    assert db_instance.owns_client is True
+    assert db_instance.tracks_coll_name == "tracks"
+
+
+@pytest.mark.asyncio
+async def test_check_connection_failure(db_instance: AsyncDB) -> None:
+    """Test check_connection reports a server that cannot be reached."""
+    mock_client = cast(MagicMock, db_instance.mongo_client)
+    mock_client.server_info = AsyncMock(side_effect=Exception("Connection failed"))
+    assert await db_instance.check_connection() is False
+
+
+@pytest.mark.asyncio
+async def test_check_connection_indexes(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test check_connection builds the indexes when the spec version is missing."""
+    mock_client = cast(MagicMock, db_instance.mongo_client)
+    mock_client.server_info = AsyncMock(return_value={"version": "8.0"})
+    mock_coll.find_one.return_value = None
+    mock_coll.list_indexes = AsyncMock(return_value=FakeCursor([]))
+
+    assert await db_instance.check_connection() is True
+
+    # All keys are built in a single round trip
+    indexes = mock_coll.create_indexes.call_args[0][0]
+    assert len(indexes) == EXPECTED_INDEX_COUNT
+    assert [list(index.document["key"]) for index in indexes] == [
+        ["uri"],
+        ["played_at", "rand_key"],
+        ["artists._id"],
+        ["rotation_key"],
+        ["change_seq"],
+    ]
+    # Tracks cached before the random keys existed are backfilled before the build
+    backfilled = [call[0][0] for call in mock_coll.update_many.call_args_list]
+    assert backfilled == [
+        {"rand_key": {"$exists": False}},
+        {"rotation_key": {"$exists": False}},
+    ]
+    update_args = mock_coll.update_one.call_args[0]
+    assert update_args[0] == {"_id": "index_spec"}
+    assert update_args[1]["$set"]["version"] == AsyncDB.INDEX_SPEC_VERSION
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_drops_obsolete(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test ensure_indexes drops indexes that are no longer part of the spec."""
+    mock_coll.find_one.return_value = {"_id": "index_spec", "version": 1}
+    mock_coll.list_indexes = AsyncMock(
+        return_value=FakeCursor([{"name": "_id_"}, {"name": "uri_1"}, {"name": "played_at_1"}])
+    )
+
+    await db_instance.ensure_indexes()
+
+    mock_coll.drop_index.assert_awaited_once_with("played_at_1")
+    mock_coll.create_indexes.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_count_track(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test count_track counts the tracks collection."""
+    filters = {"artist": "Test"}
+    await db_instance.count_track(filters)
+
+    mock_coll.count_documents.assert_awaited_once_with(filters)
+    assert cast(MagicMock, db_instance.mongo_db).__getitem__.call_args.args == ("tracks",)
+
+
+@pytest.mark.asyncio
+async def test_sync_and_export_use_configured_concerns(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test library syncs use the sync write concern and exports the read preference."""
+    monkeypatch.setenv("MONGO_INITDB_DATABASE", "test_db")
+    monkeypatch.setenv(
+        "MONGO_SETTINGS",
+        '{"sync_write_concern": "majority", "sync_journal": true,'
+        ' "read_preference": "secondaryPreferred"}',
+    )
+    db = AsyncDB("alice", MagicMock())
+    coll = AsyncMock()
+    coll.find = MagicMock(return_value=FakeCursor([]))
+    coll.with_options = MagicMock(return_value=AsyncMock())
+    cast(MagicMock, db.mongo_db).__getitem__.return_value = coll
+
+    await db.sync_tracks([Track.model_construct(uri="new_uri", type="track", id="new_uri")])
+    db.get_export_coll()
+
+    calls = coll.with_options.call_args_list
+    assert calls[0].kwargs == {"write_concern": WriteConcern(w="majority", j=True)}
+    assert calls[-1].kwargs == {"read_preference": ReadPreference.SECONDARY_PREFERRED}
+    coll.with_options.return_value.bulk_write.assert_awaited_once()
+    coll.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_auto_reconnect_success(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test sync_tracks retries bulk_write on AutoReconnect and eventually succeeds."""
+    mock_coll.bulk_write.side_effect = [
+        AutoReconnect("timeout"),
+        AutoReconnect("timeout"),
+        MagicMock(),
+    ]
+
+    await db_instance.sync_tracks([Track.model_construct(uri="uri1", type="track", id="uri1")])
+
+    assert mock_coll.bulk_write.await_count == EXPECTED_SUCCESS_RETRIES
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_auto_reconnect_failure(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test sync_tracks retries bulk_write and eventually gives up."""
+    mock_coll.bulk_write.side_effect = AutoReconnect("timeout")
+
+    with pytest.raises(AutoReconnect):
+        await db_instance.sync_tracks([Track.model_construct(uri="uri1", type="track", id="uri1")])
+
+    assert mock_coll.bulk_write.await_count == EXPECTED_MAX_RETRIES
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_bumps_library_version(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test sync_tracks bumps the library version only when something changed."""
+    mock_coll.find.return_value = FakeCursor([{"uri": "new_uri"}])
+    mock_coll.find_one.return_value = None
+    mock_coll.bulk_write.return_value.upserted_count = 0
+    mock_coll.bulk_write.return_value.modified_count = 0
+    tracks: list[ItemV2] = [Track.model_construct(uri="new_uri", type="track", id="new_uri")]
+
+    await db_instance.sync_tracks(tracks)
+    mock_coll.update_one.assert_not_called()
+
+    mock_coll.bulk_write.return_value.modified_count = 1
+    await db_instance.sync_tracks(tracks)
+    mock_coll.update_one.assert_awaited_once()
+    assert mock_coll.update_one.call_args[0][0] == {"_id": "library"}
+    assert mock_coll.update_one.call_args[0][1]["$inc"] == {"version": 1}
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_writes_only_changed(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test unchanged tracks are skipped and changed ones stamped with a new change_seq."""
+    same = Track.model_construct(uri="uri1", type="track", id="uri1", name="Same")
+    edited = Track.model_construct(uri="uri2", type="track", id="uri2", name="Renamed")
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"uri": "uri1", "content_hash": AsyncDB.content_hash(same)},
+            {"uri": "uri2", "content_hash": "stale"},
+        ]
+    )
+    mock_coll.find_one_and_update.return_value = {"_id": "change_seq", "value": CHANGE_SEQ}
+
+    await db_instance.sync_tracks([same, edited])
+
+    (upsert,) = mock_coll.bulk_write.call_args[0][0]
+    assert upsert._filter == {"uri": "uri2"}
+    assert upsert._doc["$set"]["change_seq"] == CHANGE_SEQ
+    mock_coll.insert_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_tracks_splices_new_tracks_into_rotation(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test new tracks get a rotation_key after the current rotation cursor."""
+    mock_coll.find_one.return_value = {"_id": "rotation", "cycle": 2, "cursor": ROTATION_CURSOR}
+    tracks: list[ItemV2] = [
+        Track.model_construct(uri=f"uri_{i}", type="track", id=f"id_{i}", name="Track")
+        for i in range(20)
+    ]
+
+    await db_instance.sync_tracks(tracks)
+
+    operations = mock_coll.bulk_write.call_args[0][0]
+    keys = [op._doc["$setOnInsert"]["rotation_key"] for op in operations]
+    assert all(ROTATION_CURSOR <= key <= 1.0 for key in keys)
+
+
+def test_reset_collection(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test reset_collection only warns and rejects unknown collections."""
+    with patch.object(db_instance, "logger") as mock_logger:
+        db_instance.reset_collection("tracks")
+    mock_logger.warning.assert_called_with(
+        "tracks collection is no longer reset; use sync_tracks instead"
+    )
+    mock_coll.delete_many.assert_not_called()
+
+    with pytest.raises(ValueError, match="Invalid collection name"):
+        db_instance.reset_collection("invalid")
+
+
+@pytest.mark.asyncio
+async def test_export_to_json_fallback(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a gzipped export falls back if the artists array is empty or missing."""
+    monkeypatch.chdir(tmp_path)
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"_id": "id1", "href": "href1", "name": "Track 1", "artists": []},
+            {"_id": "id2", "href": "href2", "name": "Track 2"},
+        ]
+    )
+
+    path = await db_instance.export_to_json("ndjson", "gzip")
+
+    assert path.name.endswith(".ndjson.gz")
+    with gzip.open(path, "rt", encoding="utf-8") as export_file:
+        data = [json.loads(line) for line in export_file]
+    assert [row["artist_name"] for row in data] == ["Unknown", "Unknown"]
+
+
+@pytest.mark.asyncio
+async def test_export_tracks_parquet(
+    db_instance: AsyncDB, mock_coll: AsyncMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test the columnar formats read the flattened projection in record batches."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.chdir(tmp_path)
+    mock_coll.find.return_value = FakeCursor(
+        [
+            {"_id": "id1", "artists": [{"_id": "ar1", "name": "Artist 1"}]},
+            {"_id": "id2", "artists": []},
+            {"_id": "id3"},
+        ]
+    )
+
+    path = await db_instance.export_tracks("parquet", "zstd", batch_size=2)
+
+    assert path.name.endswith(".parquet")
+    assert mock_coll.find.call_args[0][1] == COLUMNAR_PROJECTION
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == EXPECTED_ROW_GROUPS
+    assert parquet_file.read().column("artist_ids").to_pylist() == [["ar1"], [], []]
+
+
+@pytest.mark.asyncio
+async def test_validate_item_count(db_instance: AsyncDB) -> None:
+    """Test the requested count is checked against the size of the library."""
+    with patch.object(db_instance, "count_track", return_value=200):
+        await db_instance.validate_item_count(TEST_PLAYLIST_SIZE)
+
+        with pytest.raises(ValueError, match="must be less than"):
+            await db_instance.validate_item_count(250)
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_window(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test the window mode samples the LRP window and marks the tracks played."""
+    mock_coll.aggregate.return_value = FakeCursor([{"tracks": ["uri_ex1", "uri_ex2"]}])
+
+    with patch.object(db_instance, "validate_item_count"):
+        result = await db_instance.generate_random_playlist(TEST_PLAYLIST_SIZE, mode="window")
+
+    pipeline = mock_coll.aggregate.call_args[0][0]
+    assert pipeline[0]["$sort"] == {"played_at": 1, "rand_key": 1}
+    assert pipeline[2]["$sample"]["size"] == TEST_PLAYLIST_SIZE
+    assert len(pipeline) == EXPECTED_TRACK_PIPELINE_SIZE  # $sort, $limit, $sample, $group
+    assert result == ["uri_ex1", "uri_ex2"]
+    update_args = mock_coll.update_many.call_args[0]
+    assert update_args[0] == {"uri": {"$in": ["uri_ex1", "uri_ex2"]}}
+    assert "played_at" in update_args[1][0]["$set"]
+    assert update_args[1][0]["$set"]["rand_key"] == {"$rand": {}}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["lrp", "window"])
+async def test_generate_random_playlist_empty(
+    db_instance: AsyncDB, mock_coll: AsyncMock, mode: SelectionMode
+) -> None:
+    """Test an empty collection raises before anything is marked played."""
+    mock_coll.aggregate.return_value = FakeCursor([])
+
+    with (
+        patch.object(db_instance, "validate_item_count"),
+        pytest.raises(ValueError, match="No tracks found in the database"),
+    ):
+        await db_instance.generate_random_playlist(TEST_PLAYLIST_SIZE, mode=mode)
+
+    mock_coll.update_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_invalid(db_instance: AsyncDB) -> None:
+    """Test unknown modes and invalid item counts are rejected."""
+    with (
+        patch.object(db_instance, "validate_item_count"),
+        pytest.raises(ValueError, match="Invalid selection mode"),
+    ):
+        await db_instance.generate_random_playlist(TEST_PLAYLIST_SIZE, mode="bogus")  # type: ignore
+
+    with (
+        patch.object(
+            db_instance, "validate_item_count", side_effect=ValueError("Invalid item type")
+        ),
+        pytest.raises(ValueError, match="Invalid item type"),
+    ):
+        await db_instance.generate_random_playlist(TEST_PLAYLIST_SIZE)
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_weighted(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test weighted mode keeps the loaded snapshot in step with played_at."""
+    mock_coll.aggregate.return_value = FakeCursor(
+        [
+            {"uri": "uri_ex1", "played_at": None, "popularity": 10, "artist_id": "a1"},
+            {"uri": "uri_ex2", "played_at": 1_700_000_000_000, "popularity": 20, "artist_id": "a2"},
+        ]
+    )
+
+    with patch.object(db_instance, "validate_item_count"):
+        first = await db_instance.generate_random_playlist(1, mode="weighted", seed=1)
+
+    projection = mock_coll.aggregate.call_args[0][0][0]["$project"]
+    assert projection["artist_id"] == {"$first": "$artists._id"}
+    snapshot = db_instance.track_snapshot
+    assert snapshot is not None
+    assert snapshot.played_at[snapshot.uri_index[first[0]]] > 0
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_diverse(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test diverse mode caps tracks per artist over the LRP window."""
+    mock_coll.aggregate.return_value = FakeCursor(
+        [
+            {"uri": "uri_a1", "artist_id": "a"},
+            {"uri": "uri_a2", "artist_id": "a"},
+            {"uri": "uri_a3", "artist_id": "a"},
+            {"uri": "uri_b1", "artist_id": "b"},
+        ]
+    )
+
+    with (
+        patch.object(db_instance, "validate_item_count"),
+        patch.object(db_instance, "MAX_TRACKS_PER_ARTIST", 1),
+    ):
+        result = await db_instance.generate_random_playlist(
+            EXPECTED_RANDOM_COUNT, mode="diverse", seed=1
+        )
+
+    pipeline = mock_coll.aggregate.call_args[0][0]
+    assert pipeline[0]["$sort"] == {"played_at": 1, "rand_key": 1}
+    assert pipeline[1]["$limit"] == AsyncDB.MAX_SIZE_WINDOW
+    assert sorted(result) == ["uri_a1", "uri_b1"]
+    mock_coll.update_many.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_rotation(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test rotation mode reads the next keys after the cursor and advances it."""
+    mock_coll.find_one.return_value = {"_id": "rotation", "cycle": 2, "cursor": 0.5}
+    mock_coll.find.return_value = FakeCursor(
+        [{"uri": "uri_ex1", "rotation_key": 0.6}, {"uri": "uri_ex2", "rotation_key": 0.7}]
+    )
+
+    with patch.object(db_instance, "validate_item_count"):
+        result = await db_instance.generate_random_playlist(EXPECTED_RANDOM_COUNT, mode="rotation")
+
+    assert result == ["uri_ex1", "uri_ex2"]
+    assert mock_coll.find.call_args[0][0] == {"rotation_key": {"$gt": 0.5}}
+    mock_coll.update_one.assert_awaited_once_with(
+        {"_id": "rotation"}, {"$set": {"cycle": 2, "cursor": 0.7}}, upsert=True
+    )
+    # Only played_at is updated; no reshuffle happened
+    mock_coll.update_many.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_random_playlist_rotation_new_cycle(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test rotation mode reshuffles when the cycle runs out and keeps tail tracks in it."""
+    mock_coll.find_one.return_value = {"_id": "rotation", "cycle": 2, "cursor": 0.9}
+    mock_coll.find.side_effect = [
+        FakeCursor([{"uri": "uri_tail", "rotation_key": 0.95}]),
+        FakeCursor([{"uri": "uri_head", "rotation_key": 0.1}]),
+    ]
+
+    with patch.object(db_instance, "validate_item_count"):
+        result = await db_instance.generate_random_playlist(EXPECTED_RANDOM_COUNT, mode="rotation")
+
+    assert result == ["uri_tail", "uri_head"]
+    # Whole library re-rolled, then the new head is read without the tail tracks
+    assert mock_coll.update_many.call_args_list[0][0][0] == {}
+    assert mock_coll.find.call_args_list[1][0][0] == {
+        "rotation_key": {"$gt": -1.0},
+        "uri": {"$nin": ["uri_tail"]},
+    }
+    tail_update = mock_coll.bulk_write.call_args[0][0][0]
+    assert tail_update._doc["$set"]["rotation_key"] >= NEW_CYCLE_CURSOR
+    mock_coll.update_one.assert_awaited_once_with(
+        {"_id": "rotation"}, {"$set": {"cycle": 3, "cursor": 0.1}}, upsert=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_duration_playlist(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test duration mode reads one LRP window sized for the target and marks picks played."""
+    cursor = FakeCursor([{"uri": f"uri_{i}", "duration_ms": 4 * 60 * 1000} for i in range(100)])
+    mock_coll.find.return_value = cursor
+
+    result = await db_instance.generate_duration_playlist(THREE_HOURS_MS, seed=1)
+
+    mock_coll.find.assert_called_once_with({}, {"_id": 0, "uri": 1, "duration_ms": 1})
+    # 3h of 3-minute tracks -> 60 items, window of 180 is below the 300 floor
+    cursor.limit.assert_called_once_with(AsyncDB.MAX_SIZE_WINDOW)
+    assert len(result) == THREE_HOURS_MS // (4 * 60 * 1000)
+    mock_coll.update_many.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_save_pending_plan(db_instance: AsyncDB, mock_coll: AsyncMock) -> None:
+    """Test the plan stores uris, request and the current library version."""
+    mock_coll.find_one.return_value = {"_id": "library", "version": LIBRARY_VERSION}
+
+    await db_instance.save_pending_plan(["uri_ex1"], "lrp:100", "daily")
+
+    query, plan = mock_coll.replace_one.call_args[0]
+    assert query == {"_id": "pending_plan:daily"}
+    assert plan["uris"] == ["uri_ex1"]
+    assert plan["selection"] == "lrp:100"
+    assert plan["library_version"] == LIBRARY_VERSION
+    assert "generated_at" in plan
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "plan",
+    [
+        None,
+        {"uris": ["uri_ex1"], "selection": "lrp:100", "library_version": LIBRARY_VERSION - 1},
+        {"uris": ["uri_ex1"], "selection": "window:100", "library_version": LIBRARY_VERSION},
+    ],
+)
+async def test_take_pending_plan_stale(
+    db_instance: AsyncDB, mock_coll: AsyncMock, plan: dict[str, object] | None
+) -> None:
+    """Test a missing plan, or one for another request or library version, is not used."""
+    mock_coll.find_one_and_delete.return_value = plan
+    mock_coll.find_one.return_value = {"_id": "library", "version": LIBRARY_VERSION}
+
+    assert await db_instance.take_pending_plan("lrp:100", "daily") is None
+    mock_coll.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_take_pending_plan_returns_rotation_tracks(
+    db_instance: AsyncDB, mock_coll: AsyncMock
+) -> None:
+    """Test a discarded rotation plan puts its tracks back into the current cycle."""
+    mock_coll.find_one_and_delete.return_value = {
+        "uris": ["uri_ex1"],
+        "selection": "rotation:100",
+        "library_version": 1,
+    }
+    mock_coll.find_one.return_value = {"_id": "x", "version": 2, "cycle": 1, "cursor": 0.5}
+
+    assert await db_instance.take_pending_plan("rotation:100", "daily") is None
+    operations = mock_coll.bulk_write.call_args[0][0]
+    assert operations[0]._filter == {"uri": "uri_ex1"}
+    assert operations[0]._doc["$set"]["rotation_key"] >= ROTATION_RETURN_CURSOR
@@ -1,3 +1,5 @@
+import asyncio
+from collections.abc import AsyncIterator
 from typing import Any, cast
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -8,6 +10,7 @@ from pydantic import ValidationError
 from spotify.client import Client
 from spotify.schema import (
     ExternalUrls,
+    ItemV2,
     LikedTracksResponse,
     Owner,
     PlaylistItem,
@@ -22,6 +25,9 @@ EXPECTED_PLAYLIST_PAGES_CALLS = 2
 EXPECTED_LIKED_TRACKS_BATCHES = 3
 EXPECTED_TOTAL_LIKED_TRACKS = 150
 EXPECTED_CHUNKED_POST_CALLS = 3
+EXPECTED_RESUMED_FETCH_CALLS = 2
+EXPECTED_CHECKPOINT_CLEARS = 2
+STREAMED_PAGES = 3
 
 
 @pytest.mark.asyncio
@@ -215,6 +221,65 @@ async def test_populate_playlist_with_uris(client_instance: Client) -> None:
         assert kwargs["json"]["uris"] == ["uri1", "uri2"]
 
 
+@pytest.mark.asyncio
+async def test_populate_playlist_with_uris_other_playlist(client_instance: Client) -> None:
+    """Test an explicit playlist_id overrides SPOTIFY_PLAYLIST_ID."""
+    with patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+        mock_post.return_value = MagicMock(status_code=201)
+
+        await client_instance.populate_playlist_with_uris(["uri1"], "workout_id")
+
+        assert mock_post.call_args[0][0].endswith("/playlists/workout_id/items")
+
+
+@pytest.mark.asyncio
+async def test_populate_shares_connection_pool(client_instance: Client) -> None:
+    """Test playlists filled inside ``async with`` reuse one pool that is closed on exit."""
+    with patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+        mock_post.return_value = MagicMock(status_code=201)
+        async with client_instance:
+            shared = client_instance.http
+            async with client_instance.http_client() as client:
+                assert client is shared
+            await asyncio.gather(
+                client_instance.populate_playlist_with_uris(["uri1"], "daily_id"),
+                client_instance.populate_playlist_with_uris(["uri2"], "drive_id"),
+            )
+
+        assert client_instance.http is None
+        assert shared is not None and shared.is_closed
+        urls = sorted(call[0][0] for call in mock_post.call_args_list)
+        assert urls[0].endswith("/playlists/daily_id/items")
+        assert urls[1].endswith("/playlists/drive_id/items")
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_pool_connections(client_instance: Client) -> None:
+    """Test the warm-up fills the shared pool and tolerates failed handshakes."""
+    with patch("httpx.AsyncClient.head", new_callable=AsyncMock) as mock_head:
+        mock_head.side_effect = [MagicMock(status_code=401), httpx.ConnectError("down")] + [
+            MagicMock(status_code=401)
+        ] * (Client.MAX_CONCURRENT_REQUESTS - 2)
+        await client_instance.warm_up()
+        mock_head.assert_not_called()
+
+        async with client_instance:
+            await client_instance.warm_up()
+
+    assert mock_head.call_count == Client.MAX_CONCURRENT_REQUESTS
+    assert client_instance.first_request_at is None
+
+
+@pytest.mark.asyncio
+async def test_first_request_is_timed(client_instance: Client) -> None:
+    await client_instance._get_headers()
+    first = client_instance.first_request_at
+    await client_instance._get_headers()
+
+    assert first is not None
+    assert client_instance.first_request_at == first
+
+
 @pytest.mark.asyncio
 async def test_update_queue(client_instance: Client) -> None:
     """Test updating the queue."""
@@ -327,6 +392,122 @@ async def test_get_all_liked_tracks_multiple_batches(client_instance: Client) ->
         assert len(args[0]) == EXPECTED_TOTAL_LIKED_TRACKS
 
 
+def liked_page(start: int, total: int) -> LikedTracksResponse:
+    return LikedTracksResponse.model_validate(
+        {
+            "total": total,
+            "items": [
+                get_valid_track_data(f"spotify:track:{i}", f"Track {i}")
+                for i in range(start, start + 50)
+            ],
+            "next": "url",
+            "href": "http",
+            "limit": 50,
+            "offset": start,
+            "previous": None,
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_all_liked_tracks_resumes_from_checkpoints(client_instance: Client) -> None:
+    """Test a rerun only fetches the pages the failed run did not checkpoint."""
+    mock_db = cast(MagicMock, client_instance.db)
+    first = [item.track for item in liked_page(0, 150).items]
+    checkpointed = [item.track for item in liked_page(50, 150).items]
+    mock_db.load_sync_pages.return_value = {0: first, 50: checkpointed}
+
+    with patch.object(client_instance, "fetch_liked_items", new_callable=AsyncMock) as mock_fetch:
+        mock_fetch.side_effect = [liked_page(0, 150), liked_page(100, 150)]
+        with patch.object(client_instance, "ME_BATCH_SIZE", 50):
+            await client_instance.get_all_liked_tracks()
+
+    assert mock_fetch.call_count == EXPECTED_RESUMED_FETCH_CALLS
+    assert "offset=100" in mock_fetch.call_args[0][1]
+    mock_db.save_sync_page.assert_awaited_once()
+    (synced,), _ = mock_db.sync_tracks.call_args
+    assert [track.uri for track in synced] == [f"spotify:track:{i}" for i in range(150)]
+    mock_db.clear_sync_pages.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_all_liked_tracks_drops_shifted_checkpoints(client_instance: Client) -> None:
+    """Test checkpoints are refetched when a like and an unlike kept total but moved offsets."""
+    mock_db = cast(MagicMock, client_instance.db)
+    # Saved before spotify:track:0 was liked and another track unliked
+    stale_first = [item.track for item in liked_page(1, 150).items]
+    stale = [item.track for item in liked_page(51, 150).items]
+    mock_db.load_sync_pages.return_value = {0: stale_first, 50: stale}
+
+    async def fetch(_client: httpx.AsyncClient, url: str) -> LikedTracksResponse:
+        return liked_page(int(url.split("offset=")[1].split("&", maxsplit=1)[0]), 150)
+
+    with (
+        patch.object(client_instance, "fetch_liked_items", side_effect=fetch),
+        patch.object(client_instance, "ME_BATCH_SIZE", 50),
+    ):
+        await client_instance.get_all_liked_tracks()
+
+    saved_offsets = [call.args[0] for call in mock_db.save_sync_page.await_args_list]
+    assert sorted(saved_offsets) == [0, 50, 100]
+    (synced,), _ = mock_db.sync_tracks.call_args
+    assert [track.uri for track in synced] == [f"spotify:track:{i}" for i in range(150)]
+    assert mock_db.clear_sync_pages.await_count == EXPECTED_CHECKPOINT_CLEARS
+
+
+@pytest.mark.asyncio
+async def test_get_all_liked_tracks_keeps_pages_on_failure(client_instance: Client) -> None:
+    """Test one failing page neither cancels nor discards the others, and nothing is synced."""
+    mock_db = cast(MagicMock, client_instance.db)
+
+    async def fetch(_client: httpx.AsyncClient, url: str) -> LikedTracksResponse:
+        if "offset=50" in url:
+            raise httpx.RequestError("Network error")
+        return liked_page(int(url.split("offset=")[1].split("&", maxsplit=1)[0]), 150)
+
+    with (
+        patch.object(client_instance, "fetch_liked_items", side_effect=fetch),
+        patch.object(client_instance, "ME_BATCH_SIZE", 50),
+        pytest.raises(httpx.RequestError),
+    ):
+        await client_instance.get_all_liked_tracks()
+
+    saved_offsets = [call.args[0] for call in mock_db.save_sync_page.await_args_list]
+    assert saved_offsets == [0, 100]
+    mock_db.sync_tracks.assert_not_called()
+    mock_db.clear_sync_pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_all_liked_tracks_streams_over_memory_budget(client_instance: Client) -> None:
+    """Test a library projected over the budget is synced page by page, without checkpoints."""
+    mock_db = cast(MagicMock, client_instance.db)
+    client_instance.memory_budget = 1
+    streamed: list[list[str]] = []
+
+    async def sync_track_pages(pages: AsyncIterator[list[ItemV2]]) -> int:
+        streamed.extend([[track.uri for track in page] async for page in pages])
+        return sum(len(page) for page in streamed)
+
+    mock_db.sync_track_pages = AsyncMock(side_effect=sync_track_pages)
+
+    async def fetch(_client: httpx.AsyncClient, url: str) -> LikedTracksResponse:
+        return liked_page(int(url.split("offset=")[1].split("&", maxsplit=1)[0]), 150)
+
+    with (
+        patch.object(client_instance, "fetch_liked_items", side_effect=fetch),
+        patch.object(client_instance, "ME_BATCH_SIZE", 50),
+    ):
+        await client_instance.get_all_liked_tracks()
+
+    assert len(streamed) == STREAMED_PAGES
+    assert streamed[2][-1] == "spotify:track:149"
+    assert client_instance.tracks_synced == EXPECTED_TOTAL_LIKED_TRACKS
+    mock_db.sync_tracks.assert_not_called()
+    mock_db.load_sync_pages.assert_not_called()
+    mock_db.save_sync_page.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_delete_all_playlist_tracks_exception(client_instance: Client) -> None:
     """Test exception during delete batch bubbles out securely."""
@@ -0,0 +1,145 @@
+import json
+from datetime import UTC, date, datetime
+from pathlib import Path
+
+import pytest
+
+from spotify.export import (
+    ColumnarWriter,
+    ExportWriter,
+    columnar_row,
+    export_path,
+    import_settings,
+    is_incremental_export,
+    open_export,
+    read_export,
+)
+from spotify.options import ExportCompression, ExportFormat
+
+ROWS = [{"_id": "id1", "name": "Café"}, {"_id": "id2", "name": "Track 2"}]
+
+
+@pytest.mark.parametrize("export_format", ["json", "ndjson"])
+def test_export_writer_round_trip(export_format: ExportFormat) -> None:
+    """Test rows written across several batches decode to the same rows."""
+    writer = ExportWriter(export_format)
+    text = (
+        writer.header()
+        + writer.encode(ROWS[:1])
+        + writer.encode([])
+        + writer.encode(ROWS[1:])
+        + writer.footer()
+    )
+
+    if export_format == "json":
+        assert json.loads(text) == ROWS
+    else:
+        assert [json.loads(line) for line in text.splitlines()] == ROWS
+    assert writer.count == len(ROWS)
+
+
+def test_export_writer_empty_array() -> None:
+    writer = ExportWriter("json")
+    assert json.loads(writer.header() + writer.encode([]) + writer.footer()) == []
+
+
+@pytest.mark.parametrize(
+    ("export_format", "compression"), [("json", None), ("ndjson", "gzip"), ("json", "gzip")]
+)
+def test_read_export_round_trip(
+    tmp_path: Path, export_format: ExportFormat, compression: ExportCompression | None
+) -> None:
+    """Test a full export reads back batch by batch with its BSON types intact."""
+    played_at = datetime(2026, 1, 2, 3, 4, 5, tzinfo=UTC)
+    docs = [{**row, "played_at": played_at} for row in ROWS]
+    path = tmp_path / export_path(export_format, compression, date(2026, 1, 2))
+    writer = ExportWriter(export_format, extended=True)
+    with open_export(path, compression) as out:
+        out.write(writer.header() + writer.encode(docs) + writer.footer())
+
+    batches = list(read_export(path, 1))
+
+    assert len(batches) == len(ROWS)
+    assert [doc["name"] for (doc,) in batches] == [row["name"] for row in ROWS]
+    assert batches[0][0]["played_at"].replace(tzinfo=UTC) == played_at
+
+
+def test_import_settings() -> None:
+    assert import_settings(Path("export-2026-01-02.ndjson.zst")) == ("ndjson", "zstd")
+    assert import_settings(Path("export-2026-01-02-since-4.json")) == ("json", None)
+    with pytest.raises(ValueError, match="only JSON and NDJSON"):
+        import_settings(Path("export-2026-01-02.parquet"))
+
+
+def test_export_path() -> None:
+    day = date(2026, 1, 2)
+    assert str(export_path("json", None, day)) == "export-2026-01-02.json"
+    assert str(export_path("ndjson", "zstd", day)) == "export-2026-01-02.ndjson.zst"
+
+
+def test_is_incremental_export() -> None:
+    day = date(2026, 1, 2)
+    assert is_incremental_export(export_path("ndjson", "gzip", day, since=4))
+    assert not is_incremental_export(export_path("ndjson", "gzip", day))
+
+
+def test_open_export_zstd(tmp_path: Path) -> None:
+    """Test zstd output decompresses back to the written text."""
+    zstd = pytest.importorskip("compression.zstd")
+    path = export_path("ndjson", "zstd", date(2026, 1, 2))
+    target = tmp_path / path
+    with open_export(target, "zstd") as out:
+        out.write('{"a":1}\n')
+    assert zstd.decompress(target.read_bytes()) == b'{"a":1}\n'
+
+
+def test_columnar_row_flattens_artists() -> None:
+    row = columnar_row(
+        {
+            "_id": "id1",
+            "uri": "spotify:track:id1",
+            "album": {"_id": "al1", "name": "Album"},
+            "artists": [{"_id": "ar1", "name": "One"}, {"_id": "ar2", "name": "Two"}],
+        }
+    )
+    assert row["album_name"] == "Album"
+    assert row["artist_ids"] == ["ar1", "ar2"]
+    assert row["artist_names"] == ["One", "Two"]
+    assert columnar_row({"_id": "id2"})["artist_ids"] == []
+
+
+@pytest.mark.parametrize(("export_format", "compression"), [("arrow", "zstd"), ("parquet", None)])
+def test_columnar_writer_round_trip(
+    tmp_path: Path, export_format: ExportFormat, compression: ExportCompression | None
+) -> None:
+    """Test batches written one at a time read back as one table."""
+    pa = pytest.importorskip("pyarrow")
+    path = tmp_path / export_path(export_format, compression, date(2026, 1, 2))
+    played_at = datetime(2026, 1, 1, 12, tzinfo=UTC)
+    tracks = [
+        {"_id": "id1", "played_at": played_at, "artists": [{"_id": "ar1", "name": "One"}]},
+        {"_id": "id2", "played_at": None, "artists": []},
+    ]
+
+    writer = ColumnarWriter(path, export_format, compression)
+    writer.write(tracks[:1])
+    writer.write([])
+    writer.write(tracks[1:])
+    writer.close()
+
+    if export_format == "arrow":
+        # The IPC file format can be memory-mapped and read without copying
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        table = pytest.importorskip("pyarrow.parquet").read_table(path)
+    assert writer.count == len(tracks)
+    assert table.column("_id").to_pylist() == ["id1", "id2"]
+    assert table.column("artist_names").to_pylist() == [["One"], []]
+    assert table.column("played_at").to_pylist()[0] == played_at
+
+
+def test_columnar_writer_rejects_gzip_arrow(tmp_path: Path) -> None:
+    pytest.importorskip("pyarrow")
+    with pytest.raises(ValueError, match="zstd compression only"):
+        ColumnarWriter(tmp_path / "export.arrow", "arrow", "gzip")
@@ -5,7 +5,7 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from spotify.helpers import CustomHTTPServer, RequestHandler
+from spotify.helpers import CustomHTTPServer, RequestHandler, parse_duration, parse_size
 
 
 class MockRequest:
@@ -96,3 +96,45 @@ def test_request_handler_200_success(monkeypatch: pytest.MonkeyPatch) -> None:
     assert handler.response_code == HTTPStatus.OK
     assert wfile.getvalue() == b"Authorization successful. You may close this tab."
     mock_callback.assert_called_once_with("valid_code123")
+
+
+@pytest.mark.parametrize(
+    "value, expected_ms",
+    [
+        ("3h", 3 * 60 * 60 * 1000),
+        ("90m", 90 * 60 * 1000),
+        ("2h30m", 150 * 60 * 1000),
+        ("1h0m30s", (60 * 60 + 30) * 1000),
+        ("45", 45 * 60 * 1000),
+        (" 2H ", 2 * 60 * 60 * 1000),
+    ],
+)
+def test_parse_duration(value: str, expected_ms: int) -> None:
+    assert parse_duration(value) == expected_ms
+
+
+@pytest.mark.parametrize("value", ["", "abc", "3 hours", "1.5h", "m30"])
+def test_parse_duration_invalid(value: str) -> None:
+    with pytest.raises(ValueError, match="Invalid duration"):
+        parse_duration(value)
+
+
+@pytest.mark.parametrize(
+    "value, expected_bytes",
+    [
+        ("512M", 512 * 2**20),
+        ("2G", 2 * 2**30),
+        ("256MiB", 256 * 2**20),
+        ("64kb", 64 * 2**10),
+        ("300", 300 * 2**20),
+        (" 1g ", 2**30),
+    ],
+)
+def test_parse_size(value: str, expected_bytes: int) -> None:
+    assert parse_size(value) == expected_bytes
+
+
+@pytest.mark.parametrize("value", ["", "abc", "1.5G", "2T", "M512"])
+def test_parse_size_invalid(value: str) -> None:
+    with pytest.raises(ValueError, match="Invalid size"):
+        parse_size(value)
@@ -0,0 +1,90 @@
+from datetime import UTC, datetime, timedelta
+from typing import Literal
+
+from spotify.history import (
+    BASELINE_RUNS,
+    REGRESSION_FACTOR,
+    RunSummary,
+    find_regressions,
+    percentiles,
+    stats_report,
+)
+
+STARTED_AT = datetime(2026, 1, 1, 8, tzinfo=UTC)
+SELECT_SECONDS = 1.0
+SYNC_SECONDS = 30.0
+TRACKS = 500
+
+
+def summary(
+    day: int,
+    select: float,
+    status: Literal["ok", "error"] = "ok",
+    sync: float = 2.0,
+    tracks_synced: int | None = None,
+) -> RunSummary:
+    return {
+        "started_at": STARTED_AT + timedelta(days=day),
+        "mode": "refresh",
+        "status": status,
+        "error": None,
+        "duration": select + sync,
+        "phases": {"sync": sync, "select": select},
+        "requests": 40,
+        "rate_limited": 0,
+        "tracks_synced": tracks_synced,
+        "peak_rss_mb": 120.0,
+    }
+
+
+def test_percentiles() -> None:
+    cuts = percentiles([float(value) for value in range(1, 101)])
+    assert round(cuts[50]) == 50  # noqa: PLR2004
+    assert percentiles([3.0]) == {50: 3.0, 90: 3.0, 99: 3.0}
+
+
+def test_find_regressions_flags_the_first_slow_run() -> None:
+    """Test a phase slower than its rolling median is flagged, and failed runs are ignored."""
+    slow = SELECT_SECONDS * REGRESSION_FACTOR * 2
+    runs = [summary(day, SELECT_SECONDS) for day in range(BASELINE_RUNS)]
+    runs.append(summary(BASELINE_RUNS, slow * 10, status="error"))
+    runs.append(summary(BASELINE_RUNS + 1, slow))
+
+    regressions = find_regressions(runs)
+
+    assert [(regression.metric, regression.seconds) for regression in regressions] == [
+        ("total", slow + 2.0),
+        ("select", slow),
+    ]
+    assert regressions[1].baseline == SELECT_SECONDS
+
+
+def test_find_regressions_compares_runs_of_the_same_kind() -> None:
+    """Test a refresh that fetched the library is not measured against cached-library runs."""
+    cached = [summary(day, SELECT_SECONDS) for day in range(BASELINE_RUNS)]
+    synced = [
+        summary(BASELINE_RUNS + day, SELECT_SECONDS, sync=SYNC_SECONDS, tracks_synced=TRACKS)
+        for day in range(3)
+    ]
+    export = summary(BASELINE_RUNS + 3, SELECT_SECONDS, sync=SYNC_SECONDS)
+    export["mode"] = "export"
+
+    assert find_regressions([*cached, *synced, export]) == []
+    slow = summary(BASELINE_RUNS + 4, SELECT_SECONDS, sync=SYNC_SECONDS * 2, tracks_synced=TRACKS)
+    (regression, *_) = find_regressions([*cached, *synced, export, slow])
+    assert regression.metric == "total"
+    assert regression.baseline == SYNC_SECONDS + SELECT_SECONDS
+
+
+def test_stats_report() -> None:
+    runs = [summary(day, SELECT_SECONDS) for day in range(3)]
+    runs.append(summary(3, SELECT_SECONDS, sync=SYNC_SECONDS, tracks_synced=TRACKS))
+
+    lines = stats_report(runs)
+
+    assert lines[0] == "4 runs from 2026-01-01 08:00 to 2026-01-04 08:00, 0 failed"
+    assert "refresh (cached library): 3 runs" in lines
+    assert "refresh: 1 runs" in lines
+    assert any(line.startswith("select") for line in lines)
+    assert lines[-1] == "0 regressions against the rolling baseline"
+    assert stats_report([]) == ["No runs recorded yet"]
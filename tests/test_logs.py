@@ -0,0 +1,48 @@
+import io
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from spotify.logs import SAMPLE_EVERY, Lazy, SampledLog, queued_logging
+
+SAMPLED_CALLS = 25
+EMITTED_CALLS = (1, 11, 21)
+
+
+def test_queued_logging_writes_from_the_listener() -> None:
+    """Test records reach the stream by the time the block exits, and the handler is removed."""
+    stream = io.StringIO()
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+
+    with queued_logging(stream=stream):
+        logging.getLogger("spotify.test").info("page %d fetched", 3)
+
+    assert stream.getvalue() == "INFO:spotify.test:page 3 fetched\n"
+    assert root.handlers == handlers
+
+
+def test_sampled_log_emits_one_in_every(caplog: pytest.LogCaptureFixture) -> None:
+    """Test the first call and then every SAMPLE_EVERY-th is logged, each with its call number."""
+    sampled = SampledLog(logging.getLogger("spotify.test"))
+
+    with caplog.at_level(logging.INFO, logger="spotify.test"):
+        for page in range(SAMPLED_CALLS):
+            sampled.log("pages", logging.INFO, "Fetched page %d", page)
+
+    assert [record.args for record in caplog.records] == [
+        (call - 1, call, SAMPLE_EVERY) for call in EMITTED_CALLS
+    ]
+
+
+def test_lazy_argument_skipped_while_level_is_off() -> None:
+    describe = MagicMock(return_value="from 0 to 50")
+    logger = logging.getLogger("spotify.test.lazy")
+    logger.setLevel(logging.WARNING)
+
+    SampledLog(logger).log("pages", logging.INFO, "Window %s", Lazy(describe, "url"))
+    logger.info("Window %s", Lazy(describe, "url"))
+
+    describe.assert_not_called()
+    assert str(Lazy(describe, "url")) == "from 0 to 50"
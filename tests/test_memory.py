@@ -0,0 +1,41 @@
+import logging
+
+import pytest
+
+from spotify.memory import TRACK_MEMORY_BYTES, MemoryMonitor, fit_batch_size
+from spotify.phases import PhaseGraph
+
+ALLOCATION_BYTES = 4 * 1024 * 1024
+BATCH_SIZE = 1000
+
+
+@pytest.mark.asyncio
+async def test_monitor_charges_peak_to_the_phase(caplog: pytest.LogCaptureFixture) -> None:
+    """Test a phase that allocates and frees a buffer is charged its peak, not its end."""
+
+    async def quick() -> None:
+        return None
+
+    async def allocate() -> None:
+        buffer = bytearray(ALLOCATION_BYTES)
+        del buffer
+
+    monitor = MemoryMonitor()
+    graph = PhaseGraph(monitor)
+    graph.add("mongo", quick)
+    graph.add("sync", allocate, after=("mongo",))
+
+    with caplog.at_level(logging.INFO, logger="spotify.memory"):
+        await monitor.run(graph.run())
+
+    sync = monitor.phases["sync"]
+    assert sync.peak - sync.start >= ALLOCATION_BYTES
+    assert sync.end - sync.start < ALLOCATION_BYTES
+    assert monitor.phases["mongo"].peak - monitor.phases["mongo"].start < ALLOCATION_BYTES
+    assert "top allocation sites" in caplog.text
+
+
+def test_fit_batch_size() -> None:
+    assert fit_batch_size(BATCH_SIZE, 2**30) == BATCH_SIZE
+    assert fit_batch_size(BATCH_SIZE, 40 * TRACK_MEMORY_BYTES) == BATCH_SIZE // 100
+    assert fit_batch_size(BATCH_SIZE, 1) == 1
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from spotify.phases import PhaseGraph
+
+
+@pytest.mark.asyncio
+async def test_independent_phases_overlap() -> None:
+    """Test phases without a dependency between them run at the same time."""
+    mongo_started = asyncio.Event()
+    order: list[str] = []
+
+    async def mongo() -> None:
+        mongo_started.set()
+        await asyncio.sleep(0.01)
+        order.append("mongo")
+
+    async def tokens() -> None:
+        # Deadlocks if the phases run one after the other.
+        await asyncio.wait_for(mongo_started.wait(), timeout=1)
+        order.append("tokens")
+
+    async def sync() -> None:
+        order.append("sync")
+
+    graph = PhaseGraph()
+    graph.add("mongo", mongo)
+    graph.add("tokens", tokens)
+    graph.add("sync", sync, after=("mongo", "tokens"))
+
+    timings = await graph.run()
+
+    assert order == ["tokens", "mongo", "sync"]
+    assert timings["sync"]["start"] >= timings["mongo"]["end"]
+
+
+@pytest.mark.asyncio
+async def test_critical_path_follows_the_slowest_dependency() -> None:
+    async def quick() -> None:
+        return None
+
+    async def slow() -> None:
+        await asyncio.sleep(0.02)
+
+    graph = PhaseGraph()
+    graph.add("tokens", quick)
+    graph.add("mongo", slow)
+    graph.add("clear", quick, after=("tokens",))
+    graph.add("select", quick, after=("mongo",))
+    graph.add("populate", quick, after=("clear", "select"))
+
+    await graph.run()
+
+    assert graph.critical_path() == ["mongo", "select", "populate"]
+
+
+@pytest.mark.asyncio
+async def test_failed_phase_stops_dependents() -> None:
+    """Test the first failure is raised as is and the phases waiting on it never start."""
+    ran: list[str] = []
+
+    async def mongo() -> None:
+        raise ConnectionError("MongoDB is not available")
+
+    async def sync() -> None:
+        ran.append("sync")
+
+    graph = PhaseGraph()
+    graph.add("mongo", mongo)
+    graph.add("sync", sync, after=("mongo",))
+
+    with pytest.raises(ConnectionError, match="not available"):
+        await graph.run()
+    assert ran == []
+
+
+def test_add_rejects_undeclared_dependency() -> None:
+    async def sync() -> None:
+        return None
+
+    graph = PhaseGraph()
+    with pytest.raises(ValueError, match="undeclared phases: mongo"):
+        graph.add("sync", sync, after=("mongo",))
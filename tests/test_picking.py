@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from spotify.picking import diversify, select_by_duration
+
+DIVERSE_SIZE = 8
+MAX_PER_ARTIST = 2
+DIVERSE_BACKFILL_SIZE = 4
+MINUTE_MS = 60_000
+
+
+def test_diversify_caps_and_spaces_artists() -> None:
+    """Test the per-artist cap holds and no artist repeats within the spacing."""
+    candidates = [(f"uri{i}", f"artist{i % 4}") for i in range(40)]
+    result = diversify(candidates, 8, max_per_artist=2, spacing=2, rng=random.Random(0))
+
+    artist_of = dict(candidates)
+    artists = [artist_of[uri] for uri in result]
+    assert len(result) == len(set(result)) == DIVERSE_SIZE
+    assert max(artists.count(a) for a in set(artists)) == MAX_PER_ARTIST
+    for position, artist in enumerate(artists):
+        assert artist not in artists[max(position - 2, 0) : position]
+
+
+def test_diversify_backfills_when_window_runs_dry() -> None:
+    """Test skipped candidates backfill the playlist when the cap cannot be met."""
+    candidates = [(f"solo{i}", "solo") for i in range(5)] + [("other", "other")]
+    result = diversify(candidates, 4, max_per_artist=1, spacing=1, rng=random.Random(0))
+
+    assert len(result) == len(set(result)) == DIVERSE_BACKFILL_SIZE
+    assert "other" in result
+    # "other" separates solo tracks whenever it can
+    assert result.index("other") in {1, 2}
+
+
+@pytest.mark.parametrize("target_minutes", [30, 90, 180])
+def test_select_by_duration_lands_within_tolerance(target_minutes: int) -> None:
+    """Test the selection total lands within tolerance of the target."""
+    rng = random.Random(target_minutes)
+    candidates = [(f"uri{i}", rng.randint(2 * MINUTE_MS, 7 * MINUTE_MS)) for i in range(300)]
+    target_ms = target_minutes * MINUTE_MS
+
+    result = select_by_duration(candidates, target_ms, 2 * MINUTE_MS, 100, rng)
+
+    durations = dict(candidates)
+    assert len(result) == len(set(result))
+    assert abs(sum(durations[uri] for uri in result) - target_ms) <= 2 * MINUTE_MS
+
+
+def test_select_by_duration_swaps_to_close_the_gap() -> None:
+    """Test a swap fixes a greedy fill that cannot reach the target by adding."""
+    candidates = [("long", 10 * MINUTE_MS), ("short", 4 * MINUTE_MS), ("mid", 7 * MINUTE_MS)]
+    result = select_by_duration(candidates, 7 * MINUTE_MS, MINUTE_MS // 2, 1, random.Random(0))
+    assert result == ["mid"]
+
+
+def test_select_by_duration_best_effort() -> None:
+    """Test the closest total is returned when the tolerance cannot be met."""
+    candidates = [("only", 4 * MINUTE_MS)]
+    result = select_by_duration(candidates, 60 * MINUTE_MS, MINUTE_MS, 10, random.Random(0))
+    assert result == ["only"]
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import pstats
+import time
+from pathlib import Path
+
+import pytest
+
+from spotify.phases import PhaseGraph
+from spotify.profiling import RunProfiler, categorize
+
+BUSY_SECONDS = 0.05
+SLEEP_SECONDS = 0.05
+
+
+def spin(seconds: float) -> None:
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        json.loads('{"uri": "spotify:track:1"}')
+
+
+@pytest.mark.asyncio
+async def test_profile_charges_cpu_to_phases(tmp_path: Path) -> None:
+    """Test CPU spent in tasks a phase starts counts for the phase, and sleeping does not."""
+
+    async def busy() -> None:
+        async def page() -> None:
+            await asyncio.sleep(0)
+            spin(BUSY_SECONDS / 2)
+
+        await asyncio.gather(page(), page())
+
+    async def idle() -> None:
+        await asyncio.sleep(SLEEP_SECONDS)
+
+    graph = PhaseGraph()
+    graph.add("sync", busy)
+    graph.add("network", idle)
+    profiler = RunProfiler(tmp_path / "run.prof")
+
+    await profiler.run(graph.run())
+
+    assert profiler.phase_cpu["sync"] >= BUSY_SECONDS * 0.9
+    assert profiler.phase_cpu["network"] < BUSY_SECONDS / 2
+    first, last = profiler.phase_spans["network"]
+    assert last - first >= SLEEP_SECONDS * 0.9
+    assert "JSON" in profiler.categories()
+    split = profiler.phase_categories()
+    assert split["sync"]["JSON"] > 0
+    assert "JSON" not in split.get("network", {})
+    assert pstats.Stats(str(tmp_path / "run.prof")).total_tt > 0
+
+
+def test_categorize() -> None:
+    assert categorize("~", "<method 'poll' of 'select.epoll' objects>") == "waiting for I/O"
+    assert categorize("/site-packages/pymongo/message.py", "_op_msg") == "MongoDB driver"
+    assert (
+        categorize("~", "<method 'validate_python' of 'pydantic_core.SchemaValidator' objects>")
+        == "pydantic validation"
+    )
+    assert categorize("/root/package/spotify/selection.py", "score_tracks") == "other"
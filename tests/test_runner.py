@@ -0,0 +1,158 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from spotify.phases import PhaseGraph
+from spotify.runner import PlaylistRefresh, describe_selection, select_playlists
+from spotify.schema import PlaylistTarget
+
+DAILY = PlaylistTarget(name="daily", playlist_id="p1", size=2, queue=True)
+DRIVE = PlaylistTarget(name="drive", playlist_id="p2", duration=3 * 60 * 60 * 1000)
+
+
+async def refresh(my_mongo: AsyncMock, sp_client: MagicMock) -> None:
+    """Run the refresh phases for DAILY on their own, as a standalone refresh would."""
+    graph = PhaseGraph()
+    PlaylistRefresh(my_mongo, sp_client, [DAILY], None, precompute=False).add_phases(graph)
+    await graph.run()
+
+
+def test_describe_selection() -> None:
+    """Test the request key used to match pending plans."""
+    assert describe_selection(DAILY) == "lrp:2"
+    assert describe_selection(DRIVE) == "duration:10800000"
+
+
+@pytest.mark.asyncio
+async def test_select_playlists_are_disjoint() -> None:
+    """Test each selection excludes what earlier plans and selections took."""
+    my_mongo = MagicMock()
+    my_mongo.select_random_tracks = AsyncMock(return_value=["uri3", "uri4"])
+    my_mongo.select_duration_tracks = AsyncMock(return_value=["uri5"])
+
+    selections = await select_playlists(my_mongo, [DAILY, DRIVE], None, [None, ["uri1"]])
+
+    assert selections == [["uri3", "uri4"], ["uri1"]]
+    assert my_mongo.select_random_tracks.call_args.kwargs["exclude"] == ["uri1", "uri3", "uri4"]
+    my_mongo.select_duration_tracks.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_overlaps_clearing_with_selection() -> None:
+    """Test the playlists are emptied on Spotify while MongoDB is still selecting."""
+    cleared = asyncio.Event()
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = None
+
+    async def select(*_: object, **__: object) -> list[str]:
+        # Only finishes once clearing ran, so this deadlocks if the phases are sequential.
+        await asyncio.wait_for(cleared.wait(), timeout=1)
+        return ["uri1", "uri2"]
+
+    async def clear(_: str) -> None:
+        cleared.set()
+
+    my_mongo.select_random_tracks = AsyncMock(side_effect=select)
+    sp_client = MagicMock()
+    sp_client.get_available_all_devices = AsyncMock(return_value=["device1"])
+    sp_client.delete_all_playlist_tracks = AsyncMock(side_effect=clear)
+    sp_client.populate_playlist_with_uris = AsyncMock()
+    sp_client.update_queue = AsyncMock()
+
+    await refresh(my_mongo, sp_client)
+
+    sp_client.populate_playlist_with_uris.assert_awaited_once_with(["uri1", "uri2"], "p1")
+    sp_client.update_queue.assert_awaited_once_with(["uri1", "uri2"], ["device1"])
+    my_mongo.update_played_at.assert_awaited_once_with(["uri1", "uri2"])
+    my_mongo.finish_run_journal.assert_awaited_once_with("p1")
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_keeps_playlists_when_sync_fails() -> None:
+    """Test clearing waits for the library sync, so a failed sync leaves the playlist alone."""
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = None
+    sp_client = MagicMock()
+    sp_client.delete_all_playlist_tracks = AsyncMock()
+
+    async def sync() -> None:
+        raise ConnectionError("sync failed")
+
+    graph = PhaseGraph()
+    graph.add("sync", sync)
+    PlaylistRefresh(my_mongo, sp_client, [DAILY], None, precompute=False).add_phases(
+        graph, library_ready=("sync",)
+    )
+    with pytest.raises(ConnectionError):
+        await graph.run()
+
+    sp_client.delete_all_playlist_tracks.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_marks_played_only_after_populate() -> None:
+    """Test a failing populate leaves played_at alone and the journal open for a rerun."""
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = None
+    my_mongo.select_random_tracks.return_value = ["uri1", "uri2"]
+    sp_client = MagicMock()
+    sp_client.get_available_all_devices = AsyncMock(return_value=["device1"])
+    sp_client.delete_all_playlist_tracks = AsyncMock()
+    sp_client.populate_playlist_with_uris = AsyncMock(side_effect=RuntimeError("502"))
+
+    with pytest.raises(RuntimeError):
+        await refresh(my_mongo, sp_client)
+
+    my_mongo.start_run_journal.assert_awaited_once_with("p1", "lrp:2", ["uri1", "uri2"])
+    my_mongo.mark_run_step.assert_awaited_once_with("p1", "clear")
+    my_mongo.update_played_at.assert_not_called()
+    my_mongo.finish_run_journal.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_resumes_from_journal() -> None:
+    """Test a rerun reuses the journaled tracks and only runs the steps still missing."""
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = {
+        "selection": "lrp:2",
+        "uris": ["uri1", "uri2"],
+        "steps": ["select", "clear", "populate"],
+    }
+    sp_client = MagicMock()
+    sp_client.get_available_all_devices = AsyncMock(return_value=["device1"])
+    sp_client.delete_all_playlist_tracks = AsyncMock()
+    sp_client.populate_playlist_with_uris = AsyncMock()
+    sp_client.update_queue = AsyncMock()
+
+    await refresh(my_mongo, sp_client)
+
+    my_mongo.select_random_tracks.assert_not_called()
+    my_mongo.start_run_journal.assert_not_called()
+    sp_client.delete_all_playlist_tracks.assert_not_called()
+    sp_client.populate_playlist_with_uris.assert_not_called()
+    my_mongo.update_played_at.assert_awaited_once_with(["uri1", "uri2"])
+    sp_client.update_queue.assert_awaited_once_with(["uri1", "uri2"], ["device1"])
+    my_mongo.finish_run_journal.assert_awaited_once_with("p1")
+    my_mongo.mark_run_step.assert_any_await("p1", "queue")
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_does_not_queue_twice() -> None:
+    """Test a rerun whose journal records the queue step only closes the journal."""
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = {
+        "selection": "lrp:2",
+        "uris": ["uri1", "uri2"],
+        "steps": ["select", "clear", "populate", "played", "queue"],
+    }
+    sp_client = MagicMock()
+    sp_client.get_available_all_devices = AsyncMock(return_value=["device1"])
+    sp_client.update_queue = AsyncMock()
+
+    await refresh(my_mongo, sp_client)
+
+    sp_client.update_queue.assert_not_called()
+    my_mongo.update_played_at.assert_not_called()
+    my_mongo.mark_run_step.assert_not_called()
+    my_mongo.finish_run_journal.assert_awaited_once_with("p1")
@@ -0,0 +1,152 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from spotify.scheduler import Account, Scheduler
+from spotify.schema import UserConfig, UsersConfig
+
+EXPECTED_USERS = 2
+EXPECTED_REQUESTS = 4
+
+
+def _config() -> UsersConfig:
+    return UsersConfig.model_validate(
+        {
+            "users": [
+                {"user_id": "alice", "playlists": [{"name": "daily", "playlist_id": "p1"}]},
+                {"user_id": "bob", "playlists": [{"name": "daily", "playlist_id": "p2"}]},
+            ],
+            "max_concurrent_users": 1,
+        }
+    )
+
+
+def _account(user: UserConfig) -> Account:
+    my_mongo = AsyncMock()
+    my_mongo.load_run_journal.return_value = None
+    my_mongo.take_pending_plan.return_value = None
+    my_mongo.select_random_tracks.return_value = ["uri1"]
+    sp_client = MagicMock()
+    sp_client.delete_all_playlist_tracks = AsyncMock()
+    sp_client.populate_playlist_with_uris = AsyncMock()
+    sp_client.request_count = EXPECTED_REQUESTS
+    sp_client.rate_limited_count = 0
+    sp_client.tracks_synced = None
+    return Account(user, my_mongo, MagicMock(), sp_client)
+
+
+@pytest.mark.asyncio
+async def test_run_account_reports_phases() -> None:
+    """Test an account runs the refresh phases after its sync and reports their times."""
+    scheduler = Scheduler(_config(), precompute=True)
+    account = _account(scheduler.config.users[0])
+    with patch("spotify.scheduler.sync_library", new_callable=AsyncMock) as mock_sync:
+        report = await scheduler.run_account(account)
+
+    mock_sync.assert_awaited_once_with(account.db, account.client, False)
+    account.client.delete_all_playlist_tracks.assert_awaited_once_with("p1")
+    account.client.populate_playlist_with_uris.assert_awaited_once_with(["uri1"], "p1")
+    account.db.update_played_at.assert_awaited_once_with(["uri1"])
+    account.db.finish_run_journal.assert_awaited_once_with("p1")
+    account.db.save_pending_plan.assert_awaited_once()
+    account.client.__aexit__.assert_awaited_once()
+    assert report["user_id"] == "alice"
+    assert report["error"] is None
+    assert set(report["phases"]) == {
+        "sync",
+        "journals",
+        "clear",
+        "select",
+        "populate",
+        "queue",
+        "precompute",
+    }
+    assert report["total"] >= max(report["phases"].values())
+    (summary,) = account.db.save_run.await_args.args
+    assert summary["mode"] == "refresh"
+    assert summary["status"] == "ok"
+    assert summary["phases"].keys() == report["phases"].keys()
+    assert summary["requests"] == EXPECTED_REQUESTS
+
+
+@pytest.mark.asyncio
+async def test_run_isolates_failing_users() -> None:
+    """Test one account failing is reported without stopping the others."""
+    scheduler = Scheduler(_config())
+    accounts = [_account(user) for user in scheduler.config.users]
+
+    async def sync(my_mongo: AsyncMock, *_: object) -> None:
+        if my_mongo is accounts[0].db:
+            raise RuntimeError("token revoked")
+
+    with (
+        patch("spotify.scheduler.AsyncDB.create_client") as mock_create_client,
+        patch.object(scheduler, "open_accounts", AsyncMock(return_value=accounts)),
+        patch("spotify.scheduler.sync_library", side_effect=sync),
+    ):
+        mock_create_client.return_value.close = AsyncMock()
+        reports = await scheduler.run()
+
+    assert len(reports) == EXPECTED_USERS
+    assert reports[0]["error"] == "token revoked"
+    assert "sync" not in reports[0]["phases"]
+    # Every account records its own run, failed or not
+    failed_summary = accounts[0].db.save_run.await_args.args[0]
+    assert failed_summary["status"] == "error"
+    assert "token revoked" in failed_summary["error"]
+    assert accounts[1].db.save_run.await_args.args[0]["status"] == "ok"
+    accounts[0].client.populate_playlist_with_uris.assert_not_called()
+    assert reports[1]["error"] is None
+    accounts[1].client.populate_playlist_with_uris.assert_awaited_once_with(["uri1"], "p2")
+    mock_create_client.return_value.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_open_accounts_shares_pool_and_limiter(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test every account gets its own partition and token store on shared resources."""
+    monkeypatch.setenv("SPOTIFY_PLAYLIST_ID", "fake_playlist_id")
+    scheduler = Scheduler(_config())
+    shared_client = MagicMock()
+    with (
+        patch("spotify.scheduler.AsyncDB") as mock_db_cls,
+        patch("spotify.scheduler.Auth") as mock_auth_cls,
+        patch("spotify.scheduler.Client") as mock_client_cls,
+    ):
+        mock_db_cls.return_value.check_connection = AsyncMock(return_value=True)
+        mock_auth_cls.return_value.load_or_authenticate_tokens = AsyncMock()
+        accounts = await scheduler.open_accounts(shared_client)
+
+    assert len(accounts) == EXPECTED_USERS
+    assert [call.args for call in mock_db_cls.call_args_list] == [
+        ("alice", shared_client),
+        ("bob", shared_client),
+    ]
+    assert [call.args for call in mock_auth_cls.call_args_list] == [("alice",), ("bob",)]
+    for call in mock_client_cls.call_args_list:
+        assert call.kwargs["request_sem"] is scheduler.request_sem
+
+
+@pytest.mark.asyncio
+async def test_run_reports_accounts_that_fail_to_open() -> None:
+    """Test a failed token load is reported for that account while the others still run."""
+    scheduler = Scheduler(_config())
+    bob = _account(scheduler.config.users[1])
+
+    async def open_account(user: UserConfig, _mongo_client: object) -> Account:
+        if user.user_id == "alice":
+            raise PermissionError("refresh token revoked")
+        return bob
+
+    with (
+        patch("spotify.scheduler.AsyncDB.create_client") as mock_create_client,
+        patch.object(scheduler, "open_account", side_effect=open_account),
+        patch("spotify.scheduler.sync_library", new_callable=AsyncMock),
+    ):
+        mock_create_client.return_value.close = AsyncMock()
+        reports = await scheduler.run()
+
+    assert [report["user_id"] for report in reports] == ["alice", "bob"]
+    assert reports[0]["error"] == "refresh token revoked"
+    assert reports[0]["phases"] == {}
+    assert reports[1]["error"] is None
+    bob.client.populate_playlist_with_uris.assert_awaited_once_with(["uri1"], "p2")
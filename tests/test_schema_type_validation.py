@@ -1,7 +1,20 @@
 import pytest
 from pydantic import TypeAdapter, ValidationError
 
-from spotify.schema import Album, Artist, ItemV2, Owner, PlaylistResponse
+from spotify.schema import (
+    Album,
+    Artist,
+    ItemV2,
+    MongoSettings,
+    Owner,
+    PlaylistResponse,
+    PlaylistsConfig,
+    UsersConfig,
+)
+
+THREE_HOURS_MS = 3 * 60 * 60 * 1000
+DEFAULT_PLAYLIST_SIZE = 100
+DEFAULT_MAX_IDLE_TIME_MS = 50_000
 
 
 def test_artist_type_validation():
@@ -255,3 +268,70 @@ def test_polymorphic_item_v2_validation():
     # Validate audiobook
     audiobook_item = TypeAdapter(ItemV2).validate_python(audiobook_data)
     assert audiobook_item.type == "audiobook"
+
+
+def test_playlists_config_validation():
+    config = PlaylistsConfig.model_validate_json(
+        """{"playlists": [
+            {"name": "daily", "playlist_id": "p1", "queue": true},
+            {"name": "drive", "playlist_id": "p2", "selection": "diverse", "duration": "3h"}
+        ]}"""
+    )
+    assert config.playlists[0].size == DEFAULT_PLAYLIST_SIZE
+    assert config.playlists[0].selection == "lrp"
+    assert config.playlists[1].duration == THREE_HOURS_MS
+
+    # The same playlist twice fails
+    with pytest.raises(ValidationError, match="only be listed once"):
+        PlaylistsConfig.model_validate(
+            {"playlists": [{"name": "a", "playlist_id": "p1"}, {"name": "b", "playlist_id": "p1"}]}
+        )
+
+    # Only one playlist may feed the playback queue
+    with pytest.raises(ValidationError, match="At most one playlist"):
+        PlaylistsConfig.model_validate(
+            {
+                "playlists": [
+                    {"name": "a", "playlist_id": "p1", "queue": True},
+                    {"name": "b", "playlist_id": "p2", "queue": True},
+                ]
+            }
+        )
+
+    # Sizes follow the per-playlist limit
+    with pytest.raises(ValidationError):
+        PlaylistsConfig.model_validate(
+            {"playlists": [{"name": "a", "playlist_id": "p1", "size": 101}]}
+        )
+
+
+def test_users_config_validation():
+    user = {"user_id": "alice", "playlists": [{"name": "daily", "playlist_id": "p1"}]}
+    config = UsersConfig.model_validate({"users": [user]})
+    assert config.users[0].playlists[0].playlist_id == "p1"
+
+    # The same user twice fails
+    with pytest.raises(ValidationError, match="only be listed once"):
+        UsersConfig.model_validate({"users": [user, user]})
+
+    # user_id names collections and files, so it is restricted to safe characters
+    with pytest.raises(ValidationError):
+        UsersConfig.model_validate({"users": [{**user, "user_id": "../alice"}]})
+
+
+def test_mongo_settings_validation():
+    settings = MongoSettings.model_validate(
+        {"hosts": ["db1:27017", "db2:27017"], "compressors": ["zstd", "zlib"]}
+    )
+    assert settings.max_idle_time_ms == DEFAULT_MAX_IDLE_TIME_MS
+    assert settings.max_pool_size is None
+
+    with pytest.raises(ValidationError, match="may not exceed"):
+        MongoSettings.model_validate({"max_pool_size": 5, "min_pool_size": 10})
+
+    # Unacknowledged syncs could not tell whether anything changed
+    with pytest.raises(ValidationError, match="acknowledge"):
+        MongoSettings.model_validate({"sync_write_concern": 0})
+
+    with pytest.raises(ValidationError):
+        MongoSettings.model_validate({"compressors": ["lz4"]})
@@ -0,0 +1,95 @@
+import math
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from spotify.schema import SelectionWeights
+from spotify.selection import TrackSnapshot, WeightedSelector, score_tracks, weighted_sample
+
+NOW = 1_700_000_000.0
+DAY = 86_400.0
+EXPECTED_SNAPSHOT_SIZE = 3
+SAMPLE_SIZE = 2
+
+
+def _snapshot() -> TrackSnapshot:
+    return TrackSnapshot.from_documents(
+        [
+            {"uri": "never", "played_at": None, "popularity": 50, "artist_id": "a1"},
+            {"uri": "old", "played_at": (NOW - 90 * DAY) * 1000, "popularity": 10},
+            {"uri": "fresh", "played_at": NOW * 1000, "popularity": 90, "artist_id": "a1"},
+        ]
+    )
+
+
+def test_snapshot_from_documents() -> None:
+    """Test the snapshot columns are built from projected documents."""
+    snapshot = _snapshot()
+    assert len(snapshot) == EXPECTED_SNAPSHOT_SIZE
+    assert snapshot.uri_index == {"never": 0, "old": 1, "fresh": 2}
+    assert math.isinf(snapshot.played_at[0])
+    assert snapshot.played_at[2] == NOW
+    # Tracks without an artist share the "" code; a1 is reused
+    assert snapshot.artist_codes.tolist() == [0, 1, 0]
+    assert snapshot.artist_ids == ["a1", ""]
+
+
+def test_snapshot_mark_played() -> None:
+    """Test mark_played updates played_at in place and ignores unknown uris."""
+    snapshot = _snapshot()
+    snapshot.mark_played(["never", "unknown"], NOW)
+    assert snapshot.played_at[0] == NOW
+
+
+def test_score_tracks_ordering() -> None:
+    """Test never-played beats long-unplayed, which beats just-played."""
+    weights = SelectionWeights(popularity=0.0)
+    scores = score_tracks(_snapshot(), weights, NOW)
+    assert scores[0] > scores[1] > scores[2]
+    assert scores[2] == pytest.approx(1e-6)
+    assert scores[1] == pytest.approx(1 - 2 ** (-90 / weights.recency_half_life_days), rel=1e-4)
+
+
+def test_weighted_sample_is_reproducible() -> None:
+    """Test the same seed yields the same draw and results have no duplicates."""
+    scores = np.linspace(0.1, 1.0, 1000)
+    first = weighted_sample(scores, 50, np.random.default_rng(7))
+    second = weighted_sample(scores, 50, np.random.default_rng(7))
+    assert first.tolist() == second.tolist()
+    assert len(set(first.tolist())) == len(first)
+
+
+def test_weighted_sample_skips_zero_scores() -> None:
+    """Test zero-score rows are never drawn and the draw shrinks to what is eligible."""
+    scores = np.array([0.0, 1.0, 0.0, 2.0], dtype=np.float32)
+    rows = weighted_sample(scores, 3, np.random.default_rng(0))
+    assert sorted(rows.tolist()) == [1, 3]
+    assert weighted_sample(np.zeros(3), 2, np.random.default_rng(0)).size == 0
+
+
+def test_weighted_sample_takes_every_eligible_row() -> None:
+    """Test asking for every eligible row ends, even when the generator returns exactly 0."""
+    scores = np.array([1.0, 0.0, 1e-30, 2.0], dtype=np.float32)
+    rng = MagicMock(spec=np.random.Generator)
+    rng.random.return_value = np.zeros(scores.shape[0], dtype=np.float32)
+
+    rows = weighted_sample(scores, 3, rng)
+
+    assert sorted(rows.tolist()) == [0, 2, 3]
+    assert sorted(weighted_sample(scores, 3, np.random.default_rng(5)).tolist()) == [0, 2, 3]
+
+
+def test_weighted_sample_follows_weights() -> None:
+    """Test single draws land proportionally to the scores."""
+    scores = np.array([1.0, 3.0], dtype=np.float32)
+    rng = np.random.default_rng(3)
+    hits = sum(int(weighted_sample(scores, 1, rng)[0]) for _ in range(4000))
+    assert hits / 4000 == pytest.approx(0.75, abs=0.03)
+
+
+def test_weighted_selector_exclude() -> None:
+    """Test excluded uris are never selected."""
+    selector = WeightedSelector(_snapshot(), seed=1)
+    result = selector.select(SAMPLE_SIZE, now=NOW, exclude=["never"])
+    assert sorted(result) == ["fresh", "old"]
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import spotify
+
+
+def test_import_spotify_defers_heavy_dependencies() -> None:
+    """Test importing the package alone loads none of pydantic, pymongo, httpx or numpy."""
+    code = (
+        "import sys, spotify, spotify.options; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} "
+        "& {'numpy', 'pydantic', 'pymongo', 'httpx'}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_export_and_import_paths_skip_numpy() -> None:
+    """Test the modules main.run loads for --export, --import and --stats skip numpy."""
+    code = (
+        "import sys, spotify.client, spotify.export, spotify.memory, spotify.runner; "
+        "print('numpy' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_package_exports_resolve_on_first_access() -> None:
+    from spotify.async_db import AsyncDB  # noqa: PLC0415
+
+    assert spotify.AsyncDB is AsyncDB
+    assert set(spotify.__all__) <= set(dir(spotify))
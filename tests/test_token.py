@@ -68,6 +68,14 @@ def test_store_tokens_success() -> None:
         assert data["token_expires_at"] == MOCK_EXPIRES_AT
 
 
+def test_for_user_uses_own_token_file() -> None:
+    """Test each user gets a separate token file next to the default one."""
+    token = Token.for_user("alice", access_token="acc")
+    assert token.access_token == "acc"
+    assert token._file_path.name == "tokens-alice.json"
+    assert Token.for_user(None)._file_path.name == "tokens.json"
+
+
 def test_store_tokens_permission_error() -> None:
     """Test store_tokens handling write exceptions."""
     token = Token()
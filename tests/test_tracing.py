@@ -0,0 +1,79 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from spotify.client import Client
+from spotify.tracing import NO_SPAN, STATUS_ERROR, Tracer, load_spans, span, waterfall
+
+PLAYLIST_ID = "37i9dQZF1DXcBWIGoYBM5M"
+EXPECTED_ATTEMPTS = 2
+
+
+def attributes(record: dict[str, Any]) -> dict[str, object]:
+    return {item["key"]: next(iter(item["value"].values())) for item in record["attributes"]}
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks(tmp_path: Path) -> None:
+    """Test tasks started inside a span become its children, and failures are marked."""
+    path = tmp_path / "trace.json"
+
+    async def page(offset: int) -> None:
+        with span("page", page_offset=offset):
+            await asyncio.sleep(0)
+
+    with Tracer(path), span("sync") as sync:
+        await asyncio.gather(page(0), page(50))
+        sync.set(tracks=100)
+        with pytest.raises(ValueError, match="boom"), span("write"):
+            raise ValueError("boom")
+
+    spans = {record["name"]: record for record in load_spans(path)}
+    pages = [record for record in load_spans(path) if record["name"] == "page"]
+    assert {record["parentSpanId"] for record in pages} == {spans["sync"]["spanId"]}
+    assert sorted(attributes(record)["page_offset"] for record in pages) == ["0", "50"]
+    assert attributes(spans["sync"]) == {"tracks": "100"}
+    assert spans["write"]["status"]["code"] == STATUS_ERROR
+    assert json.loads(path.read_text())["resourceSpans"][0]["resource"]["attributes"]
+
+    lines = waterfall(load_spans(path))
+    assert lines[0].startswith("sync")
+    assert lines[1].startswith("  page")
+
+
+def test_span_is_a_no_op_without_tracer() -> None:
+    with span("sync", tracks=1) as current:
+        current.set(tracks=2)
+    assert current is NO_SPAN
+    assert not NO_SPAN.attributes
+
+
+@pytest.mark.asyncio
+async def test_request_span_records_template_and_retries(
+    client_instance: Client, tmp_path: Path
+) -> None:
+    path = tmp_path / "trace.json"
+    url = f"{client_instance.api_url}/playlists/{PLAYLIST_ID}/items?offset=100&limit=50"
+    mock_client = AsyncMock(spec=httpx.AsyncClient)
+    mock_client.get.side_effect = [
+        httpx.Response(429),
+        httpx.Response(200, json={"items": []}),
+    ]
+
+    with Tracer(path), patch("asyncio.sleep", new_callable=AsyncMock):
+        await client_instance._make_get_request(mock_client, url)
+
+    (request,) = [record for record in load_spans(path) if record["name"] == "spotify.GET"]
+    assert attributes(request) == {
+        "url_template": "/v1/playlists/{id}/items",
+        "page_offset": "100",
+        "page_limit": "50",
+        "status_code": "200",
+        "response_bytes": str(len(b'{"items":[]}')),
+        "retry_attempt": str(EXPECTED_ATTEMPTS),
+    }